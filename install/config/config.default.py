@@ -29,7 +29,19 @@ DATABASE_USER = "regovar"
 DATABASE_PWD = "regovar"
 DATABASE_NAME = "regovar"
 DATABASE_POOL_SIZE = 7
-VCF_IMPORT_MAX_THREAD = 7
+WT_BUILD_CONNECTIONS = 4 # number of database connections used at the same time to create the working table of an analysis
+VCF_IMPORT_MAX_THREAD = 7 # number of database writers of the vcf import pipeline (1 to import without pipeline)
+VCF_IMPORT_QUEUE_SIZE = 8 # max number of blocks/batches waiting between two stages of the vcf import pipeline
+VCF_IMPORT_MODE = "copy" # "copy" (bulk load with COPY FROM STDIN) or "insert" (sql INSERT queries)
+VCF_IMPORT_SHARD_WORKERS = 4 # number of process used to import bgzipped and indexed vcf by regions (0 to disable)
+VCF_IMPORT_SHARD_SIZE = 10000000 # size (in bp) of the regions imported by the shard workers
+VCF_IMPORT_BLOCK_SIZE = 500 # number of vcf records decoded at once by the numpy kernel
+VCF_IMPORT_GVCF_COVERAGE = True # import reference blocks of gVCF (<NON_REF> records) as coverage ranges of the samples instead of variants
+VCF_IMPORT_WORKERS = 2 # number of import worker processes started by import_worker.py (they run the imports queued by the server)
+VCF_IMPORT_REFERENCE_LIMIT = 1 # max number of imports running at the same time on the same reference
+VCF_IMPORT_POLL_DELAY = 10 # max delay (in seconds) between two checks of the import queue by idle workers
+VCF_IMPORT_BLOOM_ERROR = 0.01 # false positive rate of the filter of the variants already known by the reference, used to write them with a lighter path (0 to disable)
+VCF_IMPORT_BLOOM_MIN_RATIO = 0.001 # the filter of the known variants is not built for a vcf with less records than this ratio of the variants of the reference (updating a filter already loaded by the worker is always done)
 
 
 # FILESYSTEM
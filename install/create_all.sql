@@ -59,6 +59,240 @@ SELECT ARRAY(SELECT $1[i]
   WHERE $2[i])
 $$ LANGUAGE sql;
 
+-- Compressed bitmaps of integers (samples ids) stored as bytea (roaring like format described in regovar/core/framework/bitmap.py)
+-- Operations work by container on the bytes : the values of array containers are binary searched in place,
+-- values are added by inserting their 2 bytes in their container, and only the smallest operand is decoded.
+CREATE OR REPLACE FUNCTION bitmap_container(integer[])
+  RETURNS bytea
+  LANGUAGE sql IMMUTABLE STRICT
+AS $FUNCTION$
+    SELECT decode(string_agg(lpad(to_hex(COALESCE(b.bits, 0)), 2, '0'), '' ORDER BY i), 'hex')
+    FROM generate_series(0, 8191) AS i
+    LEFT JOIN (SELECT l >> 3 AS i, sum(DISTINCT 1 << (l & 7))::integer AS bits FROM unnest($1) AS l GROUP BY 1) AS b USING (i);
+$FUNCTION$;
+
+
+CREATE OR REPLACE FUNCTION bitmap_from_array(integer[])
+  RETURNS bytea
+  LANGUAGE sql IMMUTABLE
+AS $FUNCTION$
+    SELECT substring(int4send(count(*)::integer) from 3 for 2)
+        || COALESCE(string_agg(substring(int4send(c.key) from 3 for 2) || substring(int4send(cardinality(c.lows) - 1) from 3 for 2), ''::bytea ORDER BY c.key), ''::bytea)
+        || COALESCE(string_agg(CASE WHEN cardinality(c.lows) <= 4096 THEN (SELECT string_agg(substring(int4send(l) from 3 for 2), ''::bytea ORDER BY l) FROM unnest(c.lows) AS l) ELSE bitmap_container(c.lows) END, ''::bytea ORDER BY c.key), ''::bytea)
+    FROM (SELECT v >> 16 AS key, array_agg(DISTINCT (v & 65535) ORDER BY (v & 65535)) AS lows FROM unnest($1) AS v WHERE v >= 0 GROUP BY 1) AS c;
+$FUNCTION$;
+
+
+-- Return the sorted array of the values of a bitmap
+CREATE OR REPLACE FUNCTION bitmap_to_array(bytea)
+  RETURNS integer[]
+  LANGUAGE plpgsql IMMUTABLE STRICT
+AS $FUNCTION$
+  DECLARE
+    result integer[] := '{}';
+    n integer := get_byte($1, 0) * 256 + get_byte($1, 1);
+    offs integer := 2 + 4 * n;
+    k integer;
+    card integer;
+  BEGIN
+    FOR i IN 0..n-1 LOOP
+      k := get_byte($1, 2 + 4 * i) * 256 + get_byte($1, 3 + 4 * i);
+      card := get_byte($1, 4 + 4 * i) * 256 + get_byte($1, 5 + 4 * i) + 1;
+      IF card <= 4096 THEN
+        result := result || ARRAY(SELECT (k << 16) | (get_byte($1, offs + 2 * j) * 256 + get_byte($1, offs + 2 * j + 1)) FROM generate_series(0, card - 1) AS j ORDER BY j);
+        offs := offs + 2 * card;
+      ELSE
+        -- only the non empty bytes of the container are read bit by bit
+        result := result || ARRAY(SELECT (k << 16) | (b.p * 8 + j) FROM (SELECT p, get_byte($1, offs + p) AS x FROM generate_series(0, 8191) AS p) AS b, generate_series(0, 7) AS j WHERE b.x <> 0 AND b.x & (1 << j) <> 0 ORDER BY 1);
+        offs := offs + 8192;
+      END IF;
+    END LOOP;
+    RETURN result;
+  END;
+$FUNCTION$;
+
+
+-- Return the number of values of a bitmap (only headers of the containers are read)
+CREATE OR REPLACE FUNCTION bitmap_count(bytea)
+  RETURNS integer
+  LANGUAGE sql IMMUTABLE STRICT
+AS $FUNCTION$
+    SELECT COALESCE(sum(get_byte($1, 4 + 4 * i) * 256 + get_byte($1, 5 + 4 * i) + 1), 0)::integer
+    FROM generate_series(0, get_byte($1, 0) * 256 + get_byte($1, 1) - 1) AS i;
+$FUNCTION$;
+
+
+-- Return true if the value is in the bitmap
+CREATE OR REPLACE FUNCTION bitmap_contains(bytea, integer)
+  RETURNS boolean
+  LANGUAGE plpgsql IMMUTABLE STRICT
+AS $FUNCTION$
+  DECLARE
+    n integer := get_byte($1, 0) * 256 + get_byte($1, 1);
+    offs integer := 2 + 4 * n;
+    low integer := $2 & 65535;
+    k integer;
+    card integer;
+    lo integer;
+    hi integer;
+    mid integer;
+    v integer;
+  BEGIN
+    FOR i IN 0..n-1 LOOP
+      k := get_byte($1, 2 + 4 * i) * 256 + get_byte($1, 3 + 4 * i);
+      card := get_byte($1, 4 + 4 * i) * 256 + get_byte($1, 5 + 4 * i) + 1;
+      IF k = $2 >> 16 THEN
+        IF card > 4096 THEN
+          RETURN get_bit($1, offs * 8 + low) = 1;
+        END IF;
+        lo := 0;
+        hi := card - 1;
+        WHILE lo <= hi LOOP
+          mid := (lo + hi) / 2;
+          v := get_byte($1, offs + 2 * mid) * 256 + get_byte($1, offs + 2 * mid + 1);
+          IF v = low THEN
+            RETURN True;
+          ELSIF v < low THEN
+            lo := mid + 1;
+          ELSE
+            hi := mid - 1;
+          END IF;
+        END LOOP;
+        RETURN False;
+      END IF;
+      offs := offs + CASE WHEN card <= 4096 THEN 2 * card ELSE 8192 END;
+    END LOOP;
+    RETURN False;
+  END;
+$FUNCTION$;
+
+
+-- Return the bitmap with the value added : the value is inserted in its container (other containers are not read)
+CREATE OR REPLACE FUNCTION bitmap_add(bytea, integer)
+  RETURNS bytea
+  LANGUAGE plpgsql IMMUTABLE STRICT
+AS $FUNCTION$
+  DECLARE
+    bm bytea := $1;
+    n integer := get_byte($1, 0) * 256 + get_byte($1, 1);
+    offs integer := 2 + 4 * n;
+    k integer := $2 >> 16;
+    low integer := $2 & 65535;
+    idx integer := n;
+    ck integer;
+    card integer;
+    lo integer;
+    hi integer;
+    mid integer;
+    v integer;
+  BEGIN
+    FOR i IN 0..n-1 LOOP
+      ck := get_byte(bm, 2 + 4 * i) * 256 + get_byte(bm, 3 + 4 * i);
+      IF ck > k THEN
+        idx := i;
+        EXIT;
+      END IF;
+      card := get_byte(bm, 4 + 4 * i) * 256 + get_byte(bm, 5 + 4 * i) + 1;
+      IF ck = k THEN
+        IF card > 4096 THEN
+          IF get_bit(bm, offs * 8 + low) = 1 THEN
+            RETURN bm;
+          END IF;
+          bm := set_bit(bm, offs * 8 + low, 1);
+        ELSE
+          lo := 0;
+          hi := card - 1;
+          WHILE lo <= hi LOOP
+            mid := (lo + hi) / 2;
+            v := get_byte(bm, offs + 2 * mid) * 256 + get_byte(bm, offs + 2 * mid + 1);
+            IF v = low THEN
+              RETURN bm;
+            ELSIF v < low THEN
+              lo := mid + 1;
+            ELSE
+              hi := mid - 1;
+            END IF;
+          END LOOP;
+          IF card < 4096 THEN
+            bm := overlay(bm placing substring(int4send(low) from 3 for 2) from offs + 2 * lo + 1 for 0);
+          ELSE
+            -- full array container : replaced by a bitmap container
+            bm := overlay(bm placing bitmap_container(ARRAY(SELECT get_byte(bm, offs + 2 * j) * 256 + get_byte(bm, offs + 2 * j + 1) FROM generate_series(0, card - 1) AS j) || low) from offs + 1 for 2 * card);
+          END IF;
+        END IF;
+        RETURN overlay(bm placing substring(int4send(card) from 3 for 2) from 5 + 4 * i for 2);
+      END IF;
+      offs := offs + CASE WHEN card <= 4096 THEN 2 * card ELSE 8192 END;
+    END LOOP;
+    -- new container (array of one value) at the position idx
+    bm := overlay(bm placing substring(int4send(low) from 3 for 2) from offs + 1 for 0);
+    bm := overlay(bm placing substring(int4send(k) from 3 for 2) || '\x0000'::bytea from 3 + 4 * idx for 0);
+    RETURN overlay(bm placing substring(int4send(n + 1) from 3 for 2) from 1 for 2);
+  END;
+$FUNCTION$;
+
+
+-- Return the values of the array that are in the bitmap (sorted)
+CREATE OR REPLACE FUNCTION bitmap_filter(bytea, integer[])
+  RETURNS integer[]
+  LANGUAGE sql IMMUTABLE STRICT
+AS $FUNCTION$
+    SELECT ARRAY(SELECT DISTINCT v FROM unnest($2) AS v WHERE bitmap_contains($1, v) ORDER BY v);
+$FUNCTION$;
+
+
+-- Return the intersection of two bitmaps : values of the smallest one are searched in the other one
+CREATE OR REPLACE FUNCTION bitmap_and(bytea, bytea)
+  RETURNS bytea
+  LANGUAGE sql IMMUTABLE STRICT
+AS $FUNCTION$
+    SELECT bitmap_from_array(CASE WHEN bitmap_count($1) <= bitmap_count($2) THEN bitmap_filter($2, bitmap_to_array($1)) ELSE bitmap_filter($1, bitmap_to_array($2)) END);
+$FUNCTION$;
+
+
+-- Return the number of values in both bitmaps
+CREATE OR REPLACE FUNCTION bitmap_and_count(bytea, bytea)
+  RETURNS integer
+  LANGUAGE sql IMMUTABLE STRICT
+AS $FUNCTION$
+    SELECT cardinality(CASE WHEN bitmap_count($1) <= bitmap_count($2) THEN bitmap_filter($2, bitmap_to_array($1)) ELSE bitmap_filter($1, bitmap_to_array($2)) END);
+$FUNCTION$;
+
+
+-- Return the union of two bitmaps (NULL is the empty bitmap). The values of the smallest one are added to the other one;
+-- bitmaps of close sizes are merged at once
+CREATE OR REPLACE FUNCTION bitmap_or(bytea, bytea)
+  RETURNS bytea
+  LANGUAGE plpgsql IMMUTABLE
+AS $FUNCTION$
+  DECLARE
+    big bytea := $1;
+    small bytea := $2;
+    v integer;
+  BEGIN
+    IF $1 IS NULL OR $1 = $2 THEN
+      RETURN $2;
+    ELSIF $2 IS NULL THEN
+      RETURN $1;
+    END IF;
+    IF bitmap_count($1) < bitmap_count($2) THEN
+      big := $2;
+      small := $1;
+    END IF;
+    IF bitmap_count(small) > 64 AND bitmap_count(small) * 8 > bitmap_count(big) THEN
+      RETURN bitmap_from_array(bitmap_to_array(big) || bitmap_to_array(small));
+    END IF;
+    FOREACH v IN ARRAY bitmap_to_array(small) LOOP
+      big := bitmap_add(big, v);
+    END LOOP;
+    RETURN big;
+  END;
+$FUNCTION$;
+
+
+-- Union of the bitmaps of a group of rows
+CREATE AGGREGATE bitmap_union(bytea) (SFUNC = bitmap_or, STYPE = bytea);
+
 
 
 
@@ -78,6 +312,7 @@ CREATE TYPE job_status AS ENUM ('waiting', 'initializing', 'running', 'pause', '
 CREATE TYPE field_type AS ENUM ('int', 'string', 'float', 'enum', 'range', 'bool', 'sequence', 'list', 'sample_array');
 CREATE TYPE annotation_db_type AS ENUM ('site', 'variant', 'transcript');
 CREATE TYPE sample_status AS ENUM ('empty', 'loading', 'ready', 'error');
+CREATE TYPE import_status AS ENUM ('waiting', 'running', 'done', 'error');
 CREATE TYPE analysis_status AS ENUM ('empty', 'waiting', 'computing', 'ready', 'close', 'error');
 CREATE TYPE event_type AS ENUM ('custom', 'info', 'warning', 'error', 'technical');
 CREATE TYPE sex_type AS ENUM ('male', 'female', 'unknow');
@@ -421,6 +656,54 @@ CREATE TABLE event
 
 
 
+CREATE TABLE import_checkpoint
+(
+    file_id integer NOT NULL,
+    reference_id integer NOT NULL,
+    shard character varying(255) COLLATE pg_catalog."C" NOT NULL DEFAULT '',
+    samples JSON,
+    records integer DEFAULT 0,
+    vcf_line integer,
+    "offset" bigint,
+    done boolean DEFAULT False,
+    update_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT import_checkpoint_pkey PRIMARY KEY (file_id, reference_id, shard)
+);
+
+
+-- Imports requested by the server, run by the import workers (see import_worker.py)
+CREATE TABLE import_queue
+(
+    id serial NOT NULL,
+    file_id integer NOT NULL,
+    reference_id integer NOT NULL,
+    import_mode character varying(50) COLLATE pg_catalog."C",
+    priority integer DEFAULT 0,
+    status import_status DEFAULT 'waiting',
+    worker character varying(255) COLLATE pg_catalog."C",
+    error text,
+    create_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    update_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT import_queue_pkey PRIMARY KEY (id)
+);
+CREATE INDEX import_queue_idx_status
+  ON import_queue
+  USING btree
+  (status, priority, id);
+
+
+-- Quality metrics counters of the samples being imported (see vcf_import_stats.py)
+CREATE TABLE import_sample_stats
+(
+    sample_id integer NOT NULL,
+    key character varying(50) COLLATE pg_catalog."C" NOT NULL,
+    value bigint DEFAULT 0,
+    CONSTRAINT import_sample_stats_pkey PRIMARY KEY (sample_id, key)
+);
+
+
+
+
 
 
 CREATE TABLE subject_file
@@ -678,7 +961,11 @@ INSERT INTO public.annotation_field(database_uid, ord, name, name_ui, type, desc
   ('2c0a7043a9e736eaf14b6614fff102c0', 11, 'sample_tcount',    'samples total count',            'int',          'Number of samples in the whole database that have the variant.', NULL),
   ('2c0a7043a9e736eaf14b6614fff102c0', 12, 'sample_alist',     'samples analysis',               'string',       'List of samples in the analysis that have the variant.', NULL),
   ('2c0a7043a9e736eaf14b6614fff102c0', 13, 'sample_acount',    'samples analysis count',         'int',          'Number of samples in the analysis that have the variant.', NULL),
-  ('2c0a7043a9e736eaf14b6614fff102c0', 14, 's{}_is_composite', 'is composite',                   'sample_array', 'Composite variants are variants that are at least two in the same gene, whichever the parental inheritance.', '{"type": "bool"}');
+  ('2c0a7043a9e736eaf14b6614fff102c0', 14, 's{}_is_composite', 'is composite',                   'sample_array', 'Composite variants are variants that are at least two in the same gene, whichever the parental inheritance.', '{"type": "bool"}'),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 15, 'internal_het',     'internal het count',             'int',          'Number of samples in the whole database that are heterozygous for the variant.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 16, 'internal_hom',     'internal hom count',             'int',          'Number of samples in the whole database that are homozygous for the variant.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 17, 'internal_called',  'internal called count',          'int',          'Number of samples in the whole database imported from a vcf that contains the variant position.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 18, 'internal_af',      'internal frequency',             'float',        'Allele frequency of the variant in the samples of the whole database (het + 2*hom) / (2*called).', NULL);
 
 UPDATE annotation_field SET uid=MD5(concat(database_uid, name));
 
@@ -702,7 +989,7 @@ INSERT INTO "event" (message, type) VALUES
   
 INSERT INTO "parameter" (key, description, value) VALUES
     ('message',             'Custom message to display on welcome screen on each client', '{"type":"info", "message": ""}'),
-    ('database_version',    'The current version of the database',          '9.1'),
+    ('database_version',    'The current version of the database',          '9.9'),
     ('backup_date',         'The date of the last database dump',           to_char(current_timestamp, 'YYYY-MM-DD')),
     ('stats_refresh_date',  'The date of the last refresh of statistics',   to_char(current_timestamp, 'YYYY-MM-DD'));
   
@@ -4,21 +4,32 @@
 -- Regovar Database tables
 --
 INSERT INTO reference(id, name, description, url, table_suffix) VALUES (3, 'Hg38', 'Human Genom version 38', 'http://hgdownload.soe.ucsc.edu/goldenPath/hg38/database/', 'hg38');
+-- Variants are partitioned by chromosome (one partition by chromosome, unknown ones go to the default partition)
 CREATE TABLE variant_hg38
 (
     id bigserial NOT NULL,
     bin integer,
-    chr integer,
+    chr integer NOT NULL,
     pos bigint NOT NULL,
     ref text NOT NULL,
     alt text NOT NULL,
     is_transition boolean,
-    sample_list integer[],
+    sample_bitmap bytea,
     regovar_score smallint,
     regovar_score_meta JSON,
-    CONSTRAINT variant_hg38_pkey PRIMARY KEY (id),
+    CONSTRAINT variant_hg38_pkey PRIMARY KEY (id, chr),
     CONSTRAINT variant_hg38_ukey UNIQUE (chr, pos, ref, alt)
-);
+) PARTITION BY LIST (chr);
+DO $$
+BEGIN
+  FOR i IN 1..25 LOOP
+    EXECUTE format('CREATE TABLE variant_hg38_chr%s PARTITION OF variant_hg38 FOR VALUES IN (%s)', i, i);
+  END LOOP;
+END
+$$;
+CREATE TABLE variant_hg38_default PARTITION OF variant_hg38 DEFAULT;
+-- Samples data are partitioned by sample (partitions are created by the import of the sample
+-- and dropped with the sample, see core/model/sample.py)
 CREATE TABLE sample_variant_hg38
 (
     sample_id integer NOT NULL,
@@ -33,25 +44,37 @@ CREATE TABLE sample_variant_hg38
     depth integer,
     depth_alt integer,
     quality real,
-    filter JSON,
+    filter_mask integer,
     infos character varying(255)[][] COLLATE pg_catalog."C",
     mosaic real,
     is_composite boolean DEFAULT False,
     CONSTRAINT sample_variant_hg38_pkey PRIMARY KEY (sample_id, chr, pos, ref, alt),
     CONSTRAINT sample_variant_hg38_ukey UNIQUE (sample_id, variant_id)
-);
+) PARTITION BY LIST (sample_id);
+CREATE TABLE sample_variant_hg38_default PARTITION OF sample_variant_hg38 DEFAULT;
 CREATE INDEX sample_variant_hg38_idx_id
   ON sample_variant_hg38
   USING btree
   (variant_id);
-CREATE INDEX sample_variant_hg38_idx_samplevar
-  ON sample_variant_hg38
-  USING btree
-  (sample_id);
 CREATE INDEX sample_variant_hg38_idx_site
   ON sample_variant_hg38
   USING btree
   (sample_id, bin, chr, pos);
+-- Reference blocks of gVCF : positions covered as reference (0-based [start, end) range) by sample
+CREATE TABLE sample_coverage_hg38
+(
+    sample_id integer NOT NULL,
+    chr integer NOT NULL,
+    range int8range NOT NULL,
+    depth integer,
+    quality real,
+    CONSTRAINT sample_coverage_hg38_pkey PRIMARY KEY (sample_id, chr, range)
+) PARTITION BY LIST (sample_id);
+CREATE TABLE sample_coverage_hg38_default PARTITION OF sample_coverage_hg38 DEFAULT;
+CREATE INDEX sample_coverage_hg38_idx_range
+  ON sample_coverage_hg38
+  USING gist
+  (range);
 CREATE INDEX variant_hg38_idx_id
   ON variant_hg38
   USING btree
@@ -60,6 +83,16 @@ CREATE INDEX variant_hg38_idx_site
   ON variant_hg38
   USING btree
   (bin, chr, pos);
+-- Occurrences of the variants in the samples of the database (updated by the imports, see vcf_import_writer)
+CREATE TABLE variant_count_hg38
+(
+    variant_id bigint NOT NULL,
+    chr integer,
+    het_count integer NOT NULL DEFAULT 0,
+    hom_count integer NOT NULL DEFAULT 0,
+    called_count integer NOT NULL DEFAULT 0,
+    CONSTRAINT variant_count_hg38_pkey PRIMARY KEY (variant_id)
+);
 
 
 
@@ -0,0 +1,21 @@
+
+
+-- Checkpoints of vcf imports (to resume an interrupted import)
+CREATE TABLE import_checkpoint
+(
+    file_id integer NOT NULL,
+    reference_id integer NOT NULL,
+    shard character varying(255) COLLATE pg_catalog."C" NOT NULL DEFAULT '',
+    samples JSON,
+    records integer DEFAULT 0,
+    vcf_line integer,
+    "offset" bigint,
+    done boolean DEFAULT False,
+    update_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT import_checkpoint_pkey PRIMARY KEY (file_id, reference_id, shard)
+);
+
+
+-- Update database version
+UPDATE parameter SET value='9.2' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.2', 'technical');
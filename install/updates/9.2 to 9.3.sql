@@ -0,0 +1,33 @@
+-- Reference blocks of gVCF imported as coverage ranges by sample (instead of sample_variant rows)
+CREATE TABLE IF NOT EXISTS sample_coverage_hg19
+(
+    sample_id integer NOT NULL,
+    chr integer NOT NULL,
+    range int8range NOT NULL,
+    depth integer,
+    quality real,
+    CONSTRAINT sample_coverage_hg19_pkey PRIMARY KEY (sample_id, chr, range)
+);
+CREATE INDEX IF NOT EXISTS sample_coverage_hg19_idx_range
+  ON sample_coverage_hg19
+  USING gist
+  (range);
+
+CREATE TABLE IF NOT EXISTS sample_coverage_hg38
+(
+    sample_id integer NOT NULL,
+    chr integer NOT NULL,
+    range int8range NOT NULL,
+    depth integer,
+    quality real,
+    CONSTRAINT sample_coverage_hg38_pkey PRIMARY KEY (sample_id, chr, range)
+);
+CREATE INDEX IF NOT EXISTS sample_coverage_hg38_idx_range
+  ON sample_coverage_hg38
+  USING gist
+  (range);
+
+
+-- Update database version
+UPDATE parameter SET value='9.3' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.3', 'technical');
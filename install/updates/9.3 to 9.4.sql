@@ -0,0 +1,101 @@
+-- Partitioning of the variants tables (PostgreSQL 11 minimum) :
+--  - variant_<ref> by chromosome (one partition by chromosome + default partition)
+--  - sample_variant_<ref> and sample_coverage_<ref> by sample (one partition by sample + default partition)
+-- Existing tables are renamed, their data are moved in the partitioned tables, then they are dropped.
+-- Ids of the variants are kept (same sequence).
+DO $$
+DECLARE
+    ref text;
+    tbl text;
+    idx text;
+    sid integer;
+BEGIN
+    FOREACH ref IN ARRAY ARRAY['hg19', 'hg38'] LOOP
+        -- rename the existing tables and their indexes
+        FOREACH tbl IN ARRAY ARRAY['variant_', 'sample_variant_', 'sample_coverage_'] LOOP
+            FOR idx IN SELECT indexname FROM pg_indexes WHERE tablename = tbl || ref LOOP
+                EXECUTE format('ALTER INDEX %I RENAME TO %I', idx, idx || '_old');
+            END LOOP;
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl || ref, tbl || ref || '_old');
+        END LOOP;
+
+        -- variants
+        EXECUTE format('CREATE TABLE variant_%1$s
+            (
+                id bigint NOT NULL DEFAULT nextval(''variant_%1$s_id_seq''),
+                bin integer,
+                chr integer NOT NULL,
+                pos bigint NOT NULL,
+                ref text NOT NULL,
+                alt text NOT NULL,
+                is_transition boolean,
+                sample_list integer[],
+                regovar_score smallint,
+                regovar_score_meta JSON,
+                CONSTRAINT variant_%1$s_pkey PRIMARY KEY (id, chr),
+                CONSTRAINT variant_%1$s_ukey UNIQUE (chr, pos, ref, alt)
+            ) PARTITION BY LIST (chr)', ref);
+        FOR i IN 1..25 LOOP
+            EXECUTE format('CREATE TABLE variant_%1$s_chr%2$s PARTITION OF variant_%1$s FOR VALUES IN (%2$s)', ref, i);
+        END LOOP;
+        EXECUTE format('CREATE TABLE variant_%1$s_default PARTITION OF variant_%1$s DEFAULT', ref);
+        EXECUTE format('ALTER SEQUENCE variant_%1$s_id_seq OWNED BY variant_%1$s.id', ref);
+        EXECUTE format('INSERT INTO variant_%1$s SELECT id, bin, chr, pos, ref, alt, is_transition, sample_list, regovar_score, regovar_score_meta FROM variant_%1$s_old WHERE chr IS NOT NULL', ref);
+        EXECUTE format('CREATE INDEX variant_%1$s_idx_id ON variant_%1$s USING btree (id)', ref);
+        EXECUTE format('CREATE INDEX variant_%1$s_idx_site ON variant_%1$s USING btree (bin, chr, pos)', ref);
+
+        -- samples data
+        EXECUTE format('CREATE TABLE sample_variant_%1$s
+            (
+                sample_id integer NOT NULL,
+                bin integer,
+                chr integer,
+                pos bigint NOT NULL,
+                ref text NOT NULL,
+                alt text NOT NULL,
+                variant_id bigint,
+                vcf_line bigint,
+                genotype integer,
+                depth integer,
+                depth_alt integer,
+                quality real,
+                filter JSON,
+                infos character varying(255)[][] COLLATE pg_catalog."C",
+                mosaic real,
+                is_composite boolean DEFAULT False,
+                CONSTRAINT sample_variant_%1$s_pkey PRIMARY KEY (sample_id, chr, pos, ref, alt),
+                CONSTRAINT sample_variant_%1$s_ukey UNIQUE (sample_id, variant_id)
+            ) PARTITION BY LIST (sample_id)', ref);
+        EXECUTE format('CREATE TABLE sample_coverage_%1$s
+            (
+                sample_id integer NOT NULL,
+                chr integer NOT NULL,
+                range int8range NOT NULL,
+                depth integer,
+                quality real,
+                CONSTRAINT sample_coverage_%1$s_pkey PRIMARY KEY (sample_id, chr, range)
+            ) PARTITION BY LIST (sample_id)', ref);
+        FOR sid IN SELECT s.id FROM sample s INNER JOIN reference r ON s.reference_id=r.id WHERE r.table_suffix=ref LOOP
+            EXECUTE format('CREATE TABLE sample_variant_%1$s_%2$s PARTITION OF sample_variant_%1$s FOR VALUES IN (%2$s)', ref, sid);
+            EXECUTE format('CREATE TABLE sample_coverage_%1$s_%2$s PARTITION OF sample_coverage_%1$s FOR VALUES IN (%2$s)', ref, sid);
+        END LOOP;
+        EXECUTE format('CREATE TABLE sample_variant_%1$s_default PARTITION OF sample_variant_%1$s DEFAULT', ref);
+        EXECUTE format('CREATE TABLE sample_coverage_%1$s_default PARTITION OF sample_coverage_%1$s DEFAULT', ref);
+        EXECUTE format('INSERT INTO sample_variant_%1$s SELECT sample_id, bin, chr, pos, ref, alt, variant_id, vcf_line, genotype, depth, depth_alt, quality, filter, infos, mosaic, is_composite FROM sample_variant_%1$s_old', ref);
+        EXECUTE format('INSERT INTO sample_coverage_%1$s SELECT sample_id, chr, range, depth, quality FROM sample_coverage_%1$s_old', ref);
+        EXECUTE format('CREATE INDEX sample_variant_%1$s_idx_id ON sample_variant_%1$s USING btree (variant_id)', ref);
+        EXECUTE format('CREATE INDEX sample_variant_%1$s_idx_site ON sample_variant_%1$s USING btree (sample_id, bin, chr, pos)', ref);
+        EXECUTE format('CREATE INDEX sample_coverage_%1$s_idx_range ON sample_coverage_%1$s USING gist (range)', ref);
+
+        -- drop the old tables
+        FOREACH tbl IN ARRAY ARRAY['variant_', 'sample_variant_', 'sample_coverage_'] LOOP
+            EXECUTE format('DROP TABLE %I', tbl || ref || '_old');
+        END LOOP;
+    END LOOP;
+END
+$$;
+
+
+-- Update database version
+UPDATE parameter SET value='9.4' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.4', 'technical');
@@ -0,0 +1,45 @@
+-- Occurrences of the variants in the samples of the database, maintained by the imports (instead of array_length(sample_list))
+-- A sample is called on a vcf record when it has one of the alleles of the record (no-calls have NULL genotypes)
+CREATE TABLE IF NOT EXISTS variant_count_hg19
+(
+    variant_id bigint NOT NULL,
+    chr integer,
+    het_count integer NOT NULL DEFAULT 0,
+    hom_count integer NOT NULL DEFAULT 0,
+    called_count integer NOT NULL DEFAULT 0,
+    CONSTRAINT variant_count_hg19_pkey PRIMARY KEY (variant_id)
+);
+INSERT INTO variant_count_hg19 (variant_id, chr, het_count, hom_count, called_count)
+    SELECT variant_id, chr, count(*) FILTER (WHERE genotype IN (2, 3)), count(*) FILTER (WHERE genotype=1), count(*) FILTER (WHERE called)
+    FROM (SELECT variant_id, chr, genotype, bool_or(genotype IS NOT NULL) OVER (PARTITION BY sample_id, vcf_line) AS called FROM sample_variant_hg19 WHERE variant_id IS NOT NULL) sv
+    GROUP BY variant_id, chr
+    ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS variant_count_hg38
+(
+    variant_id bigint NOT NULL,
+    chr integer,
+    het_count integer NOT NULL DEFAULT 0,
+    hom_count integer NOT NULL DEFAULT 0,
+    called_count integer NOT NULL DEFAULT 0,
+    CONSTRAINT variant_count_hg38_pkey PRIMARY KEY (variant_id)
+);
+INSERT INTO variant_count_hg38 (variant_id, chr, het_count, hom_count, called_count)
+    SELECT variant_id, chr, count(*) FILTER (WHERE genotype IN (2, 3)), count(*) FILTER (WHERE genotype=1), count(*) FILTER (WHERE called)
+    FROM (SELECT variant_id, chr, genotype, bool_or(genotype IS NOT NULL) OVER (PARTITION BY sample_id, vcf_line) AS called FROM sample_variant_hg38 WHERE variant_id IS NOT NULL) sv
+    GROUP BY variant_id, chr
+    ON CONFLICT DO NOTHING;
+
+
+-- Internal frequency fields of the working tables
+INSERT INTO annotation_field(database_uid, ord, name, name_ui, type, description, meta) VALUES
+  ('2c0a7043a9e736eaf14b6614fff102c0', 15, 'internal_het',     'internal het count',             'int',          'Number of samples in the whole database that are heterozygous for the variant.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 16, 'internal_hom',     'internal hom count',             'int',          'Number of samples in the whole database that are homozygous for the variant.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 17, 'internal_called',  'internal called count',          'int',          'Number of samples in the whole database imported from a vcf that contains the variant position.', NULL),
+  ('2c0a7043a9e736eaf14b6614fff102c0', 18, 'internal_af',      'internal frequency',             'float',        'Allele frequency of the variant in the samples of the whole database (het + 2*hom) / (2*called).', NULL);
+UPDATE annotation_field SET uid=MD5(concat(database_uid, name)) WHERE uid IS NULL;
+
+
+-- Update database version
+UPDATE parameter SET value='9.5' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.5', 'technical');
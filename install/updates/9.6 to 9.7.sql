@@ -0,0 +1,22 @@
+-- FILTER of sample_variant stored as a bitmask : bit i is the i-th filter of the sample (keys of sample.filter_description
+-- sorted by name, see Sample.filter_codes)
+ALTER TABLE sample_variant_hg19 ADD COLUMN filter_mask integer;
+UPDATE sample_variant_hg19 sv SET filter_mask=(
+    SELECT COALESCE(sum(1 << (c.idx - 1)::integer), 0)::integer 
+    FROM sample s, LATERAL (SELECT k, row_number() OVER (ORDER BY k COLLATE "C") AS idx FROM json_object_keys(s.filter_description) AS k) AS c
+    WHERE s.id=sv.sample_id AND c.idx <= 31 AND sv.filter::jsonb ? c.k)
+WHERE sv.filter IS NOT NULL;
+ALTER TABLE sample_variant_hg19 DROP COLUMN filter;
+
+ALTER TABLE sample_variant_hg38 ADD COLUMN filter_mask integer;
+UPDATE sample_variant_hg38 sv SET filter_mask=(
+    SELECT COALESCE(sum(1 << (c.idx - 1)::integer), 0)::integer 
+    FROM sample s, LATERAL (SELECT k, row_number() OVER (ORDER BY k COLLATE "C") AS idx FROM json_object_keys(s.filter_description) AS k) AS c
+    WHERE s.id=sv.sample_id AND c.idx <= 31 AND sv.filter::jsonb ? c.k)
+WHERE sv.filter IS NOT NULL;
+ALTER TABLE sample_variant_hg38 DROP COLUMN filter;
+
+
+-- Update database version
+UPDATE parameter SET value='9.7' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.7', 'technical');
@@ -0,0 +1,30 @@
+-- Persistent queue of the vcf imports, run by the import workers (see import_worker.py)
+CREATE TYPE import_status AS ENUM ('waiting', 'running', 'done', 'error');
+
+CREATE TABLE import_queue
+(
+    id serial NOT NULL,
+    file_id integer NOT NULL,
+    reference_id integer NOT NULL,
+    import_mode character varying(50) COLLATE pg_catalog."C",
+    priority integer DEFAULT 0,
+    status import_status DEFAULT 'waiting',
+    worker character varying(255) COLLATE pg_catalog."C",
+    error text,
+    create_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    update_date timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT import_queue_pkey PRIMARY KEY (id)
+);
+CREATE INDEX import_queue_idx_status
+  ON import_queue
+  USING btree
+  (status, priority, id);
+
+-- Interrupted imports (that still have checkpoints) are queued again to be resumed by the workers
+INSERT INTO import_queue (file_id, reference_id)
+    SELECT DISTINCT file_id, reference_id FROM import_checkpoint;
+
+
+-- Update database version
+UPDATE parameter SET value='9.8' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.8', 'technical');
@@ -0,0 +1,15 @@
+
+
+-- Quality metrics of the samples computed during the import : counters of the samples being imported (see vcf_import_stats.py)
+CREATE TABLE import_sample_stats
+(
+    sample_id integer NOT NULL,
+    key character varying(50) COLLATE pg_catalog."C" NOT NULL,
+    value bigint DEFAULT 0,
+    CONSTRAINT import_sample_stats_pkey PRIMARY KEY (sample_id, key)
+);
+
+
+-- Update database version
+UPDATE parameter SET value='9.9' WHERE key='database_version';
+INSERT INTO "event" (message, type) VALUES ('Update database to version 9.9', 'technical');
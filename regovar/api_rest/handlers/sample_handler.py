@@ -112,10 +112,11 @@ class SampleHandler:
         params = request.rel_url.query # get_query_parameters(request.query_string, ["subject_id", "analysis_id"])
         file_id = request.match_info.get('file_id', None)
         ref_id = request.match_info.get('ref_id', None)
-        
+        import_mode = params["mode"] if "mode" in params and params["mode"] else None
+        priority = int(params["priority"]) if "priority" in params and params["priority"] else 0
         
         try:
-            samples = await core.samples.import_from_file(file_id, ref_id)
+            samples = await core.samples.import_from_file(file_id, ref_id, import_mode=import_mode, priority=priority)
         except Exception as ex:
             return rest_error("Import error : Unable to import samples.", exception=ex)
         if samples:
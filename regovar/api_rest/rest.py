@@ -29,6 +29,8 @@ from config import *
 from core.framework.common import *
 from core.framework.postgresql import *
 from core.core import core
+from core.managers.imports.import_queue import listen_import_events, unlisten_import_events
+from core.managers.imports.vcf_manager import VcfManager
 
 
 
@@ -272,8 +274,14 @@ class WebsocketHandler:
 
 
 
+async def on_startup(app):
+    # Events of the imports run by the import workers are forwarded to the clients by the server
+    app["import_events"] = listen_import_events(asyncio.get_event_loop(), VcfManager().import_event)
+
+
 async def on_shutdown(app):
     log("SHUTDOWN SERVER... CLOSE ALL")
+    unlisten_import_events(asyncio.get_event_loop(), app["import_events"])
     for ws in WebsocketHandler.socket_list:
         await ws[0].close(code=999, message='Server shutdown')
  
@@ -52,6 +52,9 @@ setup_security(app, SessionIdentityPolicy(session_key='regovar_session_token'),
 app['websockets'] = []
 aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(TEMPLATE_DIR)) 
 
+# On startup, listen to the events of the import workers
+app.on_startup.append(on_startup)
+
 # On shutdown, close all websockets
 app.on_shutdown.append(on_shutdown)
 
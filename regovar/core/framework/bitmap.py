@@ -0,0 +1,123 @@
+#!env/python3
+# coding: utf-8
+import struct
+import numpy as np
+
+
+
+
+# =====================================================================================================================
+# Compressed bitmaps of integers (samples ids)
+# =====================================================================================================================
+#
+# Roaring like format, serialized in a bytea (all numbers are big endian uint16) :
+#  - number of containers
+#  - header of each container : key (16 high bits of its values), cardinality - 1
+#  - data of each container (in the order of the headers) :
+#     - array container (cardinality <= BITMAP_ARRAY_MAX) : sorted 16 low bits of the values
+#     - bitmap container : 65536 bits (8192 bytes), bit n is bit n%8 of byte n/8 (as postgresql get_bit)
+# The empty bitmap is the 2 bytes '\x0000'.
+# Postgresql functions of the same names (bitmap_count, bitmap_contains, ...) are defined in create_all.sql
+
+BITMAP_ARRAY_MAX = 4096
+BITMAP_CONTAINER_SIZE = 8192
+
+
+
+def bitmap_encode(values):
+    """
+        Return the serialized bitmap (bytes) of the list of positive integers (duplicates are ignored)
+    """
+    values = np.unique(np.fromiter(values, dtype=np.int64))
+    if len(values) > 0 and (values[0] < 0 or values[-1] > 0xFFFFFFFF):
+        raise ValueError("Bitmaps can only store 32 bits positive integers")
+    keys, starts = np.unique(values >> 16, return_index=True)
+    ends = list(starts[1:]) + [len(values)]
+    header = [struct.pack(">H", len(keys))]
+    data = []
+    for key, start, end in zip(keys.tolist(), starts.tolist(), ends):
+        lows = values[start:end] & 0xFFFF
+        header.append(struct.pack(">HH", key, len(lows) - 1))
+        if len(lows) <= BITMAP_ARRAY_MAX:
+            data.append(lows.astype(">u2").tobytes())
+        else:
+            bits = np.zeros(65536, dtype=bool)
+            bits[lows] = True
+            # bits of each byte are reversed : bit n is the bit n % 8 of the byte n / 8 (as get_bit in postgresql)
+            data.append(np.packbits(bits.reshape(-1, 8)[:, ::-1]).tobytes())
+    return b"".join(header + data)
+
+
+def bitmap_containers(data):
+    """
+        Return the list of (key, cardinality, offset of the data) of the containers of the serialized bitmap
+    """
+    data = bytes(data)
+    count = struct.unpack_from(">H", data, 0)[0]
+    offset = 2 + 4 * count
+    result = []
+    for i in range(count):
+        key, card = struct.unpack_from(">HH", data, 2 + 4 * i)
+        result.append((key, card + 1, offset))
+        offset += 2 * (card + 1) if card + 1 <= BITMAP_ARRAY_MAX else BITMAP_CONTAINER_SIZE
+    return result
+
+
+def bitmap_decode(data):
+    """
+        Return the sorted array (int64) of the values of the serialized bitmap
+    """
+    data = bytes(data)
+    result = []
+    for key, card, offset in bitmap_containers(data):
+        if card <= BITMAP_ARRAY_MAX:
+            lows = np.frombuffer(data, dtype=">u2", count=card, offset=offset).astype(np.int64)
+        else:
+            bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=BITMAP_CONTAINER_SIZE, offset=offset)).reshape(-1, 8)[:, ::-1].ravel()
+            lows = np.nonzero(bits)[0].astype(np.int64)
+        result.append((key << 16) | lows)
+    return np.concatenate(result) if result else np.array([], dtype=np.int64)
+
+
+def bitmap_count(data):
+    """
+        Return the number of values of the serialized bitmap (only headers are read)
+    """
+    return sum([card for key, card, offset in bitmap_containers(data)])
+
+
+def bitmap_contains(data, value):
+    """
+        Return True if the value is in the serialized bitmap
+    """
+    data = bytes(data)
+    for key, card, offset in bitmap_containers(data):
+        if key != value >> 16: continue
+        low = value & 0xFFFF
+        if card > BITMAP_ARRAY_MAX:
+            return bool(data[offset + low // 8] >> (low % 8) & 1)
+        lows = np.frombuffer(data, dtype=">u2", count=card, offset=offset)
+        idx = np.searchsorted(lows, low)
+        return bool(idx < card and lows[idx] == low)
+    return False
+
+
+def bitmap_and(data1, data2):
+    """
+        Return the serialized intersection of the two bitmaps
+    """
+    return bitmap_encode(np.intersect1d(bitmap_decode(data1), bitmap_decode(data2), assume_unique=True))
+
+
+def bitmap_or(data1, data2):
+    """
+        Return the serialized union of the two bitmaps
+    """
+    return bitmap_encode(np.union1d(bitmap_decode(data1), bitmap_decode(data2)))
+
+
+def bitmap_sql(values):
+    """
+        Return the postgresql literal (bytea) of the bitmap of the list of integers
+    """
+    return "'\\x{}'::bytea".format(bitmap_encode(values).hex())
@@ -0,0 +1,73 @@
+#!env/python3
+# coding: utf-8
+import math
+import hashlib
+import numpy as np
+
+
+
+
+# =====================================================================================================================
+# Bloom filters of 64 bits hashes
+# =====================================================================================================================
+#
+# Values are added/tested by their 64 bits hash (see key_hash), so the hashes can also be computed by postgresql
+# (see KEY_HASH_SQL) to build the filter from a table without sending the keys. The k positions of a hash are
+# (h1 + i * h2) % size where h1 and h2 are the 32 low and high bits of the hash (double hashing). Bit n is bit n%8 of
+# the byte n/8. A value added is always found, a value not added is found with the error rate of the filter.
+
+# Postgresql expression of key_hash (the key is a text expression)
+KEY_HASH_SQL = "('x' || substr(md5({}), 1, 16))::bit(64)::bigint"
+
+
+
+def key_hash(key):
+    """
+        Return the 64 bits hash (positive int) of the string : first 64 bits of its md5
+    """
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[0:8], "big")
+
+
+
+class BloomFilter():
+    """
+        Bloom filter sized for the number of values (capacity) and the expected false positive rate
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.view = memoryview(self.bits)
+
+
+    def positions(self, hashes):
+        """
+            Return the positions (array of uint64) of the array of hashes
+        """
+        hashes = np.asarray(hashes).astype(np.uint64)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.hashes_count, dtype=np.uint64)
+        return ((h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.size)).ravel()
+
+
+    def add(self, hashes):
+        """
+            Add the array of hashes (int64 or uint64) to the filter
+        """
+        positions = self.positions(hashes)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8))
+
+
+    def __contains__(self, h):
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        for i in range(self.hashes_count):
+            p = (h1 + i * h2) % self.size
+            if not self.view[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
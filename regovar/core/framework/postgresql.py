@@ -4,6 +4,7 @@ import os
 import datetime
 import asyncio
 import sqlalchemy
+import psycopg2
 #import multiprocessing as mp
 
 import concurrent.futures
@@ -34,6 +35,18 @@ def init_pg(user, password, host, port, db):
     return con
     
 
+def new_connection():
+    '''
+        Returns a new raw psycopg2 connection, not shared with the sqlalchemy session/pool.
+        To use for bulk operations that need their own connection (COPY, temporary tables, ...)
+    '''
+    try:
+        con = psycopg2.connect(user=C.DATABASE_USER, password=C.DATABASE_PWD, host=C.DATABASE_HOST, port=C.DATABASE_PORT, dbname=C.DATABASE_NAME)
+    except Exception as ex:
+        raise RegovarException(code="E000001", exception=ex)
+    return con
+
+
 # Connect and map the engine to the database
 Base = automap_base()
 __db_engine = init_pg(C.DATABASE_USER, C.DATABASE_PWD, C.DATABASE_HOST, C.DATABASE_PORT, C.DATABASE_NAME)
@@ -45,6 +58,17 @@ except Exception as ex:
     raise RegovarException(code="E000002", exception=ex)
 
 
+def init_forked_process():
+    '''
+        To call at the start of a forked process (multiprocessing workers). Connections of the parent's pool 
+        must not be used (nor closed) by the child, so the shared session is bound to a new engine.
+    '''
+    global __db_engine
+    Session.registry.clear()
+    __db_engine = init_pg(C.DATABASE_USER, C.DATABASE_PWD, C.DATABASE_HOST, C.DATABASE_PORT, C.DATABASE_NAME)
+    Session.configure(bind=__db_engine)
+
+
 
 
 
@@ -167,3 +191,34 @@ def sql_escape(value):
     if type(value) is str:
         value = value.replace("'", "''")
     return value
+
+
+
+
+def drop_table_indexes(table, constraints=True):
+    """
+        Drop the indexes and the unique/primary key constraints of the table (to bulk load data in it). With
+        constraints=False, only the indexes that are not used by a constraint are dropped.
+        Return the list of sql queries that create them again (see create_table_indexes)
+    """
+    result = []
+    query = ""
+    if constraints:
+        for row in execute("SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint WHERE conrelid='{0}'::regclass AND contype IN ('p', 'u')".format(table)):
+            query += "ALTER TABLE {0} DROP CONSTRAINT {1};".format(table, row.conname)
+            result.append("ALTER TABLE {0} ADD CONSTRAINT {1} {2};".format(table, row.conname, row.definition))
+    for row in execute("SELECT i.indexrelid::regclass AS name, pg_get_indexdef(i.indexrelid) AS definition FROM pg_index i WHERE i.indrelid='{0}'::regclass AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid=i.indexrelid)".format(table)):
+        query += "DROP INDEX {0};".format(row.name)
+        result.append(row.definition + ";")
+    if query:
+        execute(query)
+    return result
+
+
+def create_table_indexes(table, queries):
+    """
+        Create the indexes returned by drop_table_indexes, and update the statistics of the table
+    """
+    for query in queries:
+        execute(query)
+    execute("ANALYZE {0};".format(table))
@@ -188,6 +188,11 @@ class AnalysisManager:
             if query != "":
                 execute("DELETE FROM attribute WHERE analysis_id={}".format(analysis_id))
                 execute("INSERT INTO attribute (analysis_id, sample_id, name, value, wt_col_id) VALUES " + query)
+                # attributes columns of the working table need to be updated
+                if analysis.status == "ready":
+                    analysis.status = "empty"
+                    analysis.computing_progress = None
+                    analysis.save()
             else:
                 # TODO: log error
                 pass
@@ -14,11 +14,14 @@ import psycopg2
 import hashlib
 import asyncio
 import ped_parser
+from functools import partial
 
 
 
 from config import *
 from core.framework.common import *
+from core.managers.wt_scheduler import WtScheduler
+from core.managers.wt_stats import WtStats
 from core.model import *
 
 
@@ -107,39 +110,47 @@ class FilterEngine:
 
             execute("SET work_mem='1GB'")
 
-            # create wt table
-            self.create_wt_schema(analysis, progress)
+            # Each step adds its tasks to the scheduler, that runs the independent ones in parallel (see wt_scheduler)
+            scheduler = WtScheduler(self, analysis, progress)
 
+            # Update the working table from the state it has been built with if any (see update_working_table),
+            # create it otherwise
+            state = self.get_wt_state(analysis)
+            if state is None or not self.update_working_table(analysis, state, scheduler):
+                # create wt table
+                self.create_wt_schema(analysis, scheduler)
 
-            # insert variant
-            self.insert_wt_variants(analysis, progress)
+                # insert variant and sample's fields (GT, DP, ...)
+                self.insert_wt_variants(analysis, scheduler)
 
-            # set sample's fields (GT, DP, ...)
-            self.update_wt_samples_fields(analysis, progress)
+                # compute stats and predefined filter (attributes, panels, trio, ...)
+                self.update_wt_stats_prefilters(analysis, scheduler)
 
-            # compute stats and predefined filter (attributes, panels, trio, ...)
-            self.update_wt_stats_prefilters(analysis, progress)
+                # variant's indexes
+                self.create_wt_variants_indexes(analysis, scheduler)
 
-            # variant's indexes
-            self.create_wt_variants_indexes(analysis, progress)
+                # insert trx annotations
+                self.insert_wt_trx(analysis, scheduler)
 
-            # insert trx annotations
-            self.insert_wt_trx(analysis, progress)
+                # merge single trw into their annotation, and mergin trx annotation into root variant annotations
+                self.update_wt_mergin_trx_variant(analysis, scheduler)
 
-            # merge single trw into their annotation, and mergin trx annotation into root variant annotations
-            self.update_wt_mergin_trx_variant(analysis, progress)
-
-            # trx's indexes # TODO: DO WE NEED IT ?
-            # self.create_wt_trx_indexes(analysis)
+                # trx's indexes # TODO: DO WE NEED IT ?
+                # self.create_wt_trx_indexes(analysis)
             
-            # Recreate stored filter
-            self.create_wt_stored_filters(analysis, progress)
+                # Recreate stored filter
+                self.create_wt_stored_filters(analysis, scheduler)
             
-            # Restore is_selected state for var/trx a
-            self.update_wt_set_restore_selection(analysis, progress)
+                # Restore is_selected state for var/trx a
+                self.update_wt_set_restore_selection(analysis, scheduler)
             
-            # Compute sample's stats (done one time)
-            self.update_wt_samples_stats(analysis, progress)
+                # Compute sample's stats (done one time)
+                self.update_wt_samples_stats(analysis, scheduler)
+
+            # The state of the working table is saved once it is ready
+            self.save_wt_state(analysis, scheduler)
+
+            scheduler.run()
 
             execute("RESET work_mem")
             
@@ -169,9 +180,7 @@ class FilterEngine:
         core.notify_all({'action':'wt_creation', 'data': progress})
 
 
-    def create_wt_schema(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 1, "computing", 0.1)
-
+    def create_wt_schema(self, analysis, scheduler):
         wt = "wt_{}".format(analysis.id)
         query = "DROP TABLE IF EXISTS {0} CASCADE; CREATE TABLE {0} (\
             is_variant boolean DEFAULT False, \
@@ -191,6 +200,10 @@ class FilterEngine:
             sample_tcount integer, \
             sample_alist integer[], \
             sample_acount integer, \
+            internal_het integer, \
+            internal_hom integer, \
+            internal_called integer, \
+            internal_af real, \
             is_dom boolean DEFAULT False, \
             is_rec_hom boolean DEFAULT False, \
             is_rec_htzcomp boolean DEFAULT False, \
@@ -204,53 +217,102 @@ class FilterEngine:
         query += ", ".join(["s{}_dp_alt integer".format(i) for i in analysis.samples_ids]) + ", "
         query += ", ".join(["s{}_vaf real".format(i) for i in analysis.samples_ids]) + ", "
         query += ", ".join(["s{}_qual real".format(i) for i in analysis.samples_ids]) + ", "
-        query += ", ".join(["s{}_filter JSON".format(i) for i in analysis.samples_ids]) + ", "
+        query += ", ".join(["s{}_filter integer".format(i) for i in analysis.samples_ids]) + ", "
         query += ", ".join(["s{}_is_composite boolean".format(i) for i in analysis.samples_ids]) + ", "
 
         # Add annotation's columns
         for dbuid in analysis.settings["annotations_db"]:
-            for fuid in self.db_map[dbuid]["fields"]:
-                default = ""
-                if "meta" in self.fields_map[fuid] and isinstance(self.fields_map[fuid]["meta"], dict) and "default" in self.fields_map[fuid]["meta"]:
-                    default = " DEFAULT {}".format(self.fields_map[fuid]["meta"]["default"])
-                query += "_{} {}{}, ".format(fuid, self.sql_type_map[self.fields_map[fuid]["type"]], default)
-                
+            for column in self.wt_annotation_columns(dbuid):
+                query += column + ", "
+
+
         # Add attribute's columns
         for attr in analysis.attributes:
             for value, col_id in attr["values_map"].items():
                 query += "attr_{} boolean DEFAULT False, ".format(col_id)
 
         query = query[:-2] + ");"
-        log(" > create wt schema")
-        execute(query.format(wt))
+        scheduler.add("create wt schema", 1, query.format(wt))
+
+
+    def wt_annotation_columns(self, dbuid):
+        """
+            Return the definitions of the columns of the fields of the annotation database in the working table
+        """
+        result = []
+        for fuid in self.db_map[dbuid]["fields"]:
+            default = ""
+            if "meta" in self.fields_map[fuid] and isinstance(self.fields_map[fuid]["meta"], dict) and "default" in self.fields_map[fuid]["meta"]:
+                default = " DEFAULT {}".format(self.fields_map[fuid]["meta"]["default"])
+            result.append("_{} {}{}".format(fuid, self.sql_type_map[self.fields_map[fuid]["type"]], default))
+        return result
+
+
+    def insert_wt_variants(self, analysis, scheduler):
+        wt = "wt_{}".format(analysis.id)
+        analysis_id = analysis.id
+
+        # create temp table with id of variants (with chr as variant tables are partitioned by chromosome)
+        # sample_variant tables are partitioned by sample : only the partitions of the samples are read
+        query  = "DROP TABLE IF EXISTS {0}_var CASCADE; CREATE UNLOGGED TABLE {0}_var (id bigint, chr integer, vcf_line bigint); "
+        query += "INSERT INTO {0}_var (id, chr, vcf_line) SELECT DISTINCT variant_id, chr, vcf_line FROM sample_variant{1} WHERE sample_id IN ({2});"
+        query = query.format(wt, analysis.db_suffix, ",".join([str(sid) for sid in analysis.samples_ids]))
+
+        def insert_ids():
+            res = execute(query)
+            # set total number of variant for the analysis
+            log(" > {} variants found".format(res.rowcount))
+            execute("UPDATE analysis SET total_variants={1} WHERE id={0};".format(analysis_id, res.rowcount))
+        ids = scheduler.add("get variants ids", 2, func=insert_ids, after=scheduler.step(1))
+
+        query_variants = self.wt_variants_query(analysis, "{}_var".format(wt))
+        variants = scheduler.add("insert variants", 2, query_variants, after=[ids])
         
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][1]["status"] = "done"
-        progress["log"][1]["progress"] = 1
+        # Create index on variant_id and vcf_line (built at the same time)
+        scheduler.add("create variants index vid", 2, "CREATE INDEX {0}_idx_vid ON {0} USING btree (variant_id);".format(wt), after=[variants])
+        scheduler.add("create variants index vcfline", 2, "CREATE INDEX {0}_idx_vcfline ON {0} USING btree (vcf_line);".format(wt), after=[variants])
+        scheduler.add("create variants index chrpos", 2, "CREATE INDEX {0}_idx_chrpos ON {0} USING btree (chr, pos);".format(wt), after=[variants])
+
+
+    def wt_samples_pivot(self, samples_ids):
+        """
+            Return the aggregates of the sample_variant rows of the samples pivoted in columns by sample : the ones of
+            the rows grouped by variant (chr-pos-ref-alt dependent fields) and the ones of the rows grouped by vcf line
+        """
+        q_var = []
+        q_line = []
+        for sid in samples_ids:
+            q_var.append("max(genotype) FILTER (WHERE sample_id={0}) AS s{0}_gt, max(depth) FILTER (WHERE sample_id={0}) AS s{0}_dp, max(depth_alt) FILTER (WHERE sample_id={0}) AS s{0}_dp_alt, ".format(sid)
+                + "CASE WHEN count(*) FILTER (WHERE sample_id={0}) = 0 THEN NULL WHEN max(depth) FILTER (WHERE sample_id={0}) > 0 THEN max(depth_alt) FILTER (WHERE sample_id={0}) / (max(depth) FILTER (WHERE sample_id={0}))::float ELSE 0 END AS s{0}_vaf, ".format(sid)
+                + "bool_or(is_composite) FILTER (WHERE sample_id={0}) AS s{0}_is_composite".format(sid))
+            q_line.append("max(quality) FILTER (WHERE sample_id={0}) AS s{0}_qual, max(filter_mask) FILTER (WHERE sample_id={0}) AS s{0}_filter".format(sid))
+        return q_var, q_line
 
 
-    def insert_wt_variants(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 2, "computing", 0.1)
+    def wt_variants_query(self, analysis, ids_table):
+        """
+            Return the query that inserts the rows of the variants of the ids table (id, chr, vcf_line) in the working table
+        """
         wt = "wt_{}".format(analysis.id)
 
-        # create temp table with id of variants
-        query  = "DROP TABLE IF EXISTS {0}_var CASCADE; CREATE UNLOGGED TABLE {0}_var (id bigint, vcf_line bigint); "
-        execute(query.format(wt))
-        
-        query = "INSERT INTO {0}_var (id, vcf_line) SELECT DISTINCT variant_id, vcf_line FROM sample_variant{1} WHERE sample_id IN ({2});"
-        res = execute(query.format(wt, analysis.db_suffix, ",".join([str(sid) for sid in analysis.samples_ids])))
-        
-        # set total number of variant for the analysis
-        log(" > {} variants found".format(res.rowcount))
-        query = "UPDATE analysis SET total_variants={1} WHERE id={0};".format(analysis.id, res.rowcount)
-        #query += "CREATE INDEX {0}_var_idx_id ON {0}_var USING btree (id);"
-        execute(query.format(wt))
-        self.working_table_creation_update_status(analysis, progress, 2, "computing", 0.33)
-
-        # Insert variants and their annotations
-        q_fields = "is_variant, variant_id, vcf_line, regovar_score, bin, chr, pos, ref, alt, is_transition, sample_tlist"
-        q_select = "True, _vids.id, _vids.vcf_line, _var.regovar_score, _var.bin, _var.chr, _var.pos, _var.ref, _var.alt, _var.is_transition, _var.sample_list"
-        q_from   = "{0}_var _vids LEFT JOIN variant{1} _var ON _vids.id=_var.id".format(wt, analysis.db_suffix)
+        # Insert variants and their annotations (internal frequency comes from the occurrences counters maintained by the imports,
+        # samples of the analysis that have the variant from the samples pivot : the bitmap of the variant is only read for tlist/tcount)
+        q_fields = "is_variant, variant_id, vcf_line, regovar_score, bin, chr, pos, ref, alt, is_transition, sample_tlist, sample_alist, sample_acount, sample_tcount, internal_het, internal_hom, internal_called, internal_af"
+        q_select = "True, _vids.id, _vids.vcf_line, _var.regovar_score, _var.bin, _var.chr, _var.pos, _var.ref, _var.alt, _var.is_transition, bitmap_to_array(_var.sample_bitmap), "
+        q_select += "COALESCE(_sv.sample_alist, '{}'), COALESCE(_sv.sample_acount, 0), "
+        q_select += "bitmap_count(_var.sample_bitmap), _cnt.het_count, _cnt.hom_count, _cnt.called_count, CASE WHEN _cnt.called_count > 0 THEN (_cnt.het_count + 2 * _cnt.hom_count) / (2 * _cnt.called_count)::float ELSE NULL END"
+        q_from   = "{2} _vids LEFT JOIN variant{1} _var ON _vids.chr=_var.chr AND _vids.id=_var.id LEFT JOIN variant_count{1} _cnt ON _cnt.variant_id=_vids.id".format(wt, analysis.db_suffix, ids_table)
+
+        # Samples fields (GT, DP, ...) are pivoted in columns by sample in the same insert, with one aggregation of the sample_variant
+        # rows of the samples by variant (chr-pos-ref-alt dependent fields) and one by vcf line (= chr-pos without trimming : qual, filter)
+        samples = ",".join([str(sid) for sid in analysis.samples_ids])
+        q_var, q_line = self.wt_samples_pivot(analysis.samples_ids)
+        q_var.append("array_agg(DISTINCT sample_id ORDER BY sample_id) FILTER (WHERE genotype IS NOT NULL) AS sample_alist, count(DISTINCT sample_id) FILTER (WHERE genotype IS NOT NULL) AS sample_acount")
+        for sid in analysis.samples_ids:
+            q_fields += ", s{0}_gt, s{0}_dp, s{0}_dp_alt, s{0}_vaf, s{0}_is_composite, s{0}_qual, s{0}_filter".format(sid)
+            q_select += ", _sv.s{0}_gt, _sv.s{0}_dp, _sv.s{0}_dp_alt, _sv.s{0}_vaf, _sv.s{0}_is_composite, _sl.s{0}_qual, _sl.s{0}_filter".format(sid)
+        q_from += " LEFT JOIN (SELECT variant_id, {2} FROM sample_variant{0} WHERE sample_id IN ({1}) GROUP BY variant_id) _sv ON _sv.variant_id=_vids.id".format(analysis.db_suffix, samples, ", ".join(q_var))
+        q_from += " LEFT JOIN (SELECT vcf_line, {2} FROM sample_variant{0} WHERE sample_id IN ({1}) GROUP BY vcf_line) _sl ON _sl.vcf_line=_vids.vcf_line".format(analysis.db_suffix, samples, ", ".join(q_line))
 
         for dbuid in analysis.settings["annotations_db"]:
             if self.db_map[dbuid]["type"] == "variant":
@@ -259,145 +321,137 @@ class FilterEngine:
                 q_fields += ", " + ", ".join(["_{}".format(fuid) for fuid in self.db_map[dbuid]["fields"]])
                 q_select += ", " + ", ".join(["{}.{}".format(dbname, self.fields_map[fuid]["name"]) for fuid in self.db_map[dbuid]["fields"]])
 
-        # execute query
-        query = "INSERT INTO {0} ({1}) SELECT {2} FROM {3};".format(wt, q_fields, q_select, q_from)
-        execute(query)
-        self.working_table_creation_update_status(analysis, progress, 2, "computing", 0.66)
-        
-        # Create index on variant_id and vcf_line 
-        log(" > create variants index")
-        query = "CREATE INDEX {0}_idx_vid ON {0} USING btree (variant_id);".format(wt)
-        query += "CREATE INDEX {0}_idx_vcfline ON {0} USING btree (vcf_line);".format(wt)
-        query += "CREATE INDEX {0}_idx_chrpos ON {0} USING btree (chr, pos);".format(wt)
-        execute(query)
-        
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][2]["status"] = "done"
-        progress["log"][2]["progress"] = 1
-        
-
-    def update_wt_samples_fields(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 3, "computing", 0.01)
-        log(" > import samples informations")
-        wt = "wt_{}".format(analysis.id)
-        step = 1/(2*len(analysis.samples_ids))
-        prg = 0
-        for sid in analysis.samples_ids:
-            # Retrive informations chr-pos-ref-alt dependent
-            execute("UPDATE {0} SET s{2}_gt=_sub.genotype, s{2}_dp=_sub.depth, s{2}_dp_alt=_sub.depth_alt, s{2}_vaf=CASE WHEN _sub.depth > 0 THEN _sub.depth_alt/_sub.depth::float ELSE 0 END, s{2}_is_composite=_sub.is_composite FROM (SELECT variant_id, genotype, depth, depth_alt, is_composite FROM sample_variant{1} WHERE sample_id={2}) AS _sub WHERE {0}.variant_id=_sub.variant_id".format(wt, analysis.db_suffix, sid))
-            prg += step
-            self.working_table_creation_update_status(analysis, progress, 3, "computing", prg)
-            # Retrive informations vcf'line dependent (= chr-pos without trimming)
-            execute("UPDATE {0} SET s{2}_qual=_sub.quality, s{2}_filter=_sub.filter FROM (SELECT vcf_line, chr, pos, quality, filter FROM sample_variant{1} WHERE sample_id={2}) AS _sub WHERE {0}.vcf_line=_sub.vcf_line".format(wt, analysis.db_suffix, sid))
-            prg += step
-            self.working_table_creation_update_status(analysis, progress, 3, "computing", prg)
-            
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][3]["status"] = "done"
-        progress["log"][3]["progress"] = 1
+        return "INSERT INTO {0} ({1}) SELECT {2} FROM {3};".format(wt, q_fields, q_select, q_from)
 
 
-    def update_wt_stats_prefilters(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 4, "computing", 0.01)
+    def update_wt_stats_prefilters(self, analysis, scheduler):
         wt = "wt_{}".format(analysis.id)
-        step = 1/(2+ len(analysis.attributes)*len(analysis.samples_ids) + len(analysis.panels) + (2 if analysis.settings["trio"] else len(analysis.samples_ids)))
-        prg = 0
-        # Variant occurence stats
-        query = "UPDATE {0} SET \
-            sample_tcount=array_length(sample_tlist,1), \
-            sample_alist=array_intersect(sample_tlist, array[{1}]), \
-            sample_acount=array_length(array_intersect(sample_tlist, array[{1}]),1)"
-        log(" > compute statistics")
-        execute(query.format(wt, ",".join([str(i) for i in analysis.samples_ids])))
-        prg += step
-        self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
+        variants = scheduler.step(2)
+        # Variant occurence stats (sample_tlist, sample_tcount, sample_alist, sample_acount) are set by insert_wt_variants
         
         # Attributes
-        for attr in analysis.attributes:
-            log(" > compute attribute {}".format(attr["name"]))
-            for sid, attr_data in attr["samples_values"].items():
-                execute("UPDATE {0} SET attr_{1}=True WHERE s{2}_gt IS NOT NULL".format(wt, attr_data["wt_col_id"], sid))
-                prg += step
-                self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
+        self.update_wt_compute_attributes(analysis, scheduler, variants)
 
-        # Panels
+        # Panels : regions of the panel are loaded (cached by panel version), variants of the panel are selected with a
+        # range join (read only, in parallel of the other updates) then flagged
         for panel in analysis.panels:
-            log(" > compute panel {} ({})".format(panel["name"], panel["version"]))
-            sql = "UPDATE {0} SET panel_{1}=True WHERE {2}"
-            sql_where = []
-            where_pattern = "(chr={} AND pos <@ int8range({},{}))"
-            # build test condition for the panel
-            for region in panel["entries"]:
-                sql_where.append(where_pattern.format(region["chr"], region["start"], region["end"]))
-            execute(sql.format(wt, panel["version_id"].replace("-", "_"), ' OR '.join(sql_where)))
-            prg += step
-            self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
-        
+            col = "panel_{}".format(panel["version_id"].replace("-", "_"))
+            load = scheduler.add("load {} regions".format(col), 4, func=partial(self.create_panel_table, panel["version_id"], analysis.reference))
+            query = "DROP TABLE IF EXISTS {0}_{1}; CREATE UNLOGGED TABLE {0}_{1} AS SELECT DISTINCT w.variant_id FROM {0} w INNER JOIN {2} p ON w.chr=p.chr AND p.loc @> w.pos".format(
+                wt, col, self.panel_table(panel["version_id"], analysis.reference))
+            select = scheduler.add("select {} variants".format(col), 4, query, after=variants + [load])
+            query = "UPDATE {0} SET {1}=True FROM {0}_{1} _p WHERE {0}.variant_id=_p.variant_id; DROP TABLE {0}_{1};".format(wt, col)
+            scheduler.add("compute panel {} ({})".format(panel["name"], col), 4, query, after=[select], lock=wt)
+
         # Predefinied quickfilters
+        self.update_wt_compute_prefilters(analysis, scheduler, variants)
+
+        # Compute is_exonic filter thanks to refgene
+        self.update_wt_compute_exonic(analysis, scheduler, variants)
+
+
+    def wt_attributes(self, analysis):
+        """
+            Return the attributes columns of the working table with the samples that have their value : {col_id: [sample_id]}
+        """
+        result = {}
+        for attr in analysis.attributes:
+            for value, col_id in attr["values_map"].items():
+                result[col_id] = []
+            for sid, attr_data in attr["samples_values"].items():
+                if sid in analysis.samples_ids:
+                    result[attr_data["wt_col_id"]].append(sid)
+        return result
+
+
+    def update_wt_compute_attributes(self, analysis, scheduler, after, columns=None):
+        """
+            Set the attributes columns (all of them if columns is None) : only the rows with a new value are updated
+        """
+        wt = "wt_{}".format(analysis.id)
+        for col_id, samples_ids in self.wt_attributes(analysis).items():
+            if columns is not None and col_id not in columns:
+                continue
+            condition = " OR ".join(["s{}_gt IS NOT NULL".format(sid) for sid in samples_ids]) or "False"
+            query = "UPDATE {0} SET attr_{1}=({2}) WHERE attr_{1} IS DISTINCT FROM ({2})".format(wt, col_id, condition)
+            scheduler.add("compute attribute attr_{}".format(col_id), 4, query, after=after, lock=wt)
+
+
+    def update_wt_compute_prefilters(self, analysis, scheduler, after):
         if analysis.settings["trio"]:
-            self.update_wt_compute_prefilter_trio(analysis, analysis.samples_ids, analysis.settings["trio"], progress, prg, step)
+            self.update_wt_compute_prefilter_trio(analysis, analysis.samples_ids, analysis.settings["trio"], scheduler, after)
         else:
             for sid in analysis.samples_ids:
                 # TODO: retrieve sex of sample if subject associated, otherwise, do it with default "Female"
-                self.update_wt_compute_prefilter_single(analysis, sid, "F", progress, prg, step)
-                
-                
-        # Compute is_exonic filter thanks to refgene
-        sql = "UPDATE {1} AS w SET is_exonic=True FROM refgene_exon{0} AS r WHERE w.chr=r.chr AND w.pos <@ r.exonrange"
-        execute(sql.format(analysis.db_suffix, wt))
-        
-        
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][4]["status"] = "done"
-        progress["log"][4]["progress"] = 1
-        
-        
-    def create_wt_variants_indexes(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 5, "computing", 0.01)
+                # (done in the order of the samples : the last one sets the filters)
+                after = [self.update_wt_compute_prefilter_single(analysis, sid, "F", scheduler, after)]
+
+
+    def update_wt_compute_exonic(self, analysis, scheduler, after, where=""):
+        """
+            Set the is_exonic column of the variants (only the ones that match the where condition if any)
+        """
         wt = "wt_{}".format(analysis.id)
+        query = "DROP TABLE IF EXISTS {1}_exonic; CREATE UNLOGGED TABLE {1}_exonic AS SELECT DISTINCT w.variant_id FROM {1} AS w INNER JOIN refgene_exon{0} AS r ON w.chr=r.chr AND w.pos <@ r.exonrange{2}"
+        select = scheduler.add("select exonic variants", 4, query.format(analysis.db_suffix, wt, " WHERE " + where if where else ""), after=after)
+        query = "UPDATE {0} SET is_exonic=True FROM {0}_exonic _e WHERE {0}.variant_id=_e.variant_id; DROP TABLE {0}_exonic;"
+        scheduler.add("compute exonic filter", 4, query.format(wt), after=[select], lock=wt)
+
+
+    def create_wt_variants_indexes(self, analysis, scheduler, samples_ids=None, columns=None):
+        """
+            Create the indexes of the columns of the samples and of the attributes (all of them if samples_ids/columns
+            are None)
+        """
+        wt = "wt_{}".format(analysis.id)
+        samples_ids = analysis.samples_ids if samples_ids is None else samples_ids
 
         # Common indexes for variants
-        query = "".join(["CREATE INDEX {0}_idx_s{1}_gt ON {0} USING btree (s{1}_gt);".format(wt, i) for i in analysis.samples_ids])
-        query += "".join(["CREATE INDEX {0}_idx_s{1}_dp ON {0} USING btree (s{1}_dp);".format(wt, i) for i in analysis.samples_ids])
-        query += "".join(["CREATE INDEX {0}_idx_s{1}_dpa ON {0} USING btree (s{1}_dp_alt);".format(wt, i) for i in analysis.samples_ids])
-        query += "".join(["CREATE INDEX {0}_idx_s{1}_vaf ON {0} USING btree (s{1}_vaf);".format(wt, i) for i in analysis.samples_ids])
-        query += "".join(["CREATE INDEX {0}_idx_s{1}_qual ON {0} USING btree (s{1}_qual);".format(wt, i) for i in analysis.samples_ids])
-        #query += "".join(["CREATE INDEX {0}_idx_s{1}_filter ON {0} USING btree (s{1}_filter);".format(wt, i) for i in analysis.samples_ids])
+        queries = ["CREATE INDEX {0}_idx_s{1}_gt ON {0} USING btree (s{1}_gt);".format(wt, i) for i in samples_ids]
+        queries += ["CREATE INDEX {0}_idx_s{1}_dp ON {0} USING btree (s{1}_dp);".format(wt, i) for i in samples_ids]
+        queries += ["CREATE INDEX {0}_idx_s{1}_dpa ON {0} USING btree (s{1}_dp_alt);".format(wt, i) for i in samples_ids]
+        queries += ["CREATE INDEX {0}_idx_s{1}_vaf ON {0} USING btree (s{1}_vaf);".format(wt, i) for i in samples_ids]
+        queries += ["CREATE INDEX {0}_idx_s{1}_qual ON {0} USING btree (s{1}_qual);".format(wt, i) for i in samples_ids]
+        #queries += ["CREATE INDEX {0}_idx_s{1}_filter ON {0} USING btree (s{1}_filter);".format(wt, i) for i in samples_ids]
         # Index useless on bool column
-        # query += "".join(["CREATE INDEX {0}_idx_s{1}_is_composite ON {0} USING btree (s{1}_is_composite);".format(wt, i) for i in analysis.samples_ids])
-        # query += "CREATE INDEX {0}_idx_is_dom ON {0} USING btree (is_dom);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_rec_hom ON {0} USING btree (is_rec_hom);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_rec_htzcomp ON {0} USING btree (is_rec_htzcomp);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_denovo ON {0} USING btree (is_denovo);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_exonic ON {0} USING btree (is_exonic);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_aut ON {0} USING btree (is_aut);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_xlk ON {0} USING btree (is_xlk);".format(wt)
-        # query += "CREATE INDEX {0}_idx_is_mit ON {0} USING btree (is_mit);".format(wt)
+        # queries += ["CREATE INDEX {0}_idx_s{1}_is_composite ON {0} USING btree (s{1}_is_composite);".format(wt, i) for i in samples_ids]
+        # queries.append("CREATE INDEX {0}_idx_is_dom ON {0} USING btree (is_dom);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_rec_hom ON {0} USING btree (is_rec_hom);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_rec_htzcomp ON {0} USING btree (is_rec_htzcomp);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_denovo ON {0} USING btree (is_denovo);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_exonic ON {0} USING btree (is_exonic);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_aut ON {0} USING btree (is_aut);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_xlk ON {0} USING btree (is_xlk);".format(wt))
+        # queries.append("CREATE INDEX {0}_idx_is_mit ON {0} USING btree (is_mit);".format(wt))
 
         # Add indexes on attributes columns
         for attr in analysis.attributes:
             for value, col_id in attr["values_map"].items():
-                query += "CREATE INDEX {0}_idx_attr_{1} ON {0} USING btree (attr_{1});".format(wt, col_id)
+                if columns is not None and col_id not in columns:
+                    continue
+                queries.append("CREATE INDEX {0}_idx_attr_{1} ON {0} USING btree (attr_{1});".format(wt, col_id))
 
         # Add indexes on panel columns
         # for panel in analysis.panels:
-        #     query += "CREATE INDEX {0}_idx_panel_{1} ON {0} USING btree (panel_{1});".format(wt, panel["version_id"].replace("-", "_"))
+        #     queries.append("CREATE INDEX {0}_idx_panel_{1} ON {0} USING btree (panel_{1});".format(wt, panel["version_id"].replace("-", "_")))
         
-        log(" > create index for variants random access")
-        execute(query)
-        
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][5]["status"] = "done"
-        progress["log"][5]["progress"] = 1
+        # Indexes of the table are built at the same time (no lock : they don't update its rows)
+        after = scheduler.step(4)
+        for query in queries:
+            scheduler.add("create index {}".format(query.split(" ")[2]), 5, query, after=after)
         
 
-    def insert_wt_trx(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 6, "computing", 0.01)
+    def insert_wt_trx(self, analysis, scheduler, dbuids=None, where="", after=None):
+        """
+            Insert the trx of the transcript annotations databases (all of them if dbuids is None) of the variants (only
+            the ones that match the where condition if any)
+        """
         wt = "wt_{}".format(analysis.id)
+        dbuids = analysis.settings["annotations_db"] if dbuids is None else dbuids
 
         # Insert trx and their annotations
         q_fields  = "is_variant, variant_id, trx_pk_uid, trx_pk_value, vcf_line, regovar_score, bin, chr, pos, ref, alt, is_transition, "
-        q_fields += "sample_tlist, sample_tcount, sample_alist, sample_acount, is_dom, is_rec_hom, is_rec_htzcomp, is_denovo, is_exonic, is_aut, is_xlk, is_mit, "
+        q_fields += "sample_tlist, sample_tcount, sample_alist, sample_acount, internal_het, internal_hom, internal_called, internal_af, is_dom, is_rec_hom, is_rec_htzcomp, is_denovo, is_exonic, is_aut, is_xlk, is_mit, "
         q_fields += ", ".join(["s{}_gt".format(i) for i in analysis.samples_ids]) + ", "
         q_fields += ", ".join(["s{}_dp".format(i) for i in analysis.samples_ids]) + ", "
         q_fields += ", ".join(["s{}_dp_alt".format(i) for i in analysis.samples_ids]) + ", "
@@ -414,7 +468,7 @@ class FilterEngine:
             q_fields += ", panel_{}".format(panel["version_id"].replace("-", "_"))
         
         q_select  = "False, _wt.variant_id, '{0}', {1}.regovar_trx_id, _wt.vcf_line, _wt.regovar_score, _wt.bin, _wt.chr, _wt.pos, "
-        q_select += "_wt.ref, _wt.alt, _wt.is_transition, _wt.sample_tlist, _wt.sample_tcount, _wt.sample_alist, _wt.sample_acount, _wt.is_dom, _wt.is_rec_hom, "
+        q_select += "_wt.ref, _wt.alt, _wt.is_transition, _wt.sample_tlist, _wt.sample_tcount, _wt.sample_alist, _wt.sample_acount, _wt.internal_het, _wt.internal_hom, _wt.internal_called, _wt.internal_af, _wt.is_dom, _wt.is_rec_hom, "
         q_select += "_wt.is_rec_htzcomp, _wt.is_denovo, _wt.is_exonic, _wt.is_aut, _wt.is_xlk, _wt.is_mit, "
         q_select += ", ".join(["_wt.s{}_gt".format(i) for i in analysis.samples_ids]) + ", "
         q_select += ", ".join(["_wt.s{}_dp".format(i) for i in analysis.samples_ids]) + ", "
@@ -441,8 +495,9 @@ class FilterEngine:
                 q_select += ", " + ", ".join(["_{}".format(fuid) for fuid in self.db_map[dbuid]["fields"]])
 
 
-        # Second loop to execute insert query by trx annotation db
-        for dbuid in analysis.settings["annotations_db"]:
+        # Second loop to insert trx by trx annotation db (inserts of the dbs are run at the same time)
+        after = scheduler.step(5) if after is None else after
+        for dbuid in dbuids:
             if self.db_map[dbuid]["type"] == "transcript":
                 dbname = "_db_{}".format(dbuid)
                 q_from_db   = q_from + " INNER JOIN {0}".format(self.db_map[dbuid]['join'].format(dbname, '_wt'))
@@ -451,14 +506,8 @@ class FilterEngine:
                 q_select_db = q_select.format(pk_uid, dbname)
                 q_select_db += ", " + ", ".join(["{}.{}".format(dbname, self.fields_map[fuid]["name"]) for fuid in self.db_map[dbuid]["fields"]])
 
-                # execute query
-                query = "INSERT INTO {0} ({1}) SELECT {2} FROM {3} WHERE _wt.is_variant;".format(wt, q_fields_db, q_select_db, q_from_db)
-                res = execute(query)
-                log(" > {} trx inserted for {} annotations".format(res.rowcount, self.db_map[dbuid]["name"]))
-
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][6]["status"] = "done"
-        progress["log"][6]["progress"] = 1
+                query = "INSERT INTO {0} ({1}) SELECT {2} FROM {3} WHERE _wt.is_variant{4};".format(wt, q_fields_db, q_select_db, q_from_db, " AND " + where if where else "")
+                scheduler.add("insert {} trx".format(self.db_map[dbuid]["name"]), 6, query, after=after)
 
 
     def create_wt_trx_indexes(self, analysis, progress):
@@ -467,7 +516,7 @@ class FilterEngine:
         pass
 
 
-    def update_wt_compute_prefilter_single(self, analysis, sample_id, sex, progress, prg, step):
+    def update_wt_compute_prefilter_single(self, analysis, sample_id, sex, scheduler, after):
         query = "UPDATE wt_{0} SET "
         # Dominant
         if sex == "F":
@@ -479,18 +528,17 @@ class FilterEngine:
         # Recessif Heterozygous compoud
         query += "is_rec_htzcomp=(s{1}_is_composite), "
         # Inherited and denovo are not available for single
+        query += "is_denovo=False, "
         # Autosomal
         query += "is_aut=(chr<23), "
         # X-Linked
         query += "is_xlk=(chr=23), "
         # Mitochondrial
         query += "is_mit=(chr=25);"
-        execute(query.format(analysis.id, sample_id))
-        prg += step
-        self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
+        return scheduler.add("compute prefilters of sample {}".format(sample_id), 4, query.format(analysis.id, sample_id), after=after, lock="wt_{}".format(analysis.id))
 
 
-    def update_wt_compute_prefilter_trio(self, analysis, samples_ids, trio, progress, prg, step):
+    def update_wt_compute_prefilter_trio(self, analysis, samples_ids, trio, scheduler, after):
         sex = trio["child_sex"]
         child_id = trio["child_id"]
         mother_id = trio["mother_id"]
@@ -506,6 +554,8 @@ class FilterEngine:
             query += "is_dom=(chr=23 OR s{1}_gt>1), "
         # Recessif Homozygous
         query += "is_rec_hom=(s{1}_gt=1), "
+        # Recessif Heterozygous compoud (set below)
+        query += "is_rec_htzcomp=False, "
         # Inherited and denovo
         query += "is_denovo=(s{1}_gt>0 AND COALESCE(s{2}_gt,0)<=0 AND COALESCE(s{3}_gt,0)<=0), "
         # Autosomal
@@ -517,29 +567,32 @@ class FilterEngine:
         query += " AND s{3}_gt>1), " if trio["child_sex"] == "F" else "), "
         # mitochondrial
         query += "is_mit=(chr=25)"
-        execute(query.format(analysis.id, child_id, mother_id, father_id, analysis.db_suffix))
-        prg += step
-        self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
+        prefilters = scheduler.add("compute trio prefilters", 4, query.format(analysis.id, child_id, mother_id, father_id, analysis.db_suffix), after=after, lock="wt_{}".format(analysis.id))
         
         # Recessif Heterozygous compoud
         query = "UPDATE wt_{0} u SET is_rec_htzcomp=True WHERE u.variant_id IN (SELECT DISTINCT UNNEST(sub.vids) as variant_id FROM ( SELECT array_agg(w.variant_id) as vids, g.name2 FROM wt_{0} w  INNER JOIN refgene{4} g ON g.chr=w.chr AND g.trxrange @> w.pos  WHERE  s{1}_gt > 1 AND ( (s{2}_gt > 1 AND (s{3}_gt = NULL or s{3}_gt < 2)) OR (s{3}_gt > 1 AND (s{2}_gt = NULL or s{2}_gt < 2))) GROUP BY name2 HAVING count(*) > 1) AS sub )"
-        res = execute(query.format(analysis.id, child_id, mother_id, father_id, analysis.db_suffix))
-        prg += step
-        self.working_table_creation_update_status(analysis, progress, 4, "computing", prg)
+        scheduler.add("compute trio compound heterozygous", 4, query.format(analysis.id, child_id, mother_id, father_id, analysis.db_suffix), after=[prefilters], lock="wt_{}".format(analysis.id))
 
 
-    def update_wt_mergin_trx_variant(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 7, "computing", 0.1)
-        
+    def update_wt_mergin_trx_variant(self, analysis, scheduler, dbuids=None, where=""):
+        """
+            Merge the trx annotations of the databases (all of them if dbuids is None) into their variants (only the
+            variants that match the where condition if any)
+        """
+        wt = "wt_{}".format(analysis.id)
+        dbuids = analysis.settings["annotations_db"] if dbuids is None else dbuids
+        q_where = " WHERE " + where if where else ""
+        q_and = " AND " + where if where else ""
+        queries = []
         
-        query = "UPDATE wt_{0} w SET {1} FROM (SELECT variant_id, {2} FROM wt_{0} WHERE NOT is_variant GROUP BY variant_id) as sub WHERE w.is_variant AND w.variant_id=sub.variant_id"
+        query = "UPDATE wt_{0} w SET {1} FROM (SELECT variant_id, {2} FROM wt_{0} WHERE NOT is_variant{3} GROUP BY variant_id) as sub WHERE w.is_variant AND w.variant_id=sub.variant_id"
         
         
         # Step 1: mergin trx annotation into variant
         q1 = []
         q2 = [] 
         list_field = []
-        for dbuid in analysis.settings["annotations_db"]:
+        for dbuid in dbuids:
             if self.db_map[dbuid]["type"] == "transcript":
                 for fuid in self.db_map[dbuid]["fields"]:
                     if self.fields_map[fuid]['type'] != 'list':
@@ -548,13 +601,11 @@ class FilterEngine:
                     else:
                         list_field.append(fuid)
         if len(q1) > 0 and len(q2) > 0        :
-            res = execute(query.format(analysis.id, ','.join(q1), ','.join(q2)))
-            log(" > {} trx annotation merged into their respective variant".format(res.rowcount))
-        self.working_table_creation_update_status(analysis, progress, 7, "computing", 0.25)
+            queries.append(("trx annotation merged into their respective variant", query.format(analysis.id, ','.join(q1), ','.join(q2), q_and)))
         
         # Manage special sql query for list fields
         if len(list_field) > 0:
-            query = "UPDATE wt_{0} w SET {1} FROM (SELECT variant_id, {2} FROM (SELECT variant_id, {3} FROM  wt_{0}) AS t GROUP BY variant_id) AS sub WHERE w.is_variant AND w.variant_id=sub.variant_id"
+            query = "UPDATE wt_{0} w SET {1} FROM (SELECT variant_id, {2} FROM (SELECT variant_id, {3} FROM  wt_{0}{4}) AS t GROUP BY variant_id) AS sub WHERE w.is_variant AND w.variant_id=sub.variant_id"
             q1 = []
             q2 = []
             q3 = []
@@ -562,155 +613,310 @@ class FilterEngine:
                 q1.append("_{0} = sub._{0}".format(fuid))
                 q2.append("array_agg(DISTINCT _{0}) AS _{0}".format(fuid))
                 q3.append("unnest(_{0}) as _{0}".format(fuid))
-            
-            res = execute(query.format(analysis.id, ','.join(q1), ','.join(q2), ','.join(q3)))
-            log(" > {} trx list typed annotation merged into their respective variant".format(res.rowcount))
-        self.working_table_creation_update_status(analysis, progress, 7, "computing", 0.5)
+            queries.append(("trx list typed annotation merged into their respective variant", query.format(analysis.id, ','.join(q1), ','.join(q2), ','.join(q3), q_where)))
 
         # Step 2: deleting trx when only one by variant annotation for variant that have more than 1 trx
         # merge variant and trx id
         query = "UPDATE wt_{0} w SET trx_pk_uid=sub.trx_pk_uid, trx_pk_value=sub.trx_pk_value FROM "
-        query+= "(SELECT variant_id, max(trx_pk_uid) as trx_pk_uid, max(trx_pk_value) as trx_pk_value FROM wt_{0} WHERE NOT is_variant GROUP BY variant_id HAVING count(*) = 1) AS sub "
+        query+= "(SELECT variant_id, max(trx_pk_uid) as trx_pk_uid, max(trx_pk_value) as trx_pk_value FROM wt_{0} WHERE NOT is_variant{1} GROUP BY variant_id HAVING count(*) = 1) AS sub "
         query+= "WHERE w.is_variant AND w.variant_id=sub.variant_id"
-        res = execute(query.format(analysis.id))
-        self.working_table_creation_update_status(analysis, progress, 7, "computing", 0.75)
+        queries.append(("single trx annotation merged with the variant", query.format(analysis.id, q_and)))
         # delete useless trx entries
-        query = "DELETE FROM wt_{0} w WHERE not w.is_variant AND w.variant_id IN (SELECT variant_id FROM wt_{0} WHERE NOT is_variant GROUP BY variant_id HAVING count(*) = 1)"
-        res = execute(query.format(analysis.id))
-        log(" > {} single trx annotation removed (merged with the variant)".format(res.rowcount))
-        
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][7]["status"] = "done"
-        progress["log"][7]["progress"] = 1
+        query = "DELETE FROM wt_{0} w WHERE not w.is_variant AND w.variant_id IN (SELECT variant_id FROM wt_{0} WHERE NOT is_variant{1} GROUP BY variant_id HAVING count(*) = 1)"
+        queries.append(("single trx annotation removed (merged with the variant)", query.format(analysis.id, q_and)))
+
+        # each query updates the result of the previous one
+        after = scheduler.step(6)
+        for label, query in queries:
+            after = [scheduler.add(label, 7, query, after=after, lock=wt)]
     
 
-    def create_wt_stored_filters(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 8, "computing", 0.1)
-        
+    def create_wt_stored_filters(self, analysis, scheduler):
+        # update_wt uses the analysis : run by the thread of the scheduler
+        after = scheduler.step(7)
         for flt in analysis.filters:
-            log(" > compute filter {}: {}".format(flt.id, flt.name))
-            self.update_wt(analysis, "filter_{}".format(flt.id), flt.filter)
-            
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][8]["status"] = "done"
-        progress["log"][8]["progress"] = 1
+            scheduler.add("compute filter {}: {}".format(flt.id, flt.name), 8, func=partial(self.update_wt, analysis, "filter_{}".format(flt.id), flt.filter), after=after, lock="wt_{}".format(analysis.id), local=True)
     
 
-    def update_wt_set_restore_selection(self, analysis, progress):
-        self.working_table_creation_update_status(analysis, progress, 9, "computing", 0.1)
+    def update_wt_set_restore_selection(self, analysis, scheduler):
         # TODO: create sql request from json selection data.
-        
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][9]["status"] = "done"
-        progress["log"][9]["progress"] = 1
+        pass
 
 
-    def update_wt_samples_stats(self, analysis, progress):
-        # TODO: improve progress feedback according to sample count and vep consequences
-        self.working_table_creation_update_status(analysis, progress, 10, "computing", 0.1)
+    def update_wt_samples_stats(self, analysis, scheduler, samples_ids=[]):
+        """
+            Compute the stats of the analysis, and the ones of its samples that don't have them yet (or that are in
+            samples_ids : their transcripts counter depends on the annotations databases of the analysis)
+        """
         wt  = "wt_{}".format(analysis.id)
+        db_suffix = analysis.db_suffix
         
         with_vep = None
+        consequence_uid = None
         
         # check annotations available to knwo which stats will be computed
         for dbuid in analysis.settings["annotations_db"]:
             if self.db_map[dbuid]["name"].upper().startswith("VEP_"):
                 with_vep = dbuid
-        
-        #
-        # Compute stats for all sample 
-        #
-        astats = {
-            "total_variant" : execute("SELECT COUNT(*) FROM {} WHERE is_variant".format(wt)).first()[0],
-            "total_transcript": execute("SELECT COUNT(*) FROM {} WHERE NOT is_variant".format(wt)).first()[0],
-            
-            # TODO: OPTIMIZATION : find better way with postgresql sql JSON operators
-            # "filter": {fid: execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND s{1}_filter::text LIKE '%{2}%'".format(wt, sample.id, fid)).first()[0] for fid in sample.filter_description.keys()},
-            
-            "variants_classes": {
-                "ref": execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND ref=alt".format(wt)).first()[0],
-                "snv": execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND ref<>alt AND char_length(ref)=1 AND char_length(alt)=1".format(wt)).first()[0],
-                "mnv": execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND ref<>alt AND char_length(ref)>1 AND char_length(alt)=char_length(ref)".format(wt)).first()[0],
-                "insertion": execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND char_length(ref)=0 AND char_length(alt)>0".format(wt)).first()[0],
-                "deletion":  execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND char_length(ref)>0 AND char_length(alt)=0".format(wt)).first()[0],
-                "others": execute("SELECT COUNT(*) FROM {0} WHERE is_variant AND char_length(ref)<>char_length(alt) AND char_length(ref)>0 AND char_length(alt)>0".format(wt)).first()[0]
-                }
-            }
-        self.working_table_creation_update_status(analysis, progress, 10, "computing", 0.20)
-        
-        consequences = []
         if with_vep:
             for k, v in self.db_map[with_vep]["fields"].items():
                 if v["name"] == "consequence":
-                    test_field_uid = k
-            consequences = [f[0] for f in execute("SELECT DISTINCT(UNNEST(_{1})) FROM {0} WHERE NOT is_variant ".format(wt, test_field_uid))]
-            vep_consequences = {c: execute("SELECT count(*) FROM {0} WHERE NOT is_variant AND '{2}'=ANY(_{1})".format(wt, test_field_uid, c)).first()[0] for c in consequences}
-            astats.update({"vep_consequences": vep_consequences})
-
-        analysis.statistics = astats
-        analysis.save()
-        self.working_table_creation_update_status(analysis, progress, 10, "computing", 0.40)
-
-
+                    consequence_uid = k
+        
         #
-        # Compute stats by sample
+        # Stats of the analysis and of the samples are computed with one scan of the working table (see wt_stats)
         #
+        wt_stats = WtStats(wt, consequence_uid)
+        wt_stats.add_analysis()
         analysis.init(1)
+        samples = []
         for sample in analysis.samples:
             # skip if not need
-            if sample.stats is not None:
+            if sample.id not in samples_ids and sample.stats is not None and "total_transcript" in sample.stats:
                 continue
-            # Compute simple common stats
-            stats = {
-                "total_variant" : execute("SELECT COUNT(*) FROM sample_variant{} WHERE sample_id={}".format(analysis.db_suffix, sample.id)).first()[0],
-                "total_transcript": execute("SELECT COUNT(*) FROM {} WHERE s{}_gt>=0 AND NOT is_variant".format(wt, sample.id)).first()[0],
-                
-                # TODO : this stat can only be computed by the vcf_import manager by checking vcf header
-                "matching_reference": True, 
-                
-                # TODO: OPTIMIZATION : find better way with postgresql sql JSON operators
-                "filter": {fid: execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>=0 AND is_variant AND s{1}_filter::text LIKE '%{2}%'".format(wt, sample.id, fid)).first()[0] for fid in sample.filter_description.keys()},
-                
-                "sample_total_variant": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>=0 AND is_variant".format(wt, sample.id)).first()[0],
-                "variants_classes": {
-                    "not": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt=-1 AND is_variant".format(wt, sample.id)).first()[0],
-                    "ref": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt=0 AND is_variant".format(wt, sample.id)).first()[0],
-                    "snv": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>0 AND is_variant AND char_length(ref)=1 AND char_length(alt)=1".format(wt, sample.id)).first()[0],
-                    "mnv": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>0 AND is_variant AND char_length(ref)>1 AND char_length(alt)=char_length(ref)".format(wt, sample.id)).first()[0],
-                    "insertion": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>0 AND is_variant AND char_length(ref)=0 AND char_length(alt)>0".format(wt, sample.id)).first()[0],
-                    "deletion":  execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>0 AND is_variant AND char_length(ref)>0 AND char_length(alt)=0".format(wt, sample.id)).first()[0],
-                    "others": execute("SELECT COUNT(*) FROM {0} WHERE s{1}_gt>0 AND is_variant AND char_length(ref)<>char_length(alt) AND char_length(ref)>0 AND char_length(alt)>0".format(wt, sample.id)).first()[0]
-                    }
-                }
-            
-            if with_vep:
-                for k, v in self.db_map[with_vep]["fields"].items():
-                    if v["name"] == "consequence":
-                        test_field_uid = k
-                vep_consequences = {c: execute("SELECT count(*) FROM {0} WHERE NOT is_variant AND s{3}_gt>0 AND '{2}'=ANY(_{1})".format(wt, test_field_uid, c, sample.id)).first()[0] for c in consequences}
-                stats.update({"vep_consequences": vep_consequences})
-            
-            # Save stats
-            sample.stats = stats
-            sample.save()
-            
-        # We just update progress without calling notify_all as a notify will be send by the next step
-        progress["log"][10]["status"] = "done"
-        progress["log"][10]["progress"] = 1
+            samples.append(sample)
+            if sample.stats and "variants_classes" in sample.stats:
+                # Stats computed during the import (see vcf_import_stats) only need to be completed with the transcripts stats
+                wt_stats.add_sample(sample.id)
+            else:
+                # Sample imported without import stats : compute simple common stats
+                wt_stats.add_sample(sample.id, Sample.filter_codes((sample.filter_description or {}).keys()))
+        legacy = [s.id for s in samples if not (s.stats and "variants_classes" in s.stats)]
+
+        def compute_stats():
+            astats, sstats = wt_stats.run()
+            for sid in legacy:
+                # TODO : matching_reference can only be computed by the vcf_import manager by checking vcf header
+                sstats[sid].update({"total_variant": 0, "matching_reference": True})
+            if legacy:
+                for row in execute("SELECT sample_id, COUNT(*) FROM sample_variant{} WHERE sample_id IN ({}) GROUP BY sample_id".format(db_suffix, ",".join([str(sid) for sid in legacy]))):
+                    sstats[row[0]]["total_variant"] = row[1]
+            return astats, sstats
+        stats = scheduler.add("compute statistics", 10, func=compute_stats, after=scheduler.step(7))
+
+        def save_stats():
+            astats, sstats = scheduler.result(stats)
+            analysis.statistics = astats
+            analysis.save()
+            for sample in samples:
+                sample.stats = dict(sample.stats or {}, **sstats[sample.id])
+                sample.save()
+        scheduler.add("save stats", 10, func=save_stats, after=[stats], local=True)
+
+
 
 
 
 
 
+    # =================================================================================================================
+    # INCREMENTAL UPDATE OF THE WORKING TABLE
+    # =================================================================================================================
+    #
+    # The state of a working table (reference, samples, annotations databases, trio settings and attributes columns it
+    # has been built with) is saved in the comment of the table once it is ready (removed while it is updated). When the
+    # analysis changes (see analysis_load), create_working_table only applies the differences with this state, with the
+    # steps of a creation :
+    #  - samples added : their columns are added and set on the existing rows, then the rows of their new variants are
+    #    inserted (with their trx). The variants merged with their single trx that get new trx are split again
+    #  - samples removed : the rows of the variants only found in these samples are deleted, their columns dropped
+    #  - annotations databases added : the columns of a variant database are set with a join, the trx of a transcript
+    #    database are inserted then merged into their variants. Columns and trx of the removed databases are dropped
+    #  - attributes : only their columns are added, computed again or dropped (panels columns are added by prepare)
+    # Prefilters that depend on the samples, stored filters and statistics are computed again. A working table without
+    # state (creation interrupted, or created before) is created again, as well as the ones with another reference,
+    # without any of their former samples or with an annotation database that does not exist anymore.
+
+    def wt_state(self, analysis):
+        """
+            Return the state of the working table of the analysis (see above)
+        """
+        return json.loads(json.dumps({
+            "reference_id": analysis.reference_id,
+            "samples": analysis.samples_ids,
+            "annotations_db": analysis.settings["annotations_db"],
+            "trio": analysis.settings["trio"],
+            "attributes": self.wt_attributes(analysis)}))
+
+
+    def get_wt_state(self, analysis):
+        """
+            Return the state saved with the working table of the analysis, None if the table doesn't exist or is not ready
+        """
+        row = execute("SELECT obj_description(to_regclass('wt_{}'), 'pg_class') AS state".format(analysis.id)).first()
+        try:
+            return json.loads(row.state) if row and row.state else None
+        except ValueError:
+            return None
+
+
+    def save_wt_state(self, analysis, scheduler):
+        wt = "wt_{}".format(analysis.id)
+        # temp table of the former filter is outdated
+        query = "DROP TABLE IF EXISTS {0}_new; DROP TABLE IF EXISTS {0}_tmp; COMMENT ON TABLE {0} IS '{1}';".format(wt, sql_escape(json.dumps(self.wt_state(analysis))))
+        scheduler.add("save working table state", 10, query, after=[t.name for t in scheduler.tasks])
+
+
+    def update_working_table(self, analysis, state, scheduler):
+        """
+            Add the tasks that update the working table from its state (see above). Return False if the table must
+            be created again
+        """
+        wt = "wt_{}".format(analysis.id)
+        target = self.wt_state(analysis)
+        kept = [sid for sid in state["samples"] if sid in target["samples"]]
+        added = [sid for sid in target["samples"] if sid not in state["samples"]]
+        removed = [sid for sid in state["samples"] if sid not in target["samples"]]
+        if state.get("reference_id") != target["reference_id"] or len(kept) == 0:
+            return False
+        if any([dbuid not in self.db_map for dbuid in state["annotations_db"] + target["annotations_db"]]):
+            return False
+        dbs_added = [dbuid for dbuid in target["annotations_db"] if dbuid not in state["annotations_db"]]
+        dbs_removed = [dbuid for dbuid in state["annotations_db"] if dbuid not in target["annotations_db"]]
+        trx_added = [dbuid for dbuid in dbs_added if self.db_map[dbuid]["type"] == "transcript"]
+        trx_removed = [dbuid for dbuid in dbs_removed if self.db_map[dbuid]["type"] == "transcript"]
+        trx_kept = [dbuid for dbuid in target["annotations_db"] if dbuid not in dbs_added and self.db_map[dbuid]["type"] == "transcript"]
+        attrs_added = [col for col in target["attributes"] if col not in state["attributes"]]
+        attrs_removed = [col for col in state["attributes"] if col not in target["attributes"]]
+        attrs_updated = [col for col in target["attributes"] if col in state["attributes"] and (added or removed or target["attributes"][col] != state["attributes"][col])]
+        if not (added or removed or dbs_added or dbs_removed or attrs_added or attrs_removed or attrs_updated or state["trio"] != target["trio"]):
+            log(" > wt is up to date")
+            return True
+        log(" > wt update : samples +{} -{}, annotations databases +{} -{}, attributes +{} -{}".format(added, removed, dbs_added, dbs_removed, attrs_added, attrs_removed))
+        def sql_ids(ids):
+            return ",".join([str(i) for i in ids])
+        # rows of the new variants
+        new_rows = "({0}.variant_id, {0}.vcf_line) IN (SELECT id, vcf_line FROM " + wt + "_new)"
+
+        # Schema : columns of the new samples, annotations databases and attributes are added, the removed ones dropped
+        # (columns of the removed samples are used to update the rows, they are dropped after)
+        alter = []
+        for sid in added:
+            alter += ["ADD COLUMN s{}_{}".format(sid, col) for col in ["gt integer", "dp integer", "dp_alt integer", "vaf real", "qual real", "filter integer", "is_composite boolean"]]
+        for dbuid in dbs_added:
+            alter += ["ADD COLUMN " + column for column in self.wt_annotation_columns(dbuid)]
+        for dbuid in dbs_removed:
+            alter += ["DROP COLUMN IF EXISTS _{}".format(fuid) for fuid in self.db_map[dbuid]["fields"]]
+        alter += ["ADD COLUMN attr_{} boolean DEFAULT False".format(col) for col in attrs_added]
+        alter += ["DROP COLUMN IF EXISTS attr_{}".format(col) for col in attrs_removed]
+        queries = ["COMMENT ON TABLE {} IS NULL".format(wt)]
+        if alter:
+            queries.append("ALTER TABLE {} {}".format(wt, ", ".join(alter)))
+        after = [scheduler.add("update wt schema", 1, queries)]
+
+        # Variants : each query updates the result of the previous one
+        if removed:
+            query  = "DROP TABLE IF EXISTS {0}_del; CREATE UNLOGGED TABLE {0}_del AS SELECT variant_id, vcf_line FROM sample_variant{1} WHERE sample_id IN ({2}) "
+            query += "EXCEPT SELECT variant_id, vcf_line FROM sample_variant{1} WHERE sample_id IN ({3}); "
+            query += "DELETE FROM {0} w USING {0}_del d WHERE w.variant_id=d.variant_id AND w.vcf_line=d.vcf_line; "
+            query += "DELETE FROM {0}_var v USING {0}_del d WHERE v.id=d.variant_id AND v.vcf_line=d.vcf_line; DROP TABLE {0}_del;"
+            after = [scheduler.add("remove variants of samples {}".format(sql_ids(removed)), 2, query.format(wt, analysis.db_suffix, sql_ids(removed), sql_ids(kept)), after=after, lock=wt)]
+        if added:
+            q_var, q_line = self.wt_samples_pivot(added)
+            q_set_var = ", ".join(["s{0}_gt=_sv.s{0}_gt, s{0}_dp=_sv.s{0}_dp, s{0}_dp_alt=_sv.s{0}_dp_alt, s{0}_vaf=_sv.s{0}_vaf, s{0}_is_composite=_sv.s{0}_is_composite".format(sid) for sid in added])
+            q_set_line = ", ".join(["s{0}_qual=_sl.s{0}_qual, s{0}_filter=_sl.s{0}_filter".format(sid) for sid in added])
+            query  = "UPDATE {0} w SET {1} FROM (SELECT variant_id, {2} FROM sample_variant{3} WHERE sample_id IN ({4}) GROUP BY variant_id) _sv WHERE w.variant_id=_sv.variant_id; "
+            query += "UPDATE {0} w SET {5} FROM (SELECT vcf_line, {6} FROM sample_variant{3} WHERE sample_id IN ({4}) GROUP BY vcf_line) _sl WHERE w.vcf_line=_sl.vcf_line;"
+            query = query.format(wt, q_set_var, ", ".join(q_var), analysis.db_suffix, sql_ids(added), q_set_line, ", ".join(q_line))
+            after = [scheduler.add("set columns of samples {}".format(sql_ids(added)), 2, query, after=after, lock=wt)]
+        if added or removed:
+            # samples of the analysis that have the variant (searched in the bitmap of the variant)
+            query = "UPDATE {0} w SET (sample_alist, sample_acount)=(SELECT a, cardinality(a) FROM bitmap_filter(v.sample_bitmap, ARRAY[{1}]) AS a) FROM variant{2} v WHERE v.chr=w.chr AND v.id=w.variant_id AND ({3})"
+            query = query.format(wt, sql_ids(analysis.samples_ids), analysis.db_suffix, " OR ".join(["w.s{}_gt IS NOT NULL".format(sid) for sid in added + removed]))
+            after = [scheduler.add("update samples occurences", 2, query, after=after, lock=wt)]
+        if removed:
+            query = "ALTER TABLE {} {}".format(wt, ", ".join(["DROP COLUMN s{}_{}".format(sid, col) for sid in removed for col in ["gt", "dp", "dp_alt", "vaf", "qual", "filter", "is_composite"]]))
+            after = [scheduler.add("drop columns of samples {}".format(sql_ids(removed)), 2, query, after=after, lock=wt)]
+        if added:
+            query  = "DROP TABLE IF EXISTS {0}_new; CREATE UNLOGGED TABLE {0}_new AS SELECT DISTINCT variant_id AS id, chr, vcf_line FROM sample_variant{1} WHERE sample_id IN ({2}) "
+            query += "EXCEPT SELECT id, chr, vcf_line FROM {0}_var; INSERT INTO {0}_var (id, chr, vcf_line) SELECT id, chr, vcf_line FROM {0}_new;"
+            after = [scheduler.add("get new variants ids", 2, query.format(wt, analysis.db_suffix, sql_ids(added)), after=after)]
+            after = [scheduler.add("insert new variants", 2, self.wt_variants_query(analysis, "{}_new".format(wt)), after=after, lock=wt)]
+        if added or removed:
+            query = "UPDATE analysis SET total_variants=(SELECT COUNT(*) FROM {0}_var) WHERE id={1};".format(wt, analysis.id)
+            scheduler.add("count variants", 2, query, after=after)
+        variants = after
+
+        # Predefined filters
+        if added or removed or state["trio"] != target["trio"]:
+            self.update_wt_compute_prefilters(analysis, scheduler, variants)
+        if added:
+            self.update_wt_compute_exonic(analysis, scheduler, variants, new_rows.format("w"))
+        if attrs_added or attrs_updated:
+            self.update_wt_compute_attributes(analysis, scheduler, variants, attrs_added + attrs_updated)
+        self.create_wt_variants_indexes(analysis, scheduler, added, attrs_added)
+
+        # Trx : trx of the removed databases are deleted, variants merged with their single trx are split again before
+        # the insert of new trx (see update_wt_mergin_trx_variant)
+        after = scheduler.step(5)
+        if trx_removed:
+            pk_uids = ",".join(["'{}'".format(self.db_map[dbuid]["db_pk_field_uid"]) for dbuid in trx_removed])
+            query = "DELETE FROM {0} WHERE NOT is_variant AND trx_pk_uid IN ({1}); UPDATE {0} SET trx_pk_uid=NULL, trx_pk_value=NULL WHERE is_variant AND trx_pk_uid IN ({1});"
+            after = [scheduler.add("remove trx of removed databases", 6, query.format(wt, pk_uids), after=after, lock=wt)]
+        if trx_added or (added and trx_kept):
+            where = "" if trx_added else " AND variant_id IN (SELECT id FROM {}_new)".format(wt)
+            query  = "DROP TABLE IF EXISTS {0}_trx; CREATE UNLOGGED TABLE {0}_trx AS SELECT * FROM {0} WHERE is_variant AND trx_pk_uid IS NOT NULL{1}; "
+            query += "UPDATE {0}_trx SET is_variant=False; INSERT INTO {0} SELECT * FROM {0}_trx; DROP TABLE {0}_trx; "
+            query += "UPDATE {0} SET trx_pk_uid=NULL, trx_pk_value=NULL WHERE is_variant AND trx_pk_uid IS NOT NULL{1};"
+            after = [scheduler.add("split variants merged with their single trx", 6, query.format(wt, where), after=after, lock=wt)]
+        if trx_added:
+            self.insert_wt_trx(analysis, scheduler, trx_added, after=after)
+        if added and trx_kept:
+            self.insert_wt_trx(analysis, scheduler, trx_kept, new_rows.format("_wt"), after=after)
+
+        # Annotations of the variants databases are set on the variants and their trx (once all trx are inserted)
+        trx = scheduler.step(6)
+        for dbuid in dbs_added:
+            if self.db_map[dbuid]["type"] == "variant":
+                dbname = "_db_{}".format(dbuid)
+                table, condition = self.db_map[dbuid]["join"].format(dbname, "w").split(" ON ", 1)
+                q_set = ", ".join(["_{}={}.{}".format(fuid, dbname, self.fields_map[fuid]["name"]) for fuid in self.db_map[dbuid]["fields"]])
+                query = "UPDATE {0} w SET {1} FROM {2} WHERE {3}".format(wt, q_set, table, condition)
+                scheduler.add("set {} annotations".format(self.db_map[dbuid]["name"]), 7, query, after=trx, lock=wt)
+        if trx_added:
+            # all the variants have been split
+            self.update_wt_mergin_trx_variant(analysis, scheduler, None if added else trx_added)
+        elif added:
+            self.update_wt_mergin_trx_variant(analysis, scheduler, None, "variant_id IN (SELECT id FROM {}_new)".format(wt))
+        elif trx_removed:
+            # variants left with a single trx
+            self.update_wt_mergin_trx_variant(analysis, scheduler, [])
+
+        # Panels columns of the rows of the new variants (and of their trx)
+        if added:
+            for row in execute("SELECT column_name FROM information_schema.columns WHERE table_name='{}' AND column_name LIKE 'panel\\_%'".format(wt)):
+                panel_id = row.column_name[len("panel_"):].replace("_", "-")
+                load = scheduler.add("load {} regions".format(row.column_name), 7, func=partial(self.create_panel_table, panel_id, analysis.reference))
+                query = "UPDATE {0} w SET {1}=True FROM {2} p WHERE w.chr=p.chr AND p.loc @> w.pos AND w.variant_id IN (SELECT id FROM {0}_new)".format(wt, row.column_name, self.panel_table(panel_id, analysis.reference))
+                scheduler.add("compute panel {}".format(row.column_name), 7, query, after=trx + [load], lock=wt)
+
+        self.create_wt_stored_filters(analysis, scheduler)
+        if added or removed or dbs_added or dbs_removed:
+            self.update_wt_samples_stats(analysis, scheduler, analysis.samples_ids if trx_added or trx_removed else [])
+        return True
+
+
+
+
+
+
+
+    def panel_table(self, panel_id, ref):
+        return "panel_{}_{}".format(ref, panel_id.replace("-", "_"))
 
 
     def create_panel_table(self, panel_id, ref):
-        panel_table = "panel_{}_{}".format(ref, panel_id.replace("-", "_"))
+        """
+            Create the table of the regions of the panel version (chr, loc), with a GiST index on the regions. Genes are
+            resolved with the transcripts of the refgene table. The table is a cache shared by the analyses : it is only
+            built once by panel version (entries of a version are never updated) and reference. Return its name
+        """
+        panel_table = self.panel_table(panel_id, ref)
 
-        # Do nothing if panel table alread exits
-        sql = "SELECT * FROM information_schema.tables WHERE table_name='panel_{}'".format(panel_id)
-        panel_exists = execute(sql).rowcount > 0
-        if panel_exists: return
+        # Do nothing if panel table already exists (unlogged tables are emptied when the server crashes : built again)
+        if execute("SELECT to_regclass('{}') IS NOT NULL AS found".format(panel_table)).first().found:
+            if execute("SELECT EXISTS (SELECT 1 FROM {}) AS found".format(panel_table)).first().found:
+                return panel_table
 
         # Retrieve panel data
         sql = "SELECT * FROM panel_entry WHERE id='{}'".format(panel_id)
@@ -719,24 +925,26 @@ class FilterEngine:
             raise RegovarException("Unable to retrieve panel with id \"{}\"".format(panel_id))
         panel_data = result.first().data
 
-        # Create sql query
-        query = "DROP TABLE IF EXISTS {0} CASCADE; CREATE UNLOGGED TABLE {0} (\
-            chr bigint, \
-            loc int8range); \
-            INSERT INTO {0} (chr, loc) VALUES ".format(panel_table)
-
+        # Regions and genes of the panel are inserted with a single query
+        regions = []
         genes = []
         for entry in panel_data:
             if entry["type"] == "gene":
-                genes.append(entry["symbol"])
+                genes.append("'{}'".format(sql_escape(entry["symbol"])))
             else:
-                query += "({}, int8range({}, {})), ".format(entry["chr"], entry["start"], entry["end"])
-        
+                regions.append("({}::bigint, int8range({}, {}))".format(entry["chr"], entry["start"], entry["end"]))
+        sql_select = []
+        if len(regions) > 0:
+            sql_select.append("SELECT * FROM (VALUES {}) _r (chr, loc)".format(", ".join(regions)))
         if len(genes) > 0:
-            for ge in execute("SELECT chr, trxrange FROM refgene_{} WHERE name2 IN ({})".format(ref, ",".join(["'{}'".format(t) for t in genes]))):
-                query += "({}, int8range({}, {})), ".format(ge.chr, ge.trxrange.lower, ge.trxrange.upper)
+            sql_select.append("SELECT chr, trxrange FROM refgene_{} WHERE name2=ANY(ARRAY[{}]::text[])".format(ref, ",".join(genes)))
 
-        execute(query[:-2])
+        query = "DROP TABLE IF EXISTS {0} CASCADE; CREATE UNLOGGED TABLE {0} (chr bigint, loc int8range); ".format(panel_table)
+        if len(sql_select) > 0:
+            query += "INSERT INTO {0} (chr, loc) SELECT DISTINCT chr, loc FROM ({1}) _p; ".format(panel_table, " UNION ALL ".join(sql_select))
+        query += "CREATE INDEX {0}_idx_loc ON {0} USING gist (loc); ANALYZE {0};".format(panel_table)
+        execute(query)
+        return panel_table
 
 
 
@@ -751,11 +959,10 @@ class FilterEngine:
         if col_exists: return
         
         # Ensure that panels exists
-        self.create_panel_table(panel_id, ref)
+        panel = self.create_panel_table(panel_id, ref)
 
-        # Create sql query
-        panel = "panel_{}_{}".format(ref, panel_id.replace("-", "_"))
-        query = "ALTER TABLE {0} ADD COLUMN {1} boolean; update {0} w SET {1}=True FROM {2} p WHERE w.chr=p.chr AND w.pos <@ p.loc;".format(wt, col, panel)
+        # Create sql query (range join with the regions of the panel)
+        query = "ALTER TABLE {0} ADD COLUMN {1} boolean; UPDATE {0} w SET {1}=True FROM {2} p WHERE w.chr=p.chr AND p.loc @> w.pos;".format(wt, col, panel)
         execute(query)
 
 
@@ -1010,6 +1217,7 @@ class FilterEngine:
         # Format result
         result = []
         
+        filter_codes = self.get_filter_codes(analysis, fields)
         with Timer() as t:
             if sql_result is not None:
                 for row in sql_result:
@@ -1024,6 +1232,8 @@ class FilterEngine:
                             r = {}
                             for sid in analysis.samples_ids:
                                 r[sid] = FilterEngine.parse_result(eval(pattern.format(sid)))
+                                if f_uid in filter_codes:
+                                    r[sid] = Sample.filter_names(r[sid], filter_codes[f_uid][sid])
                             entry[f_uid] = r
                         else:
                             if f_uid == "7166ec6d1ce65529ca2800897c47a0a2": # field = pos
@@ -1041,6 +1251,19 @@ class FilterEngine:
 
 
 
+    def get_filter_codes(self, analysis, fields):
+        """
+            FILTER of the samples are stored as filter masks (see Sample.filter_codes). Return for the fields that are 
+            FILTER fields the list of the filters of each sample of the analysis : {field_uid: {sample_id: [filters]}}
+        """
+        fuids = [f_uid for f_uid in fields if self.fields_map[f_uid]["name"] == "s{}_filter"]
+        if len(fuids) == 0:
+            return {}
+        sql = "SELECT id, filter_description FROM sample WHERE id IN ({})".format(",".join([str(sid) for sid in analysis.samples_ids]))
+        codes = {row.id: Sample.filter_codes((row.filter_description or {}).keys()) for row in execute(sql)}
+        return {f_uid: codes for f_uid in fuids}
+
+
     def parse_fields(self, analysis, fields, prefix):
         """
             Parse the json fields and return the corresponding postgreSQL query
@@ -1071,9 +1294,7 @@ class FilterEngine:
         if self.fields_map[uid]["db_name_ui"] in ["Variant", "Regovar"]:
             # Manage special case for fields splitted by sample
             if self.fields_map[uid]["name"].startswith("s{}_"):
-                # Manage special case for filter field which have type JSON that is not complient with GROUP BY sql operator
-                suffix = " #>> '{}'" if self.fields_map[uid]["name"] == "s{}_filter" else ""
-                return self.fields_map[uid]["name"].format(analysis.samples_ids[0]) + suffix
+                return self.fields_map[uid]["name"].format(analysis.samples_ids[0])
             else:
                 return self.fields_map[uid]["name"]
         return "_" + uid
@@ -1109,6 +1330,11 @@ class FilterEngine:
                 metadata = self.fields_map[data[1][1]]
                 
                 
+                # Manage special case for FILTER fields : bit test of the filter in the filter mask of each sample
+                if metadata['name'] == 's{}_filter' and operator in ['==', '!='] and data[2][0] == 'value':
+                    codes = self.get_filter_codes(analysis, [data[1][1]])[data[1][1]]
+                    test = ' <> 0' if operator == '==' else ' = 0'
+                    return ' (' + ' OR '.join(['(s{0}_filter & {1}){2}'.format(s, 1 << codes[s].index(data[2][1]), test) if data[2][1] in codes[s] else ('False' if operator == '==' else 'True') for s in analysis.samples_ids]) + ') '
                 # Manage special case for fields splitted by sample
                 if metadata['name'].startswith('s{}_'):
                     return ' (' + ' OR '.join(['{0}{1}{2}'.format(metadata['name'].format(s), FilterEngine.op_map[operator], parse_value(metadata["type"], data[2])) for s in analysis.samples_ids]) + ') '
@@ -1180,6 +1406,7 @@ class FilterEngine:
         
         result = []
         sql_result = await execute_aio(query)
+        filter_codes = self.get_filter_codes(analysis, analysis.fields)
         for row in sql_result:
             entry = {"id" : "{}_{}".format(row.variant_id, row.trx_pk_value), "is_selected": True}
             for f_uid in analysis.fields:
@@ -1189,6 +1416,8 @@ class FilterEngine:
                     r = {}
                     for sid in analysis.samples_ids:
                         r[sid] = FilterEngine.parse_result(eval(pattern.format(sid)))
+                        if f_uid in filter_codes:
+                            r[sid] = Sample.filter_names(r[sid], filter_codes[f_uid][sid])
                     entry[f_uid] = r
                 else:
                     if f_uid == "7166ec6d1ce65529ca2800897c47a0a2": # field = pos
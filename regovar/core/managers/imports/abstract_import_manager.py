@@ -5,12 +5,13 @@ try:
 except ImportError:
     pass
 
-
+
 from core.framework.common import log, war, err
-
-
-
-
+from core.managers.imports.vcf_import_annotations import AnnotationColumnsParser, type_column
+
+
+
+
 class AbstractImportManager():
     def __init__(self):
         # Description of the import script.
@@ -19,17 +20,17 @@ class AbstractImportManager():
             "input" :  ["vcf"],  # list of file extension that manage the import manager
             "description" : "Import variants from vcf file" # short desciption about what is imported
         }
-
+
     @staticmethod
     async def import_data(file_id, **kargs):
         raise NotImplementedError("The abstract method \"import_date\" of AbstractImportManager must be implemented.")
-
-
-
-
-
-
-
+
+
+
+
+
+
+
 class AbstractTranscriptDataImporter():
     
     def __init__(self):
@@ -46,6 +47,8 @@ class AbstractTranscriptDataImporter():
                                     #   if this column is not present in the VCF, the import cannot be done
         self.db_uid = ""              # UID of the annotation db in Regovar database
         self.columns_mapping = {}     # Mapping information for vcf columns into Regovar database
+        self.trx_pk_column = 'feature' # The column of the vcf annotations that contains the transcript id
+        self.columns_parser = None    # Columnar parser of the annotations (see get_columns_parser)
         
         # This attribute shall contains the definition of all supported data comming from the VCF
         # Structure MUST BE :
@@ -60,7 +63,7 @@ class AbstractTranscriptDataImporter():
     # TOOLS 
     # ===========================================================================================================
     
-
+
     
     
     
@@ -79,9 +82,9 @@ class AbstractTranscriptDataImporter():
             else:
                 return ''
         return ''.join(check_char(c) for c in name)
-
-
-
+
+
+
     def escape_value_for_sql(self, value):
         if type(value) is str:
             value = value.replace(':', ': ') # As :X is a interpreted as a variable by sqlalchemy
@@ -89,7 +92,11 @@ class AbstractTranscriptDataImporter():
         return value
     
     
-    def value_to_regovar_type(self, value, regovar_type):
+    def cast_value(self, value, regovar_type):
+        """
+            Cast the string value read in the vcf into the python value corresponding to the regovar type.
+            Return a tuple (success, value). Empty values ('' or '-') are returned as None
+        """
         if value is None or value.strip() in ['', '-']: return True, None
          
         success = True
@@ -102,15 +109,60 @@ class AbstractTranscriptDataImporter():
             elif regovar_type == "bool":
                 result = bool(value)
             elif regovar_type == "list":
-                result = "ARRAY [{}]".format(",".join(["'{}'".format(self.escape_value_for_sql(v)) for v in value.split('&')]))
-            else:
-                result = "'{}'".format(self.escape_value_for_sql(value))
+                result = value.split('&')
         except Exception as ex:
-            war("VEP import : enable to import {} cast into {}".format(value, regovar_type))
+            war("{} import : enable to import {} cast into {}".format(self.name, value, regovar_type))
             success = False
             result = None
             
         return success, result
+
+
+    def value_to_sql(self, value):
+        """
+            Return the sql literal of the provided python value (as returned by cast_value)
+        """
+        if value is None:
+            return "NULL"
+        if isinstance(value, (bool, int, float)):
+            return str(value)
+        if isinstance(value, list):
+            return "ARRAY [{}]".format(",".join(["'{}'".format(self.escape_value_for_sql(v)) for v in value]))
+        return "'{}'".format(self.escape_value_for_sql(value))
+
+
+    def column_converter(self, col_name):
+        """
+            Return the converter of the annotation column as a tuple (database fields, converter) (see vcf_import_annotations)
+            or None if the column is not imported. By default, the column is converted according to its mapped type
+        """
+        col_mapping = self.columns_mapping.get(col_name)
+        if not col_mapping:
+            return None
+        return [col_name], type_column(col_mapping["type"])
+
+
+    def get_columns_parser(self):
+        """
+            Return the columnar parser of the annotations (created once the importer is initialised)
+        """
+        if self.columns_parser is None:
+            self.columns_parser = AnnotationColumnsParser(self)
+        return self.columns_parser
+
+
+    def import_annotations(self, sql_pattern, bin, chrm, pos, ref, alt, infos):
+        """
+            Return the query according to the provided pattern filled with annotation informations
+            Also return the count of new entry inserted by the query 
+        """
+        count = 0
+        query = ""
+        for allele, trx_pk, fields, values in self.parse_annotations(alt, infos):
+            trx_pk = self.escape_value_for_sql(trx_pk) if trx_pk is not None else "NULL"
+            query += sql_pattern.format(self.table_name, ','.join(fields), ','.join([self.value_to_sql(v) for v in values]), bin, chrm, pos, ref, self.escape_value_for_sql(allele), trx_pk)
+            count += 1
+        return query, count
     
     
     # ===========================================================================================================
@@ -131,14 +183,14 @@ class AbstractTranscriptDataImporter():
         raise NotImplementedError("The abstract method \"check_annotation_table\" of AbstractTranscriptDataImporter must be implemented.")
         
         
-    def import_annotations(self, sql_pattern, bin, chrm, pos, ref, alt, infos):
+    def parse_annotations(self, alt, infos):
         """
-            Return the query according to the provided pattern filled with annotation informations
-            Also return the count of new entry inserted by the query 
+            Parse annotations of the vcf's INFO field and return the list of transcripts annotations
+            as tuples (allele, trx_pk, fields, values) where values are python values (see cast_value)
         """
-        raise NotImplementedError("The abstract method \"import_annotations\" of AbstractTranscriptDataImporter must be implemented.")
+        raise NotImplementedError("The abstract method \"parse_annotations\" of AbstractTranscriptDataImporter must be implemented.")
     
         
         
         
-        
\ No newline at end of file
+        
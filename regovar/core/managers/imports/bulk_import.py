@@ -0,0 +1,182 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import re
+import time
+import asyncio
+import multiprocessing as mp
+import concurrent.futures
+
+from core.framework.common import *
+import core.model as Model
+from config import *
+
+
+
+
+# =======================================================================================================
+# Bulk load of vcf files (administration, see regovar_cli.py import)
+# =======================================================================================================
+#
+# For the first import of many files on a reference, the secondary indexes of sample_variant are dropped, the
+# files are imported by several workers at once, then the indexes are rebuilt and the tables analyzed.
+#  - the primary key/unique constraints are kept : the upserts of the imports rely on them
+#  - the definitions of the dropped indexes are saved in the parameter table (one row by index) until they are
+#    rebuilt, so bulk_create_indexes can rebuild them after an interrupted bulk load
+#  - sample_variant is partitioned : the index is created ON ONLY the parent table (invalid), built CONCURRENTLY on
+#    each partition (several partitions at once, without locking the writes), then the partition indexes are attached
+#    to the parent index (that is valid once all of them are attached)
+
+BULK_IMPORT_PARAMETER = "bulk_import_index:{}:{}"
+BULK_IMPORT_PROGRESS_DELAY = 10
+
+
+
+def reference_tables(reference_id):
+    """
+        Return the suffix of the tables of the reference
+    """
+    reference = Model.execute("SELECT table_suffix FROM reference WHERE id={}".format(reference_id)).first()
+    if not reference:
+        raise RegovarException("Unknow reference : {}".format(reference_id))
+    return "_" + reference.table_suffix
+
+
+def bulk_drop_indexes(table):
+    """
+        Drop the secondary indexes of the table and save their definitions in the parameter table
+    """
+    definitions = Model.drop_table_indexes(table, constraints=False)
+    for definition in definitions:
+        name = re.match(r"CREATE (?:UNIQUE )?INDEX (\S+) ON", definition).group(1)
+        Model.execute("INSERT INTO parameter (key, value, description) VALUES ('{0}', '{1}', 'Index dropped by a bulk import') ON CONFLICT (key) DO UPDATE SET value=excluded.value".format(
+            BULK_IMPORT_PARAMETER.format(table, name), Model.sql_escape(definition.rstrip(";"))))
+    log("Bulk import : {} index(es) of {} dropped".format(len(definitions), table))
+    return definitions
+
+
+def build_partition_index(table, name, partition, definition):
+    """
+        Build concurrently the index of the partition and attach it to the index of the parent table
+    """
+    using = re.match(r"CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (.*)$", definition)
+    index = partition + name[len(table):]
+    con = Model.new_connection()
+    con.autocommit = True
+    try:
+        with con.cursor() as cursor:
+            # an index left invalid by an interrupted build must be built again
+            cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid=to_regclass(%s)", (index,))
+            row = cursor.fetchone()
+            if row and not row[0]:
+                cursor.execute("DROP INDEX CONCURRENTLY {}".format(index))
+            cursor.execute("CREATE {}INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}".format(using.group(1) or "", index, partition, using.group(2)))
+            cursor.execute("ALTER INDEX {} ATTACH PARTITION {}".format(name, index))
+    finally:
+        con.close()
+
+
+def bulk_create_indexes(table, workers=VCF_IMPORT_WORKERS):
+    """
+        Rebuild the indexes of the table dropped by bulk_drop_indexes (see above), with workers partitions
+        indexed at once, and update the statistics of the table
+    """
+    definitions = Model.execute("SELECT key, value FROM parameter WHERE key LIKE '{}%'".format(BULK_IMPORT_PARAMETER.format(table, ""))).fetchall()
+    partitions = [r.partition for r in Model.execute("SELECT inhrelid::regclass::text AS partition FROM pg_inherits WHERE inhparent='{}'::regclass ORDER BY 1".format(table))]
+    tasks = []
+    for row in definitions:
+        name = row.key.split(":")[-1]
+        using = re.match(r"CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (.*)$", row.value)
+        Model.execute("CREATE {}INDEX IF NOT EXISTS {} ON ONLY {} {}".format(using.group(1) or "", name, table, using.group(2)))
+        tasks.extend([(name, partition, row.value) for partition in partitions])
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(build_partition_index, table, *task) for task in tasks]
+        for idx, future in enumerate(concurrent.futures.as_completed(futures)):
+            future.result()
+            if (idx + 1) % 10 == 0 or idx + 1 == len(futures):
+                log("Bulk import : {}/{} partition indexes of {} built ({:.0f}s)".format(idx + 1, len(futures), table, time.time() - start))
+
+    Model.execute("DELETE FROM parameter WHERE key LIKE '{}%'".format(BULK_IMPORT_PARAMETER.format(table, "")))
+    Model.execute("ANALYZE {}".format(table))
+    log("Bulk import : {} index(es) of {} rebuilt".format(len(definitions), table))
+
+
+
+
+def bulk_import_worker(reference_limit):
+    """
+        Entry point of the worker processes of the bulk import
+    """
+    from core.managers.imports.import_queue import run_import_worker
+    Model.init_forked_process()
+    run_import_worker(reference_limit=reference_limit)
+
+
+def bulk_import_progress(jobs):
+    """
+        Return the number of jobs of the bulk import by status, and the mean loading progress of their samples
+    """
+    ids = ",".join([str(j) for j in jobs])
+    status = {row.status: row.count for row in Model.execute("SELECT status, count(*) AS count FROM import_queue WHERE id IN ({}) GROUP BY status".format(ids))}
+    progress = Model.execute("SELECT avg(s.loading_progress) AS progress FROM sample s INNER JOIN import_queue q ON q.file_id=s.file_id AND q.reference_id=s.reference_id WHERE q.id IN ({})".format(ids)).first().progress
+    return status, progress or 0
+
+
+def bulk_import(reference_id, paths, workers=VCF_IMPORT_WORKERS, import_mode=None):
+    """
+        Import the local vcf files on the reference with the bulk load mode (see above).
+        Return the number of jobs by status
+    """
+    from core.core import core
+    from core.managers.imports.vcf_manager import VcfManager
+    db_ref_suffix = reference_tables(reference_id)
+    table = "sample_variant" + db_ref_suffix
+    if Model.execute("SELECT count(*) AS count FROM import_queue WHERE reference_id={} AND status IN ('waiting', 'running')".format(reference_id)).first().count:
+        raise RegovarException("Imports are in progress on the reference {} : the bulk import cannot be started".format(reference_id))
+
+    bulk_drop_indexes(table)
+    loop = asyncio.get_event_loop()
+    files = []
+    for path in paths:
+        try:
+            f = core.files.from_local(path, False)
+            if f and loop.run_until_complete(VcfManager().import_data(f.id, reference_id=reference_id, import_mode=import_mode)).get("success"):
+                files.append(f.id)
+            else:
+                war("Bulk import : file {} not supported".format(path))
+        except Exception as ex:
+            err("Bulk import : not able to import the file {}".format(path), ex)
+    jobs = [r.id for r in Model.execute("SELECT id FROM import_queue WHERE reference_id={} AND file_id IN ({}) AND status IN ('waiting', 'running')".format(reference_id, ",".join([str(f) for f in files] or ["NULL"])))]
+    log("Bulk import : {} file(s) queued on reference {}, {} workers".format(len(jobs), reference_id, workers))
+
+    status = {}
+    processes = []
+    context = mp.get_context("fork")
+    try:
+        while jobs:
+            # (re)start the workers that stopped
+            processes = [p for p in processes if p.is_alive()]
+            while len(processes) < workers:
+                processes.append(context.Process(target=bulk_import_worker, args=(workers,)))
+                processes[-1].start()
+            time.sleep(BULK_IMPORT_PROGRESS_DELAY)
+            status, progress = bulk_import_progress(jobs)
+            log("Bulk import : {} done, {} error(s), {} running, {} waiting ({:.1f}%)".format(status.get("done", 0), status.get("error", 0), status.get("running", 0), status.get("waiting", 0), progress * 100))
+            if not status.get("running", 0) and not status.get("waiting", 0):
+                break
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+
+    bulk_create_indexes(table, workers)
+    Model.execute("ANALYZE variant{}".format(db_ref_suffix))
+    return status
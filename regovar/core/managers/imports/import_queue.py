@@ -0,0 +1,192 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import os
+import json
+import socket
+import select
+
+from core.framework.common import *
+import core.model as Model
+from config import *
+
+
+
+
+# =======================================================================================================
+# Import queue
+# =======================================================================================================
+#
+# Imports requested by the server are saved in the import_queue table and run by the import workers
+# (standalone processes started by import_worker.py), not by the server process.
+#  - a worker claims the waiting job with the highest priority, with FOR UPDATE SKIP LOCKED, as long as the number of
+#    running jobs on its reference is lower than VCF_IMPORT_REFERENCE_LIMIT (claims are serialized by an advisory lock
+#    to apply this limit)
+#  - while running a job, the worker holds the advisory lock (IMPORT_QUEUE_LOCK, job id) on its connection. Running jobs
+#    without this lock belong to a dead worker : they are queued again and resumed from their import checkpoints
+#  - workers sleep at most VCF_IMPORT_POLL_DELAY seconds when the queue is empty, and are woken up by the NOTIFY
+#    sent when a job is queued
+#  - workers can't notify the websockets clients : events of the imports (progress, end, error) are sent to the server
+#    with NOTIFY on IMPORT_EVENTS_CHANNEL, and the server forwards them (see listen_import_events)
+
+IMPORT_QUEUE_LOCK = 4242
+IMPORT_QUEUE_CHANNEL = "import_queue"
+IMPORT_EVENTS_CHANNEL = "import_events"
+IMPORT_EVENTS_CONNECTIONS = {}  # connection used to send the events, by process (see notify_import_event)
+
+
+
+def queue_import(file_id, reference_id, import_mode=None, priority=0):
+    """
+        Queue the import of the file. Return the id of the job (the one already waiting/running for the file if any)
+    """
+    sql = "SELECT id FROM import_queue WHERE file_id={} AND reference_id={} AND status IN ('waiting', 'running')".format(file_id, reference_id)
+    job = Model.execute(sql).first()
+    if job:
+        log("VCF import of file {} is already queued (job {})".format(file_id, job.id))
+        return job.id
+    sql = "INSERT INTO import_queue (file_id, reference_id, import_mode, priority) VALUES ({}, {}, {}, {}) RETURNING id"
+    job = Model.execute(sql.format(file_id, reference_id, "'{}'".format(import_mode) if import_mode else "NULL", int(priority))).first()
+    Model.execute("NOTIFY {}".format(IMPORT_QUEUE_CHANNEL))
+    return job.id
+
+
+def claim_import_job(con, worker, reference_limit=VCF_IMPORT_REFERENCE_LIMIT):
+    """
+        Take the next job of the queue for the worker (see above), or return None if there is nothing to run.
+        con is the raw connection of the worker : it keeps the lock of the job until release_import_job
+    """
+    with con.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock({}, 0)".format(IMPORT_QUEUE_LOCK))
+        # jobs of dead workers
+        cursor.execute("UPDATE import_queue q SET status='waiting', worker=NULL, update_date=CURRENT_TIMESTAMP WHERE q.status='running' AND NOT EXISTS ( \
+            SELECT 1 FROM pg_locks l WHERE l.locktype='advisory' AND l.database=(SELECT oid FROM pg_database WHERE datname=current_database()) \
+            AND l.classid={0} AND l.objid=q.id::oid AND l.objsubid=2 AND l.granted) RETURNING id".format(IMPORT_QUEUE_LOCK))
+        for row in cursor.fetchall():
+            war("VCF import job {} has been interrupted : queued again".format(row[0]))
+        cursor.execute("UPDATE import_queue SET status='running', worker=%s, update_date=CURRENT_TIMESTAMP WHERE id=( \
+            SELECT q.id FROM import_queue q WHERE q.status='waiting' \
+            AND (SELECT COUNT(*) FROM import_queue r WHERE r.status='running' AND r.reference_id=q.reference_id) < %s \
+            ORDER BY q.priority DESC, q.id LIMIT 1 FOR UPDATE SKIP LOCKED) \
+            RETURNING id, file_id, reference_id, import_mode", (worker, reference_limit))
+        job = cursor.fetchone()
+        if job:
+            # session lock : kept after the commit, until the end of the job
+            cursor.execute("SELECT pg_advisory_lock({}, {})".format(IMPORT_QUEUE_LOCK, job[0]))
+    con.commit()
+    return {"id": job[0], "file_id": job[1], "reference_id": job[2], "import_mode": job[3]} if job else None
+
+
+def release_import_job(con, job, error=None):
+    """
+        Save the result of the job and release its lock
+    """
+    with con.cursor() as cursor:
+        cursor.execute("UPDATE import_queue SET status=%s, error=%s, update_date=CURRENT_TIMESTAMP WHERE id=%s", ("error" if error else "done", error, job["id"]))
+        cursor.execute("SELECT pg_advisory_unlock({}, {})".format(IMPORT_QUEUE_LOCK, job["id"]))
+    con.commit()
+
+
+def wait_import_job(con, delay=VCF_IMPORT_POLL_DELAY):
+    """
+        Wait until a job is queued (NOTIFY) or the delay is over
+    """
+    if select.select([con], [], [], delay) != ([], [], []):
+        con.poll()
+        con.notifies.clear()
+
+
+def run_import_job(job):
+    """
+        Run the vcf import of the job. Return the error message if the import failed
+    """
+    from core.managers.imports.vcf_manager import VcfManager
+    try:
+        VcfManager().import_queued(job["file_id"], job["reference_id"], job["import_mode"] or VCF_IMPORT_MODE)
+    except Exception as ex:
+        err("VCF import job {} (file {}) failed".format(job["id"], job["file_id"]), ex)
+        Model.Session().rollback()
+        return str(ex) or type(ex).__name__
+    return None
+
+
+def run_import_worker(worker=None, reference_limit=VCF_IMPORT_REFERENCE_LIMIT):
+    """
+        Main loop of an import worker process : run the jobs of the queue one by one
+    """
+    worker = worker or "{}:{}".format(socket.gethostname(), os.getpid())
+    con = Model.new_connection()
+    with con.cursor() as cursor:
+        cursor.execute("LISTEN {}".format(IMPORT_QUEUE_CHANNEL))
+    con.commit()
+    log("Import worker {} started".format(worker))
+    try:
+        while True:
+            job = claim_import_job(con, worker, reference_limit)
+            if job is None:
+                wait_import_job(con)
+                continue
+            log("Import worker {} : start job {} (file {}, reference {})".format(worker, job["id"], job["file_id"], job["reference_id"]))
+            error = run_import_job(job)
+            release_import_job(con, job, error)
+            log("Import worker {} : job {} {}".format(worker, job["id"], "failed" if error else "done"))
+    finally:
+        con.close()
+
+
+
+
+# =======================================================================================================
+# Import events
+# =======================================================================================================
+
+def notify_import_event(action, file_id, reference_id, **data):
+    """
+        Send an event of the import of the file to the server. The NOTIFY is sent at once with an autocommit connection
+        of the process : the transaction of the session is not committed. Payloads of NOTIFY are limited to 8000 bytes :
+        the server gets the samples of the file itself
+    """
+    payload = json.dumps(dict(data, action=action, file_id=file_id, reference_id=reference_id))
+    con = IMPORT_EVENTS_CONNECTIONS.get(os.getpid())
+    if con is None or con.closed:
+        con = Model.new_connection()
+        con.autocommit = True
+        IMPORT_EVENTS_CONNECTIONS[os.getpid()] = con
+    with con.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", (IMPORT_EVENTS_CHANNEL, payload))
+
+
+def listen_import_events(loop, callback):
+    """
+        Run the coroutine callback(event) in the loop for each event sent by the import workers (notify_import_event).
+        Return the listening connection : to give to unlisten_import_events to stop
+    """
+    con = Model.new_connection()
+    con.autocommit = True
+    with con.cursor() as cursor:
+        cursor.execute("LISTEN {}".format(IMPORT_EVENTS_CHANNEL))
+
+    def read_events():
+        try:
+            con.poll()
+        except Exception as ex:
+            err("Unable to read the events of the import workers", ex)
+            loop.remove_reader(con)
+            return
+        while con.notifies:
+            notify = con.notifies.pop(0)
+            loop.create_task(callback(json.loads(notify.payload)))
+
+    loop.add_reader(con, read_events)
+    return con
+
+
+def unlisten_import_events(loop, con):
+    loop.remove_reader(con)
+    con.close()
+
@@ -0,0 +1,165 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import datetime
+import concurrent.futures
+import io
+from pysam import VariantFile
+
+from core.framework.common import *
+import core.model as Model
+from config import *
+from core.managers.imports.vcf_manager import open_vcf_text, normalize_chr, prepare_annotation_db
+from core.managers.imports.vcf_import_normalise import normalise_variants, ucsc_bins, allele_lengths
+
+
+
+
+# =======================================================================================================
+# Annotation-only import of annotated vcf
+# =======================================================================================================
+#
+# Large annotation databases distributed as vcf (dbNSFP, gnomAD, ...) are loaded into an annotation table without
+# creating samples nor variants :
+#  - the table and its fields are the ones of prepare_annotation_db : one text column by INFO field of the vcf header
+#  - rows are joined with the variants on (bin, chr, pos, ref, alt) (see the jointure of annotation_database), so
+#    variant_id is not set
+#  - lines are parsed as text (pysam is only used for the header) and streamed by batches with COPY; the next batch
+#    is parsed (alleles normalised at once, see vcf_import_normalise) while the previous one is copied
+#  - indexes and unique constraints of the table are dropped during the load and built after it
+# Values of INFO fields with one value by alt allele (Number=A or R) are split between the alleles of the line.
+
+ANNOTATION_COPY_BATCH = 100000
+
+
+
+def annotation_vcf_metadata(filepath, name, version, description=""):
+    """
+        Return the metadata of the annotation database of the vcf (see prepare_annotation_db) and the Number of
+        its INFO fields
+    """
+    vcf = VariantFile(filepath)
+    fields = {key: str(vcf.header.info[key].number) for key in vcf.header.info.keys()}
+    vcf.close()
+    if len(fields) == 0:
+        raise RegovarException("Unable to import the annotations of the vcf {} : no INFO field in the header.".format(filepath))
+    metadata = {
+        'type' : 'column_annotation',
+        'name' : name,
+        'version' : version,
+        'description' : description.replace("'", "''"),
+        'db_type' : 'variant',
+        'columns' : list(fields.keys())
+    }
+    return metadata, fields
+
+
+def parse_annotation_lines(lines, columns):
+    """
+        Parse the lines of the vcf. columns is the list of (INFO key, Number) of the fields of the table.
+        Return the COPY text of the rows of the annotations (one by alt allele). Lines that cannot be imported are
+        ignored. Alleles of all the lines are normalised at once (see normalise_variants)
+    """
+    alleles = []
+    pos = []
+    ref = []
+    alt = []
+    for line in lines:
+        fields = line.split('\t', 8)
+        if len(fields) < 8: continue
+        chrm = normalize_chr(fields[0])
+        if chrm is None: continue
+        infos = {}
+        for info in fields[7].rstrip('\n').split(';'):
+            kv = info.split('=', 1)
+            infos[kv[0]] = kv[1] if len(kv) == 2 else 't'
+        for idx, allele in enumerate(fields[4].split(',')):
+            if allele in ['.', '*'] or allele.startswith('<'): continue
+            alleles.append((chrm, idx, infos))
+            pos.append(int(fields[1]))
+            ref.append(fields[3])
+            alt.append(allele)
+
+    pos, ref, alt = normalise_variants(pos, ref, alt)
+    bins = ucsc_bins(pos, pos + allele_lengths(ref))
+    result = []
+    for (chrm, idx, infos), p, r, a, b in zip(alleles, pos.tolist(), ref, alt, bins.tolist()):
+        row = [str(b), str(chrm), str(p), r, a]
+        for key, number in columns:
+            value = infos.get(key)
+            if value is not None and number in ['A', 'R']:
+                values = value.split(',')
+                i = idx if number == 'A' else idx + 1
+                value = values[i] if i < len(values) else None
+            row.append('\\N' if value in [None, '', '.'] else value.replace('\\', '\\\\'))
+        result.append('\t'.join(row) + '\n')
+    return "".join(result)
+
+
+def copy_annotation_batch(connection, table, columns, data):
+    """
+        COPY the rows of the batch into the annotation table. Return the number of rows
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert("COPY {} ({}) FROM STDIN".format(table, ",".join(columns)), io.StringIO(data))
+        connection.commit()
+        return data.count('\n')
+    except Exception as ex:
+        connection.rollback()
+        raise RegovarException("Unable to import the annotations with COPY.", exception=ex)
+    finally:
+        cursor.close()
+
+
+def import_annotation_vcf(filepath, reference_id, name, version, description="", batch_size=ANNOTATION_COPY_BATCH):
+    """
+        Import the annotations of the vcf into the annotation database name/version of the reference (see above).
+        Rows already imported in this database are replaced. Return the number of imported rows
+    """
+    start = datetime.datetime.now()
+    metadata, fields = annotation_vcf_metadata(filepath, name, version, description)
+    prepare_annotation_db(reference_id, metadata)
+    table = metadata['table']
+    columns = [(key, fields[key]) for key in metadata['columns']]
+    db_columns = ["bin", "chr", "pos", "ref", "alt"] + [metadata['db_map'][key]['name'] for key in metadata['columns']]
+    log("Annotations import : {} into {} ({} fields)".format(filepath, table, len(columns)))
+
+    Model.execute("TRUNCATE {};".format(table))
+    indexes = Model.drop_table_indexes(table)
+    connection = Model.new_connection()
+    count = 0
+    lines = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor, open_vcf_text(filepath) as f:
+            copy = None
+            batch = []
+            for line in f:
+                if line.startswith('#'): continue
+                batch.append(line)
+                lines += 1
+                if len(batch) >= batch_size:
+                    data = parse_annotation_lines(batch, columns)
+                    if copy: count += copy.result()
+                    copy = executor.submit(copy_annotation_batch, connection, table, db_columns, data)
+                    batch = []
+                    log("Annotations import : {} lines".format(lines))
+            if copy: count += copy.result()
+            data = parse_annotation_lines(batch, columns)
+            if data:
+                count += copy_annotation_batch(connection, table, db_columns, data)
+    except Exception as ex:
+        # indexes are not built on a partial table : a new import of the file builds them
+        err("Annotations import : import of {} failed, indexes of {} have not been rebuilt :\n{}".format(filepath, table, "\n".join(indexes)), ex)
+        raise
+    finally:
+        connection.close()
+    log("Annotations import : build indexes of {}".format(table))
+    Model.create_table_indexes(table, indexes)
+    log("Annotations import : {} rows imported from {} lines in {}".format(count, lines, datetime.datetime.now() - start))
+    return count
@@ -0,0 +1,178 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import numpy as np
+
+from core.framework.common import war, err
+
+
+
+
+# =======================================================================================================
+# Columnar parsing of transcripts annotations
+# =======================================================================================================
+#
+# Annotations of a block of records (VEP CSQ / SnpEff ANN entries) are split at once and transposed into
+# columns. Each column is converted with a single converter call for the whole block instead of a
+# type dispatch for each value of each transcript.
+#
+# Converted values are the postgresql text representation of the value (or None for NULL), so they can be
+# sent as json strings to json_populate_recordset. The COPY text of the values of each annotation is built
+# for all annotations at once too : as values come from a vcf line, they cannot contain tabs or new lines
+# and only backslashes need to be escaped.
+#
+# A converter is a function (values, alleles) -> list of columns, where values is the column of the raw
+# strings and alleles the column of the alleles of the annotations (see AbstractTranscriptDataImporter.column_converter)
+
+EMPTY_VALUES = {'', '-'}
+
+
+
+def info_values(info, key):
+    """
+        Return the list of the values of the key in the raw INFO field of a vcf line ([] if not present)
+    """
+    start = info.find(key + "=")
+    while start > 0 and info[start - 1] != ';':
+        start = info.find(key + "=", start + 1)
+    if start < 0:
+        return []
+    start += len(key) + 1
+    end = info.find(';', start)
+    return info[start:end if end >= 0 else len(info)].split(',')
+
+
+def pg_array_text(values):
+    """
+        Return the postgresql literal of an array of strings
+    """
+    return '{' + ','.join(['"{}"'.format(v.replace('\\', '\\\\').replace('"', '\\"')) for v in values]) + '}'
+
+
+def string_column(values, alleles=None):
+    return [[None if v == '' or v.strip() in EMPTY_VALUES else v for v in values]]
+
+
+def bool_column(values, alleles=None):
+    return [[None if v.strip() in EMPTY_VALUES else 't' for v in values]]
+
+
+def list_column(values, alleles=None):
+    return [[None if v.strip() in EMPTY_VALUES else pg_array_text(v.split('&')) for v in values]]
+
+
+def number_values(values, dtype):
+    """
+        Return the list of the numbers of the list of strings (None for empty or invalid values)
+    """
+    result = [None if v is None or v.strip() in EMPTY_VALUES else v.strip() for v in values]
+    numbers = [v for v in result if v is not None]
+    try:
+        # all values are checked at once; we only check them one by one when some are invalid
+        np.array(numbers, dtype=dtype)
+        return result
+    except (ValueError, OverflowError):
+        pass
+    invalid = 0
+    for idx, v in enumerate(result):
+        if v is None: continue
+        try:
+            np.array(v, dtype=dtype)
+        except (ValueError, OverflowError):
+            result[idx] = None
+            invalid += 1
+    war("Annotations import : {} invalid {} values ignored".format(invalid, np.dtype(dtype).name))
+    return result
+
+
+def int_column(values, alleles=None):
+    return [number_values(values, np.int64)]
+
+
+def float_column(values, alleles=None):
+    return [number_values(values, float)]
+
+
+def type_column(regovar_type):
+    """
+        Return the converter of the values of the regovar type (see AbstractTranscriptDataImporter.cast_value)
+    """
+    return {"int": int_column, "float": float_column, "bool": bool_column, "list": list_column}.get(regovar_type, string_column)
+
+
+
+
+class AnnotationColumnsParser():
+    """
+        Parse the annotations of the importer (VepImporter, SnpEffImporter) for a block of records.
+        fields are the database fields of the parsed values; all annotations have the same fields (NULL when missing).
+    """
+
+    def __init__(self, importer):
+        self.name = importer.name
+        self.vcf_flag = importer.vcf_flag
+        self.width = len(importer.columns)
+        self.allele_pos = importer.columns.index("allele") if "allele" in importer.columns else None
+        self.trx_pos = importer.columns.index(importer.trx_pk_column) if importer.trx_pk_column in importer.columns else None
+        self.fields = []
+        self.converters = []
+        for col_pos, col_name in enumerate(importer.columns):
+            converter = importer.column_converter(col_name)
+            if converter is None: continue
+            fields, func = converter
+            self.fields += fields
+            self.converters.append((col_pos, col_name, len(fields), func))
+
+
+    def parse(self, infos):
+        """
+            Parse the raw INFO fields of a block of records.
+            Return for each record a dict {allele: [(trx_pk, values, copy_values), ...]} where values are aligned with
+            self.fields and copy_values is the text of the values for the COPY command (tab separated).
+            Alleles are the ones of the annotations ('-' of deletions removed) so they match the normalised alt of the variants
+        """
+        entries = []
+        counts = []
+        for info in infos:
+            values = info_values(info, self.vcf_flag)
+            entries += values
+            counts.append(len(values))
+        if len(entries) == 0:
+            return [{} for c in counts]
+
+        rows = [e.split('|') for e in entries]
+        if any([len(r) != self.width for r in rows]):
+            rows = [r[0:self.width] + [''] * (self.width - len(r)) for r in rows]
+        columns = list(zip(*rows))
+
+        alleles = [v.strip() for v in columns[self.allele_pos]] if self.allele_pos is not None else [''] * len(entries)
+        trx_pks = [v.strip() for v in columns[self.trx_pos]] if self.trx_pos is not None else [None] * len(entries)
+        results = []
+        for col_pos, col_name, width, func in self.converters:
+            try:
+                results += func(columns[col_pos], alleles)
+            except Exception as ex:
+                err("{} annotations import : unable to parse the column {}".format(self.name, col_name), ex)
+                results += [[None] * len(entries)] * width
+        values = list(zip(*results)) if len(results) > 0 else [()] * len(entries)
+        # NULL are replaced by a char that cannot be in a vcf, to escape the whole text of the annotation at once
+        copy_values = ["\t".join(v).replace('\\', '\\\\').replace('\0', '\\N') for v in zip(*[[v if v is not None else '\0' for v in c] for c in results])]
+        if len(results) == 0: copy_values = [""] * len(entries)
+
+        result = []
+        idx = 0
+        for count in counts:
+            record = {}
+            for i in range(idx, idx + count):
+                allele = alleles[i].strip('-')
+                if allele not in record:
+                    record[allele] = []
+                record[allele].append((trx_pks[i], values[i], copy_values[i]))
+            result.append(record)
+            idx += count
+        return result
@@ -0,0 +1,192 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import numpy as np
+
+
+
+
+# =======================================================================================================
+# Vectorized decoding of vcf samples data
+# =======================================================================================================
+#
+# Records are decoded by block : samples data (GT, DP, AD, DP4) of all samples are parsed from the raw vcf line
+# into numpy arrays, and regovar genotype codes and depth_alt are computed for all samples at once,
+# instead of using the pysam sample objects of each sample.
+#
+# Conventions of the arrays :
+#  - gt     : int16 (records, samples, 2) alleles index of the genotype; -1 for missing allele ('.'),
+#             -2 for the second allele of haploid genotypes, -3 when the sample have no GT
+#  - dp     : float (records, samples) depth of the sample; NaN when missing
+#  - gq     : float (records, samples) genotype quality of the sample; NaN when missing
+#  - ad/dp4 : list (one by record) of float arrays (samples, n) or None if the field is not in the format
+#  - info   : list (one by record) of the raw INFO field (parsed by vcf_import_annotations)
+#  - filter : list (one by record) of the raw FILTER field
+
+GT_MISSING = -1
+GT_HAPLOID = -2
+GT_NONE = -3
+
+
+
+def decode_numbers(values, width):
+    """
+        Decode the list of "n1,n2,..." strings of the samples into a float array (samples, width).
+        Missing values ('.') are NaN
+    """
+    tokens = ",".join(values).split(",")
+    if len(tokens) != len(values) * width:
+        # some samples have a single '.' for the whole field
+        tokens = []
+        for v in values:
+            tokens += v.split(",") if v not in ["", "."] else ["."] * width
+        if len(tokens) != len(values) * width:
+            return np.full((len(values), width), np.nan)
+    result = np.array(tokens, dtype="U16")
+    result[result == "."] = "nan"
+    try:
+        return result.astype(float).reshape(len(values), width)
+    except ValueError:
+        return np.full((len(values), width), np.nan)
+
+
+def decode_gt(values):
+    """
+        Decode the GT strings of samples into an int16 array (samples, 2). See conventions above.
+        Common genotypes (alleles index < 10, diploid or haploid) are decoded with numpy. Others are parsed one by one.
+    """
+    raw = np.array(values, dtype="S4")
+    chars = raw.view(np.uint8).reshape(len(values), 4)
+    digits = (chars >= 48) & (chars <= 57)
+    separator = (chars[:, 1] == ord('/')) | (chars[:, 1] == ord('|'))
+    haploid = chars[:, 1] == 0
+
+    result = np.full((len(values), 2), GT_MISSING, dtype=np.int16)
+    result[:, 0] = np.where(digits[:, 0], chars[:, 0].astype(np.int16) - 48, GT_MISSING)
+    result[:, 1] = np.where(digits[:, 2], chars[:, 2].astype(np.int16) - 48, GT_MISSING)
+    result[haploid, 1] = GT_HAPLOID
+
+    # Uncommon genotypes : multi digits alleles index, polyploid, no GT
+    uncommon = ~(haploid | (separator & (chars[:, 3] == 0))) | (chars[:, 0] == 0)
+    for idx in np.nonzero(uncommon)[0]:
+        gt = values[idx]
+        if gt in ["", None]:
+            result[idx] = (GT_NONE, GT_NONE)
+            continue
+        alleles = gt.replace('|', '/').split('/')
+        alleles = [int(a) if a.isdigit() else GT_MISSING for a in alleles]
+        if len(alleles) == 1:
+            alleles.append(GT_HAPLOID)
+        result[idx] = alleles[0:2]
+    return result
+
+
+def decode_records(records):
+    """
+        Decode samples data of a block of pysam records into numpy arrays
+    """
+    gts = []
+    dps = []
+    gqs = []
+    ads = []
+    dp4s = []
+    infos = []
+    filters = []
+    for record in records:
+        fields = str(record).rstrip('\n').split('\t')
+        infos.append(fields[7] if len(fields) > 7 else "")
+        filters.append(fields[6] if len(fields) > 6 else ".")
+        fmt = fields[8].split(':') if len(fields) > 8 else []
+        data = [s.split(':') for s in fields[9:]]
+
+        def column(key):
+            if key not in fmt: return None
+            i = fmt.index(key)
+            return [d[i] if len(d) > i else "." for d in data]
+
+        gt = column("GT")
+        gts.append(decode_gt(gt) if gt is not None else np.full((len(data), 2), GT_NONE, dtype=np.int16))
+        dp = column("DP")
+        dps.append(decode_numbers(dp, 1)[:, 0] if dp is not None else np.full(len(data), np.nan))
+        gq = column("GQ")
+        gqs.append(decode_numbers(gq, 1)[:, 0] if gq is not None else np.full(len(data), np.nan))
+        ad = column("AD")
+        ads.append(decode_numbers(ad, len(record.alleles)) if ad is not None else None)
+        dp4 = column("DP4")
+        dp4s.append(decode_numbers(dp4, 4) if dp4 is not None else None)
+
+    return {
+        "gt": np.array(gts, dtype=np.int16),
+        "dp": np.array(dps, dtype=float),
+        "gq": np.array(gqs, dtype=float),
+        "ad": ads,
+        "dp4": dp4s,
+        "info": infos,
+        "filter": filters
+    }
+
+
+def genotype_codes(gt):
+    """
+        Compute regovar genotype codes (see vcf_manager.normalize_gt) from gt array (any shape ending with the 2 alleles)
+        -50: err (no GT)
+         0: ref/ref
+         1: alt/alt (and haploid genotypes)
+         2: ref/alt
+         3: alt1/alt2
+    """
+    a1 = gt[..., 0]
+    a2 = gt[..., 1]
+    homozygous = a1 == a2
+    homozygous_ref = homozygous & ((a1 == 0) | (a1 == GT_MISSING))
+    heterozygous_ref = ~homozygous & ((a1 == 0) | (a2 == 0))
+
+    result = np.full(a1.shape, 3, dtype=np.int16)
+    result[heterozygous_ref] = 2
+    result[homozygous] = 1
+    result[homozygous_ref] = 0
+    result[a2 == GT_HAPLOID] = 1
+    result[a1 == GT_NONE] = -50
+    return result
+
+
+def reference_calls(gt):
+    """
+        Return the mask of samples called ref/ref (or ref for haploid genotypes); no-calls are not ref calls
+    """
+    return (gt[..., 0] == 0) & ((gt[..., 1] == 0) | (gt[..., 1] == GT_HAPLOID))
+
+
+def called_samples(gt):
+    """
+        Return the mask of samples called on the record (at least one allele of the genotype is known)
+    """
+    return (gt[..., 0] >= 0) | (gt[..., 1] >= 0)
+
+
+def allele_carriers(gt, allele_idx):
+    """
+        Return the mask of samples that have the allele in their genotype
+    """
+    return (gt[..., 0] == allele_idx) | (gt[..., 1] == allele_idx)
+
+
+def depth_alt(block, record_idx, allele_idx, codes):
+    """
+        Compute the depth of the allele for all samples of the record (NaN when not available) :
+         - with AD : depth of the allele
+         - with DP4 : forward+reverse depth of alt (or ref for the ref allele); sum of all when ref/ref
+    """
+    ad = block["ad"][record_idx]
+    if ad is not None:
+        return ad[:, allele_idx]
+    dp4 = block["dp4"][record_idx]
+    if dp4 is not None:
+        result = dp4[:, 2] + dp4[:, 3] if allele_idx > 0 else dp4[:, 0] + dp4[:, 1]
+        return np.where(codes == 0, dp4.sum(axis=1), result)
+    return np.full(codes.shape, np.nan)
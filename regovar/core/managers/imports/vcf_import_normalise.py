@@ -0,0 +1,254 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import numpy as np
+
+
+
+
+# =======================================================================================================
+# Normalisation of the variants
+# =======================================================================================================
+#
+# Variants of the vcf (1-based pos, ref, alt) are saved normalised : 0-based position, ref and alt trimmed of their
+# common prefix (and of their common suffix when they have the same length). The scalar functions (normalise,
+# is_transition, getMaxUcscBin) are used for single variants; the importers normalise all the alleles of a block of
+# records at once with the vectorized ones (normalise_variants, transitions, ucsc_bins, normalise_records), that
+# return the same results.
+
+# Alleles longer than this are trimmed one by one (the batch is trimmed with matrices of width the longest allele)
+NORMALISE_MAX_WIDTH = 64
+
+
+def normalise(pos, ref, alt):
+    """
+        Normalise given (position, ref and alt) from VCF into Database format
+            - Assuming that position in VCF are 1-based (0-based in Database)
+            - triming ref and alt to get minimal alt (and update position accordingly)
+    """
+    # input pos comming from VCF are 1-based.
+    # to be consistent with UCSC databases we convert it into 0-based
+    pos -= 1
+    
+    if ref is None:
+        ref = ''
+    if alt is None:
+        alt = ''
+    # ref/ref special case
+    if ref==alt:
+        return pos, ref, alt
+    # trim left
+    while len(ref) > 0 and len(alt) > 0 and ref[0]==alt[0] :
+        ref = ref[1:]
+        alt = alt[1:]
+        pos += 1
+    # trim right
+    if len(ref) == len(alt):
+        while ref[-1:]==alt[-1:]:
+            ref = ref[0:-1]
+            alt = alt[0:-1]
+    return pos, ref, alt
+
+
+def is_transition(ref, alt):
+    """
+        Return true if the variant is a transition; false otherwise
+    """
+    tr = ref+alt
+    if len(ref) == 1 and tr in ("AG", "GA", "CT", "TC"):
+        return True
+    return False
+
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Tiers code from vtools.  Bin index calculation 
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+
+#
+# Utility function to calculate bins.
+#
+# This function implements a hashing scheme that UCSC uses (developed by Jim Kent) to 
+# take in a genomic coordinate range and return a set of genomic "bins" that your range
+# intersects.  I found a Java implementation on-line (I need to find the URL) and I
+# simply manually converted the Java code into Python code.  
+    
+# IMPORTANT: Because this is UCSC code the start coordinates are 0-based and the end 
+# coordinates are 1-based!!!!!!
+        
+# BINRANGE_MAXEND_512M = 512 * 1024 * 1024
+# binOffsetOldToExtended = 4681; #  (4096 + 512 + 64 + 8 + 1 + 0)
+
+_BINOFFSETS = (
+    512+64+8+1,   # = 585, min val for level 0 bins (128kb binsize)    
+    64+8+1,       # =  73, min val for level 1 bins (1Mb binsize) 
+    8+1,          # =   9, min val for level 2 bins (8Mb binsize)  
+    1,            # =   1, min val for level 3 bins (64Mb binsize)  
+    0)            # =   0, only val for level 4 bin (512Mb binsize)
+        
+#    1:   0000 0000 0000 0001    1<<0       
+#    8:   0000 0000 0000 1000    1<<3
+#   64:   0000 0000 0100 0000    1<<6
+#  512:   0000 0010 0000 0000    1<<9
+    
+_BINFIRSTSHIFT = 17;            # How much to shift to get to finest bin.
+_BINNEXTSHIFT = 3;              # How much to shift to get to next larger bin.
+_BINLEVELS = len(_BINOFFSETS)
+    
+#
+# IMPORTANT: the start coordinate is 0-based and the end coordinate is 1-based.
+#
+def getUcscBins(start, end):
+    bins = []
+    startBin = start >> _BINFIRSTSHIFT
+    endBin = (end-1) >> _BINFIRSTSHIFT
+    for i in range(_BINLEVELS):
+        offset = _BINOFFSETS[i];
+        if startBin == endBin:
+            bins.append(startBin + offset)
+        else:
+            for bin in range(startBin + offset, endBin + offset):
+                bins.append(bin);
+        startBin >>= _BINNEXTSHIFT
+        endBin >>= _BINNEXTSHIFT
+    return bins
+
+def getMaxUcscBin(start, end):
+    bin = 0
+    startBin = start >> _BINFIRSTSHIFT
+    endBin = (end-1) >> _BINFIRSTSHIFT
+    for i in range(_BINLEVELS):
+        offset = _BINOFFSETS[i];
+        if startBin == endBin:
+            if startBin + offset > bin:
+                bin = startBin + offset
+        else:
+            for i in range(startBin + offset, endBin + offset):
+                if i > bin:
+                    bin = i 
+        startBin >>= _BINNEXTSHIFT
+        endBin >>= _BINNEXTSHIFT
+    return bin
+
+
+
+
+# =======================================================================================================
+# Vectorized normalisation
+# =======================================================================================================
+
+
+def allele_lengths(alleles):
+    return np.fromiter(map(len, alleles), dtype=np.int64, count=len(alleles))
+
+
+def trim_lengths(ref, alt, ref_len, alt_len):
+    """
+        Return the lengths of the common prefix and of the common suffix (variants of same length only) of the alleles.
+        Alleles are compared as matrices of bytes
+    """
+    count = len(ref)
+    width = max(1, int(max(ref_len.max(initial=0), alt_len.max(initial=0))))
+    dtype = "S{}".format(width)
+    ref_bytes = np.array(ref, dtype=dtype).view(np.uint8).reshape(count, width)
+    alt_bytes = np.array(alt, dtype=dtype).view(np.uint8).reshape(count, width)
+    equal = ref_bytes == alt_bytes
+    columns = np.arange(width)
+    # ref/ref special case
+    same = (ref_len == alt_len) & equal.all(axis=1)
+
+    # length of the prefix : first column that is not equal (a last column of False is added for the full matches)
+    prefix = np.argmin(np.pad(equal & (columns[None, :] < np.minimum(ref_len, alt_len)[:, None]), ((0, 0), (0, 1)), mode="constant"), axis=1)
+    prefix[same] = 0
+    # columns from the end of the alleles (same length) not trimmed by the prefix
+    index = ref_len[:, None] - 1 - columns[None, :]
+    tail = equal[np.arange(count)[:, None], np.clip(index, 0, width - 1)] & (index >= prefix[:, None])
+    suffix = np.argmin(np.pad(tail, ((0, 0), (0, 1)), mode="constant"), axis=1)
+    suffix[same | (ref_len != alt_len)] = 0
+    return prefix, suffix
+
+
+def normalise_variants(pos, ref, alt):
+    """
+        Normalise the variants (see normalise) of the arrays/lists of positions (1-based), refs and alts.
+        Return the array of positions and the lists of refs and alts
+    """
+    ref = [r or '' for r in ref]
+    alt = [a or '' for a in alt]
+    pos = np.asarray(pos, dtype=np.int64) - 1
+    ref_len = allele_lengths(ref)
+    alt_len = allele_lengths(alt)
+    prefix = np.zeros(len(ref), dtype=np.int64)
+    suffix = np.zeros(len(ref), dtype=np.int64)
+
+    short = np.nonzero((ref_len <= NORMALISE_MAX_WIDTH) & (alt_len <= NORMALISE_MAX_WIDTH))[0]
+    if len(short) == len(ref):
+        prefix, suffix = trim_lengths(ref, alt, ref_len, alt_len)
+    else:
+        prefix[short], suffix[short] = trim_lengths([ref[i] for i in short], [alt[i] for i in short], ref_len[short], alt_len[short])
+        for i in np.setdiff1d(np.arange(len(ref)), short).tolist():
+            prefix[i:i+1], suffix[i:i+1] = trim_lengths([ref[i]], [alt[i]], ref_len[i:i+1], alt_len[i:i+1])
+
+    # only trimmed alleles are sliced
+    trimmed = np.nonzero(prefix + suffix)[0]
+    for i, start, ref_end, alt_end in zip(trimmed.tolist(), prefix[trimmed].tolist(), (ref_len - suffix)[trimmed].tolist(), (alt_len - suffix)[trimmed].tolist()):
+        ref[i] = ref[i][start:ref_end]
+        alt[i] = alt[i][start:alt_end]
+    return pos + prefix, ref, alt
+
+
+def transitions(ref, alt):
+    """
+        Return the array of the is_transition flags of the lists of (normalised) refs and alts
+    """
+    codes = {"AG", "GA", "CT", "TC"}
+    return np.fromiter((len(r) == 1 and r + a in codes for r, a in zip(ref, alt)), dtype=bool, count=len(ref))
+
+
+def ucsc_bins(start, end):
+    """
+        Vectorized getMaxUcscBin : return the array of the bins of the arrays of start (0-based) and end (1-based)
+    """
+    start_bin = np.asarray(start, dtype=np.int64) >> _BINFIRSTSHIFT
+    end_bin = (np.asarray(end, dtype=np.int64) - 1) >> _BINFIRSTSHIFT
+    result = np.zeros(len(start_bin), dtype=np.int64)
+    for offset in _BINOFFSETS:
+        # max of the bins of the level (none when the range is empty)
+        level = np.where(start_bin == end_bin, start_bin + offset, np.where(end_bin > start_bin, end_bin + offset - 1, 0))
+        result = np.maximum(result, level)
+        start_bin = start_bin >> _BINNEXTSHIFT
+        end_bin = end_bin >> _BINNEXTSHIFT
+    return result
+
+
+def normalise_records(records):
+    """
+        Normalise the alleles of a block of pysam records. Return by record the list of its alleles (ref included,
+        in the order of record.alleles) as tuples (pos, ref, alt, is_transition, bin)
+    """
+    counts = []
+    pos = []
+    ref = []
+    alt = []
+    for record in records:
+        alleles = record.alleles or ()
+        counts.append(len(alleles))
+        pos.extend([record.pos] * len(alleles))
+        ref.extend([record.ref] * len(alleles))
+        alt.extend(alleles)
+    pos, ref, alt = normalise_variants(pos, ref, alt)
+    variants = list(zip(pos.tolist(), ref, alt, transitions(ref, alt).tolist(), ucsc_bins(pos, pos + allele_lengths(ref)).tolist()))
+    result = []
+    start = 0
+    for count in counts:
+        result.append(variants[start:start + count])
+        start += count
+    return result
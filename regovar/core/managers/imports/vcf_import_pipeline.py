@@ -0,0 +1,224 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import time
+import threading
+from queue import Queue, Full, Empty
+
+from core.framework.common import *
+from config import *
+
+
+
+
+# =======================================================================================================
+# Pipelined vcf import
+# =======================================================================================================
+
+
+class VcfImportStage():
+    """
+        Throughput counters of a stage of the pipeline
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.records = 0
+        self.busy = 0       # time (s) spent to process items
+        self.waiting = 0    # time (s) spent waiting for the previous/next stage
+
+
+    def rate(self):
+        """
+            Records processed by second of busy time
+        """
+        return self.records / self.busy if self.busy > 0 else 0
+
+
+    def to_json(self):
+        return {"items": self.items, "records": self.records, "busy": round(self.busy, 3), "waiting": round(self.waiting, 3), "records_per_s": round(self.rate(), 1)}
+
+
+    def __str__(self):
+        return "{} : {} items, {} records, busy {:.1f}s ({:.0f} records/s), waiting {:.1f}s".format(self.name, self.items, self.records, self.busy, self.rate(), self.waiting)
+
+
+
+
+class VcfImportPipeline():
+    """
+        Import vcf records with a producer/consumer pipeline of threads :
+         - parse  : read records with pysam and decode samples data by blocks (numpy kernel)
+         - encode : normalise variants, parse annotations (VEP/SnpEff) and prepare batches of data
+         - write  : N writers, each one with its own database connection, save the batches
+        Stages are linked with bounded queues so a fast stage waits for the slower one (backpressure).
+        The first error raised in a stage stops all stages and is raised by run().
+        As writers may commit batches out of order, the progress is only reported for the batches committed
+        without gap since the start (so the reported position can be used as a checkpoint to resume the import).
+    """
+
+    def __init__(self, writer_class, db_ref_suffix, annotations, writers_count=VCF_IMPORT_MAX_THREAD, queue_size=VCF_IMPORT_QUEUE_SIZE):
+        self.writer_class = writer_class
+        self.db_ref_suffix = db_ref_suffix
+        self.annotations = annotations
+        self.writers_count = max(1, writers_count)
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.error = None
+        self.progress_lock = threading.Lock()
+        self.records_done = 0
+        self.batches_done = {}  # batches committed after a pending one : {sequence: (records, chrm, vcf_line, offset)}
+        self.next_batch = 0     # sequence of the first batch not committed yet
+        self.stages = {"parse": VcfImportStage("parse"), "encode": VcfImportStage("encode"), "write": VcfImportStage("write")}
+
+
+    def fail(self, ex):
+        """
+            Register the error of a stage and stop the pipeline
+        """
+        if self.error is None:
+            self.error = ex
+        self.stop_event.set()
+
+
+    def put(self, queue, item, stage):
+        """
+            Put an item in the queue. Wait while the queue is full unless the pipeline is stopped
+        """
+        start = time.time()
+        while not self.stop_event.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                break
+            except Full:
+                continue
+        stage.waiting += time.time() - start
+
+
+    def get(self, queue, stage):
+        """
+            Get an item from the queue. Return None if the pipeline is stopped
+        """
+        start = time.time()
+        item = None
+        while not self.stop_event.is_set():
+            try:
+                item = queue.get(timeout=0.5)
+                break
+            except Empty:
+                continue
+        stage.waiting += time.time() - start
+        return item
+
+
+    def parse(self, vcf_records, samples, parse_queue):
+        from core.managers.imports.vcf_manager import iter_vcf_blocks
+        stage = self.stages["parse"]
+        try:
+            start = time.time()
+            for block in iter_vcf_blocks(vcf_records, samples, self.annotations):
+                stage.busy += time.time() - start
+                stage.items += 1
+                stage.records += len(block[0])
+                self.put(parse_queue, block, stage)
+                if self.stop_event.is_set(): return
+                start = time.time()
+        except Exception as ex:
+            self.fail(ex)
+        finally:
+            self.put(parse_queue, None, stage)
+
+
+    def encode(self, vcf_line, parse_queue, write_queue):
+        from core.managers.imports.vcf_manager import encode_vcf_record
+        stage = self.stages["encode"]
+        # writer only used to prepare batches (no connection to the database)
+        writer = self.writer_class(self.db_ref_suffix, self.annotations)
+        records = 0
+        chrm = None
+        offset = None
+        try:
+            while True:
+                item = self.get(parse_queue, stage)
+                if item is None: break
+                start = time.time()
+                block, data, codes, samples_ids, offsets = item
+                for r, row in enumerate(block):
+                    records += 1
+                    vcf_line += 1
+                    chrm = encode_vcf_record(row, r, data, codes, writer, samples_ids, vcf_line)
+                    offset = offsets[r] if offsets else None
+                    if writer.count >= 1000:
+                        stage.busy += time.time() - start
+                        stage.records += records
+                        self.put(write_queue, (stage.items, writer.prepare(), records, chrm, vcf_line, offset), stage)
+                        stage.items += 1
+                        records = 0
+                        start = time.time()
+                stage.busy += time.time() - start
+            stage.records += records
+            self.put(write_queue, (stage.items, writer.prepare(), records, chrm, vcf_line, offset), stage)
+            stage.items += 1
+        except Exception as ex:
+            self.fail(ex)
+        finally:
+            writer.close()
+            # one end signal by writer
+            for i in range(self.writers_count):
+                self.put(write_queue, None, stage)
+
+
+    def write(self, write_queue, progress_callback):
+        stage = self.stages["write"]
+        writer = self.writer_class(self.db_ref_suffix, self.annotations)
+        try:
+            while True:
+                item = self.get(write_queue, stage)
+                if item is None: break
+                sequence, batch, records, chrm, vcf_line, offset = item
+                start = time.time()
+                writer.write(batch)
+                with self.progress_lock:
+                    stage.busy += time.time() - start
+                    stage.items += 1
+                    stage.records += records
+                    self.batches_done[sequence] = (records, chrm, vcf_line, offset)
+                    if sequence != self.next_batch: continue
+                    while self.next_batch in self.batches_done:
+                        records, chrm, vcf_line, offset = self.batches_done.pop(self.next_batch)
+                        self.records_done += records
+                        self.next_batch += 1
+                    if progress_callback: progress_callback(self.records_done, chrm, vcf_line, offset)
+        except Exception as ex:
+            self.fail(ex)
+        finally:
+            writer.close()
+
+
+    def run(self, vcf_records, samples, vcf_line, progress_callback=None, records_current=0):
+        """
+            Import the vcf records (see vcf_manager.import_vcf_records for parameters).
+            Return the number of imported records
+        """
+        self.records_done = records_current
+        parse_queue = Queue(maxsize=self.queue_size)
+        write_queue = Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self.parse, args=(vcf_records, samples, parse_queue), daemon=True),
+            threading.Thread(target=self.encode, args=(vcf_line, parse_queue, write_queue), daemon=True)]
+        threads += [threading.Thread(target=self.write, args=(write_queue, progress_callback), daemon=True) for i in range(self.writers_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for stage in self.stages.values():
+            log("VCF import pipeline : {}".format(stage))
+        if self.error:
+            raise RegovarException("VCF import pipeline failed.", exception=self.error)
+        return self.records_done
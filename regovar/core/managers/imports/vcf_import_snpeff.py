@@ -9,10 +9,27 @@ except ImportError:
 import sqlalchemy
 
 from core.managers.imports.abstract_import_manager import AbstractTranscriptDataImporter
+from core.managers.imports.vcf_import_annotations import string_column, list_column
 from core.framework.common import *
 import core.model as Model
 
 
+
+
+def impact_column(values, alleles=None):
+    """
+        Columnar converter of annotation impacts : "{HIGH}" -> "high"
+    """
+    result = []
+    for v in values:
+        if v.startswith('{'): v = v[1:]
+        if v.endswith('}'): v = v[:-1]
+        result.append(v.lower())
+    return string_column(result)
+
+
+
+
 class SnpEffImporter(AbstractTranscriptDataImporter): 
     
     
@@ -44,6 +61,7 @@ class SnpEffImporter(AbstractTranscriptDataImporter):
                 self.version = headers['SnpEffVersion'][0].strip().strip('"').split(' ')[0]
                 self.table_name = self.normalise_annotation_name('{}_{}_{}'.format('SnpEff', self.version, reference_name))
                 self.vcf_flag = vcf_flag
+                self.trx_pk_column = 'feature_id'
                 self.columns_definitions = SnpEffImporter.columns_definitions
                 result = 'Feature_Id' in self.columns
                 
@@ -125,32 +143,22 @@ class SnpEffImporter(AbstractTranscriptDataImporter):
     
     
 
-    def import_annotations(self, sql_pattern, bin, chrm, pos, ref, alt, infos):
+    def parse_annotations(self, alt, infos):
         # split annotations according to columns order retrieve in the init method : see self.columns
-        # create sql query with corresponding field uid
-        # manage special case for sift and polyphen that are split in 2 fields : _pred and _score
         # manage type conversion when needed !
-        count = 0
-        query = ""
-        def check_val(val):
-            result = 'NULL'
-            if val is not None:
-                if isinstance(val, str) and val != '':
-                    result = '\'{}\''.format(val)
-                result = val
-            return result
-    
+        result = []
+        if self.vcf_flag not in infos: return result
         
         for info in infos[self.vcf_flag]:
             data = info.split('|')
             q_fields = []
             q_values = []
             allele   = ""
-            trx_pk = "NULL"
+            trx_pk = None
             
             for col_pos, col_name in enumerate(self.columns):
                 try:
-                    vals = [self.escape_value_for_sql(data[col_pos])]
+                    vals = [data[col_pos]]
                     
                     col_mapping = self.columns_mapping[col_name]
                     fields = [col_name]
@@ -162,21 +170,21 @@ class SnpEffImporter(AbstractTranscriptDataImporter):
                     # Manage specials annotations
                     if col_name == 'allele':
                         allele = vals[0].strip().strip('-') # When deletion, SnpEff use '-', but regovar just let empty string.
-                        success, new_value = self.value_to_regovar_type(vals[0], "string")
+                        success, new_value = self.cast_value(vals[0], "string")
                         vals = [new_value]
                     elif col_name == 'feature_id':
                         trx_pk = vals[0].strip()
-                        success, new_value = self.value_to_regovar_type(vals[0], "string")
+                        success, new_value = self.cast_value(vals[0], "string")
                         vals = [new_value]
                     elif col_name == 'annotation_impact':
                         new_value = vals[0]
                         if new_value:
                             if new_value[0] == "{": new_value = new_value[1:]
                             if new_value[-1] == "}": new_value = new_value[:-1]  
-                            success, new_value = self.value_to_regovar_type(new_value.lower(), "string")
+                            success, new_value = self.cast_value(new_value.lower(), "string")
                             vals = [new_value]                          
                     elif col_name in ['annotation', 'annotation_impact']:
-                        vals = ["ARRAY [{}]".format(",".join(["'{}'".format(self.escape_value_for_sql(v)) for v in data[col_pos].split('&')]))]
+                        vals = [data[col_pos].split('&')]
                    
                    
                     elif col_name not in self.columns_mapping:
@@ -185,23 +193,35 @@ class SnpEffImporter(AbstractTranscriptDataImporter):
                         continue
                     else:
                         # for other fields, try to convert it into the requiered type else escape
-                        success, new_value = self.value_to_regovar_type(vals[0], col_mapping["type"])
+                        success, new_value = self.cast_value(vals[0], col_mapping["type"])
                         if success:
                             vals = [new_value]
                         else:
                             continue
                         
                     q_fields += fields
-                    q_values += [check_val(val) for val in vals]
+                    q_values += vals
                 except Exception as ex:
-                    err("import_annotations error when trying to import {}='{}'".format(col_name, vals),ex)
+                    err("parse_annotations error when trying to import {}='{}'".format(col_name, vals),ex)
             
 
             if len(q_fields) > 0:
-                query += sql_pattern.format(self.table_name, ','.join(q_fields), ','.join([str(val) for val in q_values]), bin, chrm, pos, ref, allele, trx_pk)
-                count += 1
+                result.append((allele, trx_pk, q_fields, q_values))
                 
-        return query, count
+        return result
+
+
+    def column_converter(self, col_name):
+        # see parse_annotations for specials annotations
+        if not self.columns_mapping.get(col_name):
+            return None
+        if col_name in ["allele", "feature_id"]:
+            return [col_name], string_column
+        if col_name == "annotation_impact":
+            return [col_name], impact_column
+        if col_name == "annotation":
+            return [col_name], list_column
+        return super().column_converter(col_name)
 
     
     
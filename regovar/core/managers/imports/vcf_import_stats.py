@@ -0,0 +1,155 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import numpy as np
+
+from core.framework.common import *
+import core.model as Model
+from core.model.sample import FILTER_MASK_SIZE
+
+
+
+
+# =======================================================================================================
+# Quality metrics of the samples computed during the import
+# =======================================================================================================
+#
+# Counters of each sample are accumulated while the records are encoded (see encode_vcf_record), sent with the
+# batch and added to the import_sample_stats table in the transaction of the batch. The counters of a batch are
+# only added when its sample_variant rows are inserted, so a batch imported again (resumed import) is not counted
+# twice. At the end of the import, counters are converted into the stats of the samples (see save_import_stats).
+# Counters are by variant (alt allele) of the sample :
+#  - total_variant : all variants of the records of the sample, sample_total_variant : the ones called (genotype >= 0)
+#  - not : variants of the record that the sample has not, ref : variants called ref/ref
+#  - variant classes, het/hom, transition/transversion (SNV) and depth histogram : variants that the sample has (genotype > 0)
+#  - filter_<n> : called variants with the filter n (bit n of the filter mask, see Sample.filter_codes)
+
+DEPTH_BINS = [0, 10, 20, 30, 50, 100, 200, 500]
+VARIANT_CLASSES = ["snv", "mnv", "insertion", "deletion", "others"]
+STATS_KEYS = ["total_variant", "sample_total_variant", "not", "ref"] + VARIANT_CLASSES + ["het", "hom", "transition", "transversion"]
+STATS_KEYS += ["depth_{}".format(b) for b in DEPTH_BINS] + ["filter_{}".format(i) for i in range(FILTER_MASK_SIZE)]
+STATS_INDEX = {key: idx for idx, key in enumerate(STATS_KEYS)}
+
+
+
+def variant_class(ref, alt):
+    """
+        Return the class of the normalised variant
+    """
+    if len(ref) == 1 and len(alt) == 1:
+        return "snv"
+    if len(ref) == len(alt):
+        return "mnv"
+    if len(ref) == 0:
+        return "insertion"
+    if len(alt) == 0:
+        return "deletion"
+    return "others"
+
+
+
+
+class SampleImportStats():
+    """
+        Counters (see above) of the samples of the records encoded by a writer
+    """
+
+    def __init__(self):
+        self.samples_ids = None
+        self.counters = None
+
+
+    def add(self, samples_ids, ref, alt, transition, gts, depths, filter_mask):
+        """
+            Count the variant for all samples. gts and depths are float arrays (NaN for NULL)
+        """
+        if self.counters is None:
+            self.samples_ids = samples_ids
+            self.counters = np.zeros((len(samples_ids), len(STATS_KEYS)), dtype=np.int64)
+        counters = self.counters
+        gts = np.where(np.isnan(gts), -100, gts)
+        called = gts >= 0
+        counters[:, STATS_INDEX["total_variant"]] += 1
+        counters[:, STATS_INDEX["sample_total_variant"]] += called
+        counters[:, STATS_INDEX["not"]] += gts == -100
+        counters[:, STATS_INDEX["ref"]] += gts == 0
+        for bit in range(FILTER_MASK_SIZE):
+            if filter_mask and filter_mask & (1 << bit):
+                counters[:, STATS_INDEX["filter_0"] + bit] += called
+        if ref == alt: return
+
+        carriers = gts > 0
+        counters[:, STATS_INDEX[variant_class(ref, alt)]] += carriers
+        counters[:, STATS_INDEX["het"]] += (gts == 2) | (gts == 3)
+        counters[:, STATS_INDEX["hom"]] += gts == 1
+        if len(ref) == 1 and len(alt) == 1:
+            counters[:, STATS_INDEX["transition" if transition else "transversion"]] += carriers
+        with_depth = np.nonzero(carriers & ~np.isnan(depths))[0]
+        bins = np.digitize(depths[with_depth], DEPTH_BINS) - 1
+        np.add.at(counters, (with_depth, STATS_INDEX["depth_0"] + bins), 1)
+
+
+    def rows(self):
+        """
+            Return the list of the counters (sample_id, key, value) that are not null
+        """
+        if self.counters is None:
+            return []
+        sids, keys = np.nonzero(self.counters)
+        return [(int(self.samples_ids[s]), STATS_KEYS[k], int(self.counters[s, k])) for s, k in zip(sids.tolist(), keys.tolist())]
+
+
+
+
+def import_stats_query(rows, source):
+    """
+        Return the query that adds the counters rows (see SampleImportStats.rows) to import_sample_stats, only if
+        the source (sample_variant rows inserted by the batch) is not empty
+    """
+    values = ",".join(["({},'{}',{})".format(sid, key, value) for sid, key, value in rows])
+    return "INSERT INTO import_sample_stats (sample_id, key, value) SELECT s.sample_id, s.key, s.value FROM (VALUES {0}) AS s (sample_id, key, value) WHERE EXISTS (SELECT 1 FROM {1}) ON CONFLICT (sample_id, key) DO UPDATE SET value=import_sample_stats.value+EXCLUDED.value".format(values, source)
+
+
+def import_stats_json(counters, filter_codes):
+    """
+        Return the stats of a sample from its counters (dict {key: value})
+    """
+    get = lambda key: counters.get(key, 0)
+    depths = {}
+    for idx, b in enumerate(DEPTH_BINS):
+        label = "{}-{}".format(b, DEPTH_BINS[idx + 1] - 1) if idx + 1 < len(DEPTH_BINS) else "{}+".format(b)
+        depths[label] = get("depth_{}".format(b))
+    return {
+        "total_variant": get("total_variant"),
+        "sample_total_variant": get("sample_total_variant"),
+        "matching_reference": True,
+        "filter": {f: get("filter_{}".format(i)) for i, f in enumerate(filter_codes)},
+        "variants_classes": {c: get(c) for c in ["not", "ref"] + VARIANT_CLASSES},
+        "het": get("het"),
+        "hom": get("hom"),
+        "het_hom_ratio": round(get("het") / get("hom"), 3) if get("hom") else None,
+        "transitions": get("transition"),
+        "transversions": get("transversion"),
+        "ti_tv_ratio": round(get("transition") / get("transversion"), 3) if get("transversion") else None,
+        "depth_histogram": depths
+    }
+
+
+def save_import_stats(samples_ids):
+    """
+        Save the counters of the import as the stats of the samples, then delete them
+    """
+    sids = ",".join([str(sid) for sid in samples_ids])
+    counters = {sid: {} for sid in samples_ids}
+    for row in Model.execute("SELECT sample_id, key, value FROM import_sample_stats WHERE sample_id IN ({})".format(sids)):
+        counters[row.sample_id][row.key] = row.value
+    for sid in samples_ids:
+        sample = Model.Sample.from_id(sid)
+        sample.stats = import_stats_json(counters[sid], Model.Sample.filter_codes((sample.filter_description or {}).keys()))
+        sample.save()
+    Model.execute("DELETE FROM import_sample_stats WHERE sample_id IN ({})".format(sids))
@@ -9,10 +9,46 @@ except ImportError:
 import sqlalchemy
 
 from core.managers.imports.abstract_import_manager import AbstractTranscriptDataImporter
+from core.managers.imports.vcf_import_annotations import string_column, number_values
 from core.framework.common import *
 import core.model as Model
 
 
+
+
+def prediction_columns(values, alleles=None):
+    """
+        Columnar converter of sift/polyphen values "prediction(score)" into 2 columns : prediction and score
+    """
+    preds = []
+    scores = []
+    for v in values:
+        v = v.strip().split('(')
+        if len(v) == 2:
+            preds.append(v[0])
+            scores.append(v[1][:-1])
+        else:
+            preds.append('')
+            scores.append(None)
+    return string_column(preds) + [number_values(scores, float)]
+
+
+def maf_column(values, alleles):
+    """
+        Columnar converter of frequencies "allele:maf&..." : keep the frequency of the allele of the annotation
+    """
+    result = []
+    for v, allele in zip(values, alleles):
+        if v == '':
+            result.append(None)
+            continue
+        v = v.strip().split('&', 1)[0].strip().split(':')
+        result.append(v[1] if len(v) == 2 and v[0] == allele else None)
+    return [number_values(result, float)]
+
+
+
+
 class VepImporter(AbstractTranscriptDataImporter): 
     
     
@@ -138,32 +174,23 @@ class VepImporter(AbstractTranscriptDataImporter):
     
     
 
-    def import_annotations(self, sql_pattern, bin, chrm, pos, ref, alt, infos):
+    def parse_annotations(self, alt, infos):
         # split annotations according to columns order retrieve in the init method : see self.columns
-        # create sql query with corresponding field uid
         # manage special case for sift and polyphen that are split in 2 fields : _pred and _score
         # manage type conversion when needed !
-        count = 0
-        query = ""
-        def check_val(val):
-            result = 'NULL'
-            if val is not None:
-                if isinstance(val, str) and val != '':
-                    result = '\'{}\''.format(val)
-                result = val
-            return result
-    
+        result = []
+        if self.vcf_flag not in infos: return result
         
         for info in infos[self.vcf_flag]:
             data = info.split('|')
             q_fields = []
             q_values = []
             allele   = ""
-            trx_pk = "NULL"
+            trx_pk = None
             
             for col_pos, col_name in enumerate(self.columns):
                 try:
-                    vals = [self.escape_value_for_sql(data[col_pos])]
+                    vals = [data[col_pos]]
                     
                     col_mapping = self.columns_mapping[col_name]
                     fields = [col_name]
@@ -175,19 +202,19 @@ class VepImporter(AbstractTranscriptDataImporter):
                     # Manage specials annotations
                     if col_name == 'allele':
                         allele = vals[0].strip().strip('-') # When deletion, VEP use '-', but regovar just let empty string.
-                        success, new_value = self.value_to_regovar_type(vals[0], "string")
+                        success, new_value = self.cast_value(vals[0], "string")
                         vals = [new_value]
                     elif col_name == 'feature':
                         trx_pk = vals[0].strip()
-                        success, new_value = self.value_to_regovar_type(vals[0], "string")
+                        success, new_value = self.cast_value(vals[0], "string")
                         vals = [new_value]
                     elif col_name == 'consequence':
-                        vals = ["ARRAY [{}]".format(",".join(["'{}'".format(self.escape_value_for_sql(v)) for v in data[col_pos].split('&')]))]
+                        vals = [data[col_pos].split('&')]
                     elif col_name == "sift":
                         vals = vals[0].strip().split('(')
                         if len(vals) == 2:
                             fields = ["sift_pred", "sift_score"]
-                            success, new_value = self.value_to_regovar_type(vals[0], "string")
+                            success, new_value = self.cast_value(vals[0], "string")
                             vals = [new_value, float(vals[1][:-1])]
                         else:
                             continue
@@ -195,7 +222,7 @@ class VepImporter(AbstractTranscriptDataImporter):
                         vals = vals[0].strip().split('(')
                         if len(vals) == 2:
                             fields = ["polyphen_pred", "polyphen_score"]
-                            success, new_value = self.value_to_regovar_type(vals[0], "string")
+                            success, new_value = self.cast_value(vals[0], "string")
                             vals = [new_value, float(vals[1][:-1])]
                         else:
                             continue
@@ -213,23 +240,37 @@ class VepImporter(AbstractTranscriptDataImporter):
                         continue
                     else:
                         # for other fields, try to convert it into the requiered type else escape
-                        success, new_value = self.value_to_regovar_type(vals[0], col_mapping["type"])
+                        success, new_value = self.cast_value(vals[0], col_mapping["type"])
                         if success:
                             vals = [new_value]
                         else:
                             continue
                         
                     q_fields += fields
-                    q_values += [check_val(val) for val in vals]
+                    q_values += vals
                 except Exception as ex:
-                    err("import_annotations error when trying to import {}='{}'".format(col_name, vals),ex)
+                    err("parse_annotations error when trying to import {}='{}'".format(col_name, vals),ex)
             
 
             if len(q_fields) > 0:
-                query += sql_pattern.format(self.table_name, ','.join(q_fields), ','.join([str(val) for val in q_values]), bin, chrm, pos, ref, allele, trx_pk)
-                count += 1
+                result.append((allele, trx_pk, q_fields, q_values))
                 
-        return query, count
+        return result
+
+
+    def column_converter(self, col_name):
+        # see parse_annotations for specials annotations
+        if col_name == "sift":
+            return ["sift_pred", "sift_score"], prediction_columns
+        if col_name == "polyphen":
+            return ["polyphen_pred", "polyphen_score"], prediction_columns
+        if not self.columns_mapping.get(col_name):
+            return None
+        if col_name in ["allele", "feature"]:
+            return [col_name], string_column
+        if col_name.endswith('maf'):
+            return [col_name], maf_column
+        return super().column_converter(col_name)
 
     
     
@@ -0,0 +1,554 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import io
+import json
+import numpy as np
+
+from core.framework.common import *
+from core.framework.bitmap import bitmap_encode
+from core.framework.bloom import BloomFilter, key_hash, KEY_HASH_SQL
+import core.model as Model
+from core.managers.imports.vcf_import_stats import SampleImportStats, import_stats_query
+
+
+
+
+# =======================================================================================================
+# TOOLS
+# =======================================================================================================
+
+
+def pg_array(values):
+    """
+        Return the postgresql literal of an array
+    """
+    items = []
+    for v in values:
+        if v is None:
+            items.append('NULL')
+        else:
+            items.append('"{}"'.format(str(v).replace('\\', '\\\\').replace('"', '\\"')))
+    return '{' + ','.join(items) + '}'
+
+
+def sql_json(rows):
+    """
+        Return the sql literal of a list of rows (dict) as json, to be used with json_populate_recordset.
+        Colons are escaped as the query is executed as sqlalchemy text (where :X is a bind parameter)
+    """
+    value = json.dumps([{k: pg_array(v) if isinstance(v, (list, tuple)) else v for k, v in row.items()} for row in rows])
+    return "'{}'".format(value.replace("'", "''").replace(':', '\\:'))
+
+
+def copy_escape(value):
+    """
+        Escape a string for the text format of the postgresql COPY command
+    """
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_value(value):
+    """
+        Return the representation of a python value for the text format of the postgresql COPY command
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        return copy_escape(pg_array(value))
+    return copy_escape(str(value))
+
+
+def copy_row(values):
+    return '\t'.join([copy_value(v) for v in values]) + '\n'
+
+
+def copy_int_array(values):
+    """
+        Return the COPY representation of a float array as integers (NaN are NULL)
+    """
+    nan = np.isnan(values)
+    return np.where(nan, '\\N', np.where(nan, 0, values).astype(np.int64).astype(str))
+
+
+def merge_coverage(opened, samples_ids, chrm, start, end, depths, qualities):
+    """
+        Merge the reference block [start, end) of the samples with their opened coverage range when they are contiguous.
+        The depth and the quality of a merged range are the min of its blocks.
+        opened is the dict {sample_id: [chr, start, end, depth, quality]} of the opened ranges; the ranges that cannot
+        be extended anymore are removed from it and returned as tuples (sample_id, chr, start, end, depth, quality)
+    """
+    closed = []
+    for sid, dp, gq in zip(samples_ids, nan_to_none(depths), nan_to_none(qualities)):
+        current = opened.get(sid)
+        if current and current[0] == chrm and current[2] == start:
+            current[2] = end
+            current[3] = min(current[3], dp) if current[3] is not None and dp is not None else None
+            current[4] = min(current[4], gq) if current[4] is not None and gq is not None else None
+            continue
+        if current:
+            closed.append(tuple([sid] + current))
+        opened[sid] = [chrm, start, end, dp, gq]
+    return closed
+
+
+def nan_to_none(values):
+    """
+        Return the list of int of a float array (NaN are None)
+    """
+    return [None if v != v else int(v) for v in values.tolist()]
+
+
+def variant_upsert_query(db_ref_suffix, new, known=None):
+    """
+        Return the CTEs that save the variants of the batch and return their ids as "v" (id, chr, pos, ref, alt).
+        new and known are the sources (chr, pos, ref, alt, is_transition, bin, sample_bitmap) of the variants that are
+        not in the variant table and of the ones that may already be in it (see load_known_variants). Known variants
+        only take the update of their samples bitmap (rows are locked in the key order as the upsert does); new ones
+        and the known ones that are not found (false positives of the filter) are upserted
+    """
+    if known is None:
+        return "WITH v AS (INSERT INTO variant{0} (chr, pos, ref, alt, is_transition, bin, sample_bitmap) SELECT chr, pos, ref, alt, is_transition, bin, sample_bitmap FROM {1} s ORDER BY chr, pos, ref, alt ON CONFLICT (chr, pos, ref, alt) DO UPDATE SET sample_bitmap=bitmap_or(variant{0}.sample_bitmap, EXCLUDED.sample_bitmap) RETURNING id, chr, pos, ref, alt)".format(db_ref_suffix, new)
+    query  = "WITH kr AS (SELECT chr, pos, ref, alt, is_transition, bin, sample_bitmap FROM {2} s), "
+    query += "k AS (SELECT t.id, kr.chr, kr.sample_bitmap FROM kr INNER JOIN variant{0} t ON t.chr=kr.chr AND t.pos=kr.pos AND t.ref=kr.ref AND t.alt=kr.alt ORDER BY kr.chr, kr.pos, kr.ref, kr.alt FOR UPDATE OF t), "
+    query += "u AS (UPDATE variant{0} t SET sample_bitmap=bitmap_or(t.sample_bitmap, k.sample_bitmap) FROM k WHERE t.id=k.id AND t.chr=k.chr RETURNING t.id, t.chr, t.pos, t.ref, t.alt), "
+    query += "n AS (INSERT INTO variant{0} (chr, pos, ref, alt, is_transition, bin, sample_bitmap) SELECT chr, pos, ref, alt, is_transition, bin, sample_bitmap FROM (SELECT chr, pos, ref, alt, is_transition, bin, sample_bitmap FROM {1} s UNION ALL SELECT kr.* FROM kr WHERE NOT EXISTS (SELECT 1 FROM u WHERE u.chr=kr.chr AND u.pos=kr.pos AND u.ref=kr.ref AND u.alt=kr.alt)) r ORDER BY chr, pos, ref, alt ON CONFLICT (chr, pos, ref, alt) DO UPDATE SET sample_bitmap=bitmap_or(variant{0}.sample_bitmap, EXCLUDED.sample_bitmap) RETURNING id, chr, pos, ref, alt), "
+    query += "v AS (SELECT id, chr, pos, ref, alt FROM u UNION ALL SELECT id, chr, pos, ref, alt FROM n)"
+    return query.format(db_ref_suffix, new, known)
+
+
+def variant_counts(gts, called):
+    """
+        Return the occurrences counters [het, hom, called] of a variant for the samples of its record.
+        gts are the genotype codes (NaN for the samples that have not the variant), called the mask of the samples
+        called on the record (see vcf_import_kernel.called_samples) : no-calls are not counted as called
+    """
+    return [int(np.count_nonzero((gts == 2) | (gts == 3))), int(np.count_nonzero(gts == 1)), int(np.count_nonzero(called))]
+
+
+def variant_count_query(db_ref_suffix, counts, ids, inserted):
+    """
+        Return the query that adds the occurrences counters of the batch to the ones of the variants.
+        counts is the source n (chr, pos, ref, alt, het_count, hom_count, called_count) of the counters computed by the 
+        writer, ids the source v (id, chr, pos, ref, alt) of the variants ids of the batch and inserted the sample_variant
+        rows inserted by the batch (RETURNING of the insert) : only variants with inserted rows are counted, so a batch 
+        imported again (resumed import) is not counted twice
+    """
+    query  = "INSERT INTO variant_count{0} (variant_id, chr, het_count, hom_count, called_count) SELECT v.id, v.chr, n.het_count, n.hom_count, n.called_count "
+    query += "FROM {1} INNER JOIN {2} ON v.chr=n.chr AND v.pos=n.pos AND v.ref=n.ref AND v.alt=n.alt WHERE v.id IN (SELECT variant_id FROM {3}) ORDER BY v.id "
+    query += "ON CONFLICT (variant_id) DO UPDATE SET het_count=variant_count{0}.het_count+EXCLUDED.het_count, hom_count=variant_count{0}.hom_count+EXCLUDED.hom_count, called_count=variant_count{0}.called_count+EXCLUDED.called_count"
+    return query.format(db_ref_suffix, counts, ids, inserted)
+
+
+
+
+# =======================================================================================================
+# KNOWN VARIANTS
+# =======================================================================================================
+#
+# When a vcf is imported again (same samples called again, merged cohorts), most of its variants are already in the
+# variant table. A bloom filter of the keys (chr, pos, ref, alt) of the variants of the reference is loaded before the
+# import : writers send the variants found in the filter to the update path (see variant_upsert_query), the others
+# (not in the table for sure) to the upsert. The filter is only read during the import : variants created by the
+# import are upserted, as they may still be created by another import of the reference.
+# Filters are kept by process (writers threads share it, shard processes forked after the load inherit it) between the
+# imports : the next import of the reference only adds the variants created since (ids greater than the last one read).
+# Variants missed by the filter (ids committed late by a concurrent import) or deleted since are only false negatives /
+# positives : they take the upsert path / are upserted when not found.
+
+KNOWN_VARIANTS = {}
+KNOWN_VARIANTS_LAST_ID = {}
+KNOWN_VARIANTS_FETCH = 500000
+
+
+
+def variant_hash(chrm, pos, ref, alt):
+    """
+        Return the hash of the key of the variant, as computed by postgresql in load_known_variants
+    """
+    return key_hash("{}-{}-{}-{}".format(chrm, pos, ref, alt))
+
+
+def load_known_variants(db_ref_suffix, error_rate, records=None, min_ratio=0):
+    """
+        Load (or update) the bloom filter of the variants of the reference. Return the filter, or None if the table is empty
+        or if the vcf has less records than min_ratio of the variants of the reference, and no filter is loaded yet :
+        reading all the variants of the table would cost more than the upsert of the ones of the vcf
+    """
+    table = "variant" + db_ref_suffix
+    # size of the table estimated with the statistics of its partitions
+    count = Model.execute("SELECT sum(c.reltuples) FROM pg_inherits i INNER JOIN pg_class c ON c.oid=i.inhrelid WHERE i.inhparent='{}'::regclass".format(table)).first()[0] or 0
+    if count <= 0:
+        count = Model.execute("SELECT count(*) FROM {}".format(table)).first()[0]
+    if count == 0:
+        unload_known_variants(db_ref_suffix)
+        return None
+
+    bloom = KNOWN_VARIANTS.get(db_ref_suffix)
+    if bloom is not None and (bloom.error_rate != error_rate or bloom.capacity < count):
+        # the error rate of a filter grows with its values over its capacity : a bigger one is built
+        unload_known_variants(db_ref_suffix)
+        bloom = None
+    if bloom is None:
+        if records is not None and records < count * min_ratio:
+            return None
+        bloom = BloomFilter(int(count * 1.2), error_rate)
+    last_id = KNOWN_VARIANTS_LAST_ID.get(db_ref_suffix, 0)
+
+    connection = Model.new_connection()
+    # server side cursor : hashes are fetched by chunks
+    cursor = connection.cursor("known_variants")
+    try:
+        cursor.execute("SELECT {}, id FROM {} WHERE id > {}".format(KEY_HASH_SQL.format("chr || '-' || pos || '-' || ref || '-' || alt"), table, last_id))
+        while True:
+            rows = cursor.fetchmany(KNOWN_VARIANTS_FETCH)
+            if not rows: break
+            bloom.add(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+            last_id = max(last_id, max(r[1] for r in rows))
+    finally:
+        cursor.close()
+        connection.close()
+    KNOWN_VARIANTS[db_ref_suffix] = bloom
+    KNOWN_VARIANTS_LAST_ID[db_ref_suffix] = last_id
+    return bloom
+
+
+def unload_known_variants(db_ref_suffix):
+    KNOWN_VARIANTS.pop(db_ref_suffix, None)
+    KNOWN_VARIANTS_LAST_ID.pop(db_ref_suffix, None)
+
+
+
+
+# =======================================================================================================
+# INSERT WRITER
+# =======================================================================================================
+
+
+class VcfInsertWriter():
+    """
+        Import vcf data with sql INSERT queries executed through the shared sqlalchemy session.
+        Rows of a batch are sent as json recordsets in a single query : the variants upsert returns the ids 
+        (RETURNING) that are joined with samples associations and annotations. So variant ids are resolved
+        once by batch instead of a lookup in the variant table for each sample and each annotation.
+    """
+
+    def __init__(self, db_ref_suffix, annotations):
+        self.db_ref_suffix = db_ref_suffix
+        self.annotations = {k: v for k, v in annotations.items() if v}
+        self.annotations_fields = {k: v.get_columns_parser().fields for k, v in self.annotations.items()}
+        self.known_variants = KNOWN_VARIANTS.get(db_ref_suffix)
+        self.count = 0
+        self.reset()
+
+
+    def reset(self):
+        self.variants = {}  # (chr, pos, ref, alt) -> variant row of the batch
+        self.sample_variants = []
+        self.counts = {}    # (chr, pos, ref, alt) -> occurrences counters of the variant (see variant_counts)
+        self.annotations_rows = {name: [] for name in self.annotations.keys()}
+        self.coverage = []
+        self.coverage_opened = {}
+        self.stats = SampleImportStats()
+        self.count = 0
+
+
+    def add_variant(self, chrm, pos, ref, alt, is_transition, bin, samples_ids):
+        key = (chrm, pos, ref, alt)
+        if key in self.variants:
+            # same variant several times in the batch : upsert it only once
+            self.variants[key]["samples_ids"].update(samples_ids)
+        else:
+            known = self.known_variants is not None and variant_hash(chrm, pos, ref, alt) in self.known_variants
+            self.variants[key] = {"chr": chrm, "pos": pos, "ref": ref, "alt": alt, "is_transition": is_transition, "bin": bin, "samples_ids": set(samples_ids), "known": known}
+
+
+    def add_sample_variants(self, samples_ids, vcf_line, bin, chrm, pos, ref, alt, gts, depths, depths_alt, quality, filter_mask, called):
+        """
+            Register the variant for all samples. gts, depths and depths_alt are float arrays (NaN for NULL),
+            called the mask of the samples called on the record
+        """
+        key = (chrm, pos, ref, alt)
+        if key not in self.counts:
+            # rows of a variant already in the batch are not inserted (conflict), so they are not counted
+            self.counts[key] = variant_counts(gts, called)
+        for sid, gt, dp, dp_alt in zip(samples_ids.tolist(), nan_to_none(gts), nan_to_none(depths), nan_to_none(depths_alt)):
+            self.sample_variants.append({"sample_id": sid, "vcf_line": vcf_line, "bin": bin, "chr": chrm, "pos": pos, "ref": ref, "alt": alt, "genotype": gt, "depth": dp, "depth_alt": dp_alt, "quality": quality, "filter_mask": filter_mask})
+        self.count += len(samples_ids)
+
+
+    def add_coverage(self, samples_ids, chrm, start, end, depths, qualities):
+        """
+            Register a gVCF reference block of the samples (see merge_coverage)
+        """
+        self.coverage += merge_coverage(self.coverage_opened, samples_ids, chrm, start, end, depths, qualities)
+        self.count += len(samples_ids)
+
+
+    def add_annotations(self, name, bin, chrm, pos, ref, alt, rows):
+        """
+            Register annotations of the variant : rows are (trx_pk, values, copy_values) as parsed by vcf_import_annotations
+        """
+        fields = self.annotations_fields[name]
+        for trx_pk, values, copy_values in rows:
+            row = {"bin": bin, "chr": chrm, "pos": pos, "ref": ref, "alt": alt, "regovar_trx_id": trx_pk if trx_pk is not None else "NULL"}
+            row.update(zip(fields, values))
+            self.annotations_rows[name].append(row)
+        self.count += len(rows)
+        return len(rows)
+
+
+    def prepare(self):
+        """
+            Return the batch of data registered since the last prepare (to be written with write()) and reset buffers
+        """
+        self.coverage += [tuple([sid] + r) for sid, r in self.coverage_opened.items()]
+        counts = [{"chr": k[0], "pos": k[1], "ref": k[2], "alt": k[3], "het_count": c[0], "hom_count": c[1], "called_count": c[2]} for k, c in self.counts.items()]
+        batch = {"variants": self.variants, "sample_variants": self.sample_variants, "counts": counts, "annotations_rows": self.annotations_rows, "coverage": self.coverage, "stats": self.stats.rows()}
+        self.reset()
+        return batch
+
+
+    def flush(self):
+        self.write(self.prepare())
+
+
+    def write(self, batch):
+        """
+            Save a batch of data (see prepare()) into the database
+        """
+        query = ""
+        if len(batch["coverage"]) > 0:
+            rows = [{"sample_id": r[0], "chr": r[1], "range": "[{},{})".format(r[2], r[3]), "depth": r[4], "quality": r[5]} for r in batch["coverage"]]
+            query = "INSERT INTO sample_coverage{0} (sample_id, chr, range, depth, quality) SELECT sample_id, chr, range, depth, quality FROM json_populate_recordset(NULL::sample_coverage{0}, {1}) ON CONFLICT DO NOTHING;".format(self.db_ref_suffix, sql_json(rows))
+        if len(batch["variants"]) == 0:
+            if query: Model.execute(query)
+            return
+
+        new = []
+        known = []
+        for key in sorted(batch["variants"].keys()):
+            v = batch["variants"][key]
+            v = dict(v)
+            v["sample_bitmap"] = "\\x" + bitmap_encode(v.pop("samples_ids")).hex()
+            (known if v.pop("known") else new).append(v)
+
+        source = "json_populate_recordset(NULL::variant{0}, {1})"
+        query += variant_upsert_query(self.db_ref_suffix, source.format(self.db_ref_suffix, sql_json(new)), source.format(self.db_ref_suffix, sql_json(known)) if known else None)
+        if len(batch["sample_variants"]) > 0:
+            query += ", sv AS (INSERT INTO sample_variant{0} (sample_id, variant_id, vcf_line, bin, chr, pos, ref, alt, genotype, depth, depth_alt, quality, filter_mask) SELECT r.sample_id, v.id, r.vcf_line, r.bin, r.chr, r.pos, r.ref, r.alt, r.genotype, r.depth, r.depth_alt, r.quality, r.filter_mask FROM json_populate_recordset(NULL::sample_variant{0}, {1}) r INNER JOIN v ON v.chr=r.chr AND v.pos=r.pos AND v.ref=r.ref AND v.alt=r.alt ON CONFLICT (sample_id, variant_id) DO NOTHING RETURNING variant_id)".format(self.db_ref_suffix, sql_json(batch["sample_variants"]))
+            counts = "json_to_recordset({}) AS n (chr integer, pos integer, ref text, alt text, het_count integer, hom_count integer, called_count integer)".format(sql_json(batch["counts"]))
+            query += ", c AS ({})".format(variant_count_query(self.db_ref_suffix, counts, "v", "sv"))
+            if len(batch["stats"]) > 0:
+                query += ", st AS ({})".format(import_stats_query(batch["stats"], "sv"))
+        for idx, name in enumerate(batch["annotations_rows"].keys()):
+            rows = batch["annotations_rows"][name]
+            if len(rows) == 0: continue
+            table = self.annotations[name].table_name
+            fields = []
+            for r in rows:
+                for f in r.keys():
+                    if f not in fields: fields.append(f)
+            query += ", a{0} AS (INSERT INTO {1} (variant_id, {2}) SELECT v.id, {3} FROM json_populate_recordset(NULL::{1}, {4}) r INNER JOIN v ON v.chr=r.chr AND v.pos=r.pos AND v.ref=r.ref AND v.alt=r.alt ON CONFLICT (variant_id, regovar_trx_id) DO NOTHING)".format(
+                idx, table, ",".join(fields), ",".join(["r." + f for f in fields]), sql_json(rows))
+        query += " SELECT count(*) FROM v;"
+        Model.execute(query)
+
+
+    def close(self):
+        self.reset()
+
+
+
+
+# =======================================================================================================
+# COPY WRITER
+# =======================================================================================================
+
+
+class VcfCopyWriter():
+    """
+        Bulk way to import vcf data : parsed records are streamed with "COPY FROM STDIN" into temporary
+        staging tables, and then merged into variant, sample_variant and annotations tables with set-based upserts.
+        A dedicated psycopg2 connection is used as temporary tables only live in the session that created them.
+        The connection is opened with the first write, so a writer used only to prepare batches doesn't connect.
+    """
+
+    def __init__(self, db_ref_suffix, annotations):
+        self.db_ref_suffix = db_ref_suffix
+        self.annotations = {k: v for k, v in annotations.items() if v}
+        self.annotations_fields = {k: v.get_columns_parser().fields for k, v in self.annotations.items()}
+        self.known_variants = KNOWN_VARIANTS.get(db_ref_suffix)
+        self.count = 0
+        self.connection = None
+        self.staging_annotations = []
+        self.reset()
+
+
+    def connect(self):
+        self.connection = Model.new_connection()
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE TEMP TABLE import_variant (chr integer, pos integer, ref text, alt text, is_transition boolean, bin integer, sample_bitmap bytea, known boolean) ON COMMIT DELETE ROWS;")
+        cursor.execute("CREATE TEMP TABLE import_sample_variant (sample_id integer, vcf_line integer, bin integer, chr integer, pos integer, ref text, alt text, genotype integer, depth integer, depth_alt integer, quality real, filter_mask integer) ON COMMIT DELETE ROWS;")
+        cursor.execute("CREATE TEMP TABLE import_variant_id (id bigint, chr integer, pos integer, ref text, alt text) ON COMMIT DELETE ROWS;")
+        cursor.execute("CREATE TEMP TABLE import_variant_count (chr integer, pos integer, ref text, alt text, het_count integer, hom_count integer, called_count integer) ON COMMIT DELETE ROWS;")
+        cursor.execute("CREATE TEMP TABLE import_sample_coverage (sample_id integer, chr integer, range int8range, depth integer, quality real) ON COMMIT DELETE ROWS;")
+        self.connection.commit()
+        cursor.close()
+
+
+    def reset(self):
+        self.variants = io.StringIO()
+        self.sample_variants = io.StringIO()
+        self.counts = {}
+        self.annotations_rows = {name: io.StringIO() for name in self.annotations.keys()}
+        self.coverage = io.StringIO()
+        self.coverage_opened = {}
+        self.stats = SampleImportStats()
+        self.count = 0
+
+
+    def add_variant(self, chrm, pos, ref, alt, is_transition, bin, samples_ids):
+        known = self.known_variants is not None and variant_hash(chrm, pos, ref, alt) in self.known_variants
+        self.variants.write(copy_row([chrm, pos, ref, alt, is_transition, bin, "\\x" + bitmap_encode(samples_ids).hex(), known]))
+
+
+    def add_sample_variants(self, samples_ids, vcf_line, bin, chrm, pos, ref, alt, gts, depths, depths_alt, quality, filter_mask, called):
+        """
+            Register the variant for all samples. gts, depths and depths_alt are float arrays (NaN for NULL),
+            called the mask of the samples called on the record.
+            COPY lines are built with numpy string operations for all samples at once
+        """
+        key = (chrm, pos, ref, alt)
+        if key not in self.counts:
+            self.counts[key] = variant_counts(gts, called)
+        row = np.char.add(samples_ids.astype(str), "\t" + copy_row([vcf_line, bin, chrm, pos, ref, alt])[:-1] + "\t")
+        row = np.char.add(np.char.add(row, copy_int_array(gts)), "\t")
+        row = np.char.add(np.char.add(row, copy_int_array(depths)), "\t")
+        row = np.char.add(row, copy_int_array(depths_alt))
+        row = np.char.add(row, "\t" + copy_row([quality, filter_mask]))
+        self.sample_variants.write("".join(row.tolist()))
+        self.count += len(samples_ids)
+
+
+    def add_coverage(self, samples_ids, chrm, start, end, depths, qualities):
+        """
+            Register a gVCF reference block of the samples (see merge_coverage)
+        """
+        for sid, chrm, start, end, dp, gq in merge_coverage(self.coverage_opened, samples_ids, chrm, start, end, depths, qualities):
+            self.coverage.write(copy_row([sid, chrm, "[{},{})".format(start, end), dp, gq]))
+        self.count += len(samples_ids)
+
+
+    def add_annotations(self, name, bin, chrm, pos, ref, alt, rows):
+        """
+            Register annotations of the variant : rows are (trx_pk, values, copy_values) as parsed by vcf_import_annotations,
+            where copy_values is already the COPY text of the values
+        """
+        buffer = self.annotations_rows[name]
+        variant = copy_row([bin, chrm, pos, ref, alt])[:-1]
+        for trx_pk, values, copy_values in rows:
+            buffer.write("{}\t{}\t{}\n".format(variant, copy_escape(trx_pk) if trx_pk is not None else "NULL", copy_values))
+        self.count += len(rows)
+        return len(rows)
+
+
+    def copy(self, cursor, table, columns, buffer):
+        buffer.seek(0)
+        cursor.copy_expert("COPY {} ({}) FROM STDIN".format(table, ",".join(columns)), buffer)
+
+
+    def write_annotations(self, cursor, name, buffer):
+        importer = self.annotations[name]
+        if buffer.tell() == 0: return
+
+        staging = "import_" + importer.table_name
+        if staging not in self.staging_annotations:
+            cursor.execute("CREATE TEMP TABLE {0} ON COMMIT DELETE ROWS AS SELECT * FROM {1} WITH NO DATA;".format(staging, importer.table_name))
+            self.staging_annotations.append(staging)
+
+        fields = self.annotations_fields[name]
+        self.copy(cursor, staging, ["bin", "chr", "pos", "ref", "alt", "regovar_trx_id"] + fields, buffer)
+
+        cursor.execute("INSERT INTO {0} (variant_id, bin, chr, pos, ref, alt, regovar_trx_id, {2}) SELECT v.id, a.bin, a.chr, a.pos, a.ref, a.alt, a.regovar_trx_id, {3} FROM {1} a INNER JOIN import_variant_id v ON v.chr=a.chr AND v.pos=a.pos AND v.ref=a.ref AND v.alt=a.alt ON CONFLICT (variant_id, regovar_trx_id) DO NOTHING;".format(
+            importer.table_name, staging, ",".join(fields), ",".join(["a." + f for f in fields])))
+
+
+    def prepare(self):
+        """
+            Return the batch of data registered since the last prepare (to be written with write()) and reset buffers
+        """
+        for sid, r in self.coverage_opened.items():
+            self.coverage.write(copy_row([sid, r[0], "[{},{})".format(r[1], r[2]), r[3], r[4]]))
+        counts = io.StringIO()
+        for key, c in self.counts.items():
+            counts.write(copy_row(list(key) + c))
+        batch = {"variants": self.variants, "sample_variants": self.sample_variants, "counts": counts, "annotations_rows": self.annotations_rows, "coverage": self.coverage, "stats": self.stats.rows()}
+        self.reset()
+        return batch
+
+
+    def flush(self):
+        self.write(self.prepare())
+
+
+    def write(self, batch):
+        """
+            Save a batch of data (see prepare()) into the database
+        """
+        if batch["variants"].tell() == 0 and batch["sample_variants"].tell() == 0 and batch["coverage"].tell() == 0 and sum([r.tell() for r in batch["annotations_rows"].values()]) == 0:
+            return
+        if not self.connection:
+            self.connect()
+
+        cursor = self.connection.cursor()
+        try:
+            # Variants : several rows of the batch may target the same variant, so we merge them before the upsert
+            self.copy(cursor, "import_variant", ["chr", "pos", "ref", "alt", "is_transition", "bin", "sample_bitmap", "known"], batch["variants"])
+            # ids returned by the upsert are kept for the batch, so samples associations and annotations 
+            # are joined with this small table instead of the variant table
+            source = "(SELECT chr, pos, ref, alt, bool_or(is_transition) AS is_transition, min(bin) AS bin, bitmap_union(sample_bitmap) AS sample_bitmap FROM import_variant WHERE {}known GROUP BY chr, pos, ref, alt)"
+            query = variant_upsert_query(self.db_ref_suffix, source.format("NOT "), source.format("") if self.known_variants is not None else None)
+            cursor.execute(query + " INSERT INTO import_variant_id SELECT id, chr, pos, ref, alt FROM v;")
+
+            # Variant/sample associations
+            self.copy(cursor, "import_sample_variant", ["sample_id", "vcf_line", "bin", "chr", "pos", "ref", "alt", "genotype", "depth", "depth_alt", "quality", "filter_mask"], batch["sample_variants"])
+            self.copy(cursor, "import_variant_count", ["chr", "pos", "ref", "alt", "het_count", "hom_count", "called_count"], batch["counts"])
+            # occurrences counters of the variants and quality metrics of the samples are updated with the inserted rows
+            query = "WITH sv AS (INSERT INTO sample_variant{0} (sample_id, variant_id, vcf_line, bin, chr, pos, ref, alt, genotype, depth, depth_alt, quality, filter_mask) SELECT s.sample_id, v.id, s.vcf_line, s.bin, s.chr, s.pos, s.ref, s.alt, s.genotype, s.depth, s.depth_alt, s.quality, s.filter_mask FROM import_sample_variant s INNER JOIN import_variant_id v ON v.chr=s.chr AND v.pos=s.pos AND v.ref=s.ref AND v.alt=s.alt ON CONFLICT (sample_id, variant_id) DO NOTHING RETURNING variant_id)".format(self.db_ref_suffix)
+            counts = variant_count_query(self.db_ref_suffix, "import_variant_count n", "import_variant_id v", "sv")
+            if len(batch["stats"]) > 0:
+                query += ", c AS ({}) {};".format(counts, import_stats_query(batch["stats"], "sv"))
+            else:
+                query += " {};".format(counts)
+            cursor.execute(query)
+
+            # Annotations
+            for name, rows in batch["annotations_rows"].items():
+                self.write_annotations(cursor, name, rows)
+
+            # gVCF reference blocks
+            if batch["coverage"].tell() > 0:
+                self.copy(cursor, "import_sample_coverage", ["sample_id", "chr", "range", "depth", "quality"], batch["coverage"])
+                cursor.execute("INSERT INTO sample_coverage{0} (sample_id, chr, range, depth, quality) SELECT sample_id, chr, range, depth, quality FROM import_sample_coverage ON CONFLICT DO NOTHING;".format(self.db_ref_suffix))
+
+            self.connection.commit()
+        except Exception as ex:
+            self.connection.rollback()
+            raise RegovarException("Unable to import vcf data with COPY.", exception=ex)
+        finally:
+            cursor.close()
+
+
+    def close(self):
+        self.reset()
+        if self.connection:
+            self.connection.close()
+            self.connection = None
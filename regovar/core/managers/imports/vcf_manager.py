@@ -13,8 +13,16 @@ import sqlalchemy
 import subprocess
 import reprlib
 import gzip
+import io
+import struct
+import zipfile
+import pysam
 from pysam import VariantFile
 import json
+import multiprocessing as mp
+import itertools
+import numpy as np
+from queue import Empty
 
 from core.managers.imports.abstract_import_manager import AbstractImportManager, AbstractTranscriptDataImporter
 from core.framework.common import *
@@ -23,6 +31,12 @@ import core.model as Model
 from config import *
 from core.managers.imports.vcf_import_vep import VepImporter
 from core.managers.imports.vcf_import_snpeff import SnpEffImporter
+from core.managers.imports.vcf_import_writer import VcfInsertWriter, VcfCopyWriter, load_known_variants
+from core.managers.imports.vcf_import_normalise import normalise, is_transition, getUcscBins, getMaxUcscBin, normalise_records
+from core.managers.imports.vcf_import_kernel import decode_records, genotype_codes, allele_carriers, called_samples, depth_alt, reference_calls
+from core.managers.imports.vcf_import_pipeline import VcfImportPipeline
+from core.managers.imports.import_queue import queue_import, notify_import_event
+from core.managers.imports.vcf_import_stats import save_import_stats
 
 
 
@@ -34,33 +48,127 @@ from core.managers.imports.vcf_import_snpeff import SnpEffImporter
 # Tools
 # =======================================================================================================
 
-def count_vcf_row(filename):
+def open_vcf_text(filename):
     """
-        Use linux OS commands to quickly count variant to parse in the vcf file
+        Open the vcf file as text stream according to its compression
     """
-    bashCommand = 'grep -v "^#" ' + str(filename) +' | wc -l'
+    if filename.endswith(".zip"):
+        archive = zipfile.ZipFile(filename)
+        return io.TextIOWrapper(archive.open(archive.namelist()[0]))
     if filename.endswith("gz"):
-        bashCommand = "z" + bashCommand
-    process = subprocess.Popen(bashCommand, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    cmd_out = process.communicate()[0]
-    # returns results
-    return int(cmd_out.decode('utf8'))
+        return gzip.open(filename, "rt")
+    return open(filename)
+
+
+def is_plain_gzip(filename):
+    """
+        Return True if the file is gzip compressed but not in BGZF (gzip blocks with a "BC" extra subfield) :
+        pysam cannot read such files, they have to be decompressed in a stream (see open_vcf)
+    """
+    with open(filename, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[0:3] != b"\x1f\x8b\x08":
+            return False
+        # FEXTRA flag
+        if not header[3] & 4:
+            return True
+        extra = f.read(struct.unpack("<H", header[10:12])[0])
+    i = 0
+    while i + 4 <= len(extra):
+        if extra[i:i+2] == b"BC":
+            return False
+        i += 4 + struct.unpack("<H", extra[i+2:i+4])[0]
+    return True
+
+
+def estimate_vcf_row(filename, sample_size=10000):
+    """
+        Estimate the number of records of a bgzipped vcf according to the compressed size of its first records.
+        Used for indexed vcf to avoid a full decompression of the file just to get a progress indicator.
+    """
+    vcf = VariantFile(filename)
+    start = vcf.tell() >> 16
+    count = 0
+    for record in vcf:
+        count += 1
+        if count >= sample_size: break
+    end = vcf.tell() >> 16
+    vcf.close()
+    if count < sample_size or end <= start:
+        return count
+    return int(count * (os.path.getsize(filename) - start) / (end - start))
+
+
+def prescan_vcf(filename):
+    """
+        Single streaming pass on the vcf file that :
+         - parses headers (INFO definitions, samples, number of header lines)
+         - counts records. For bgzipped and indexed vcf, the count is estimated (see estimate_vcf_row) 
+           and the file is not decompressed entirely.
+         - checks if pysam can read the file as is : pysam doesn't support zip and non BGZF gzip compression
+           and fails with GVCFBlock headers. In these cases the vcf will be streamed filtered (see open_vcf)
+    """
+    indexed = get_vcf_index(filename) is not None
+    result = {
+        'headers' : {},
+        'samples' : [],
+        'header_count' : 0,
+        'count' : 0,
+        'estimated' : False,
+        'stream' : filename.endswith(".zip") or is_plain_gzip(filename)
+    }
+    headers = result['headers']
+    with open_vcf_text(filename) as f:
+        for line in f:
+            if line.startswith('##'):
+                result['header_count'] += 1
+                l = line[2:].strip()
+                l = [l[0:l.index('=')], l[l.index('=')+1:]]
+                if l[0] == 'GVCFBlock':
+                    # GVCFBlock headers are not imported (and not counted) as they are removed from the stream read by pysam
+                    result['header_count'] -= 1
+                    result['stream'] = True
+                    continue
+                if l[0] not in headers.keys():
+                    if l[0] == 'INFO' :
+                        headers[l[0]] = {}
+                    else:
+                        headers[l[0]] = []
+                if l[0] == 'INFO' :
+                    data = l[1][1:-1].split(',')
+                    info_id   = data[0][3:]
+                    info_type = data[2][5:]
+                    info_desc = data[3][13:-1]
+                    headers['INFO'].update({info_id : {'type' : info_type, 'description' : info_desc}})
+                else:
+                    headers[l[0]].append(l[1])
+            elif line.startswith('#'):
+                result['header_count'] += 1
+                result['samples'] = line[1:].strip().split('\t')[9:]
+            elif indexed:
+                break
+            else:
+                result['count'] += 1
+
+    if indexed:
+        result['count'] = estimate_vcf_row(filename)
+        result['estimated'] = True
+    return result
 
 
-def debug_clear_header(filename):
+def open_vcf(vcf_metadata):
     """
-        A workaround to fix a bug with GVCF header with pysam
-        EDIT : in fact the problem to be that pysam do not support some kind of compression, so this command 
-        is still used to rezip the vcf in a supported format.
+        Return a pysam VariantFile to parse the vcf. When pysam cannot read the file as is (see prescan_vcf),
+        the file is decompressed and streamed without its GVCFBlock headers through a pipe (no temporary copy of the file)
     """
-    bashCommand = "grep -v '^##GVCFBlock' {0} > {0}.regovar_import".format(filename)
+    filename = vcf_metadata['path']
+    if not vcf_metadata['stream']:
+        return VariantFile(filename)
+    bashCommand = "grep -v '^##GVCFBlock' {0}".format(filename)
     if filename.endswith("gz") or filename.endswith("zip"):
         bashCommand = "z" + bashCommand
-    process = subprocess.Popen(bashCommand, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    #bashCommand = "mv /var/regovar/downloads/tmp_workaround  {} ".format(filename)
-    #process = subprocess.Popen(bashCommand, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    process.wait()
-    return "{}.regovar_import".format(filename)
+    process = subprocess.Popen(bashCommand, shell=True, stdout=subprocess.PIPE)
+    return VariantFile(process.stdout)
 
 
 def prepare_vcf_parsing(reference_id, filename):
@@ -68,42 +176,10 @@ def prepare_vcf_parsing(reference_id, filename):
         Parse vf headers and return information about which data shall be parsed
         and stored in the database
     """
-    # Extract headers
-    filename = debug_clear_header(filename)
-
-    hcount = 0
-    headers = {}
-    samples = []
-    _op = open
-    #if filename.endswith('gz') or filename.endswith('zip'):
-        #_op = gzip.open
     try:
-        with _op(filename) as f:
-            for line in f:
-                hcount += 1
-                if _op != open:
-                    line = line.decode()
-                if line.startswith('##'):
-                    l = line[2:].strip()
-                    l = [l[0:l.index('=')], l[l.index('=')+1:]]
-                    if l[0] not in headers.keys():
-                        if l[0] == 'INFO' :
-                            headers[l[0]] = {}
-                        else:
-                            headers[l[0]] = []
-                    if l[0] == 'INFO' :
-                        data = l[1][1:-1].split(',')
-                        info_id   = data[0][3:]
-                        info_type = data[2][5:]
-                        info_desc = data[3][13:-1]
-                        headers['INFO'].update({info_id : {'type' : info_type, 'description' : info_desc}})
-                    else:
-                        headers[l[0]].append(l[1])
-                elif line.startswith('#'):
-                    samples = line[1:].strip().split('\t')[9:]
-                else :
-                    hcount -= 1
-                    break;
+        # Extract headers
+        scan = prescan_vcf(filename)
+        headers = scan['headers']
 
         # Check for VEP
         vep_imp = VepImporter()
@@ -147,11 +223,14 @@ def prepare_vcf_parsing(reference_id, filename):
         result = {
             'vcf_version' : headers['fileformat'][0],
             'name'  : os.path.split(filename)[1],
-            'header_count': hcount,
-            'count' : count_vcf_row(filename),
+            'path'  : filename,
+            'header_count': scan['header_count'],
+            'count' : scan['count'],
+            'count_estimated' : scan['estimated'],
+            'stream' : scan['stream'],
             'size'  : os.path.getsize(filename),
             'type'  : file_type,
-            'samples' : samples,
+            'samples' : scan['samples'],
             'annotations' : {}
         }
         result['annotations'].update(vep)
@@ -166,43 +245,6 @@ def prepare_vcf_parsing(reference_id, filename):
 
 
 
-    
-
-
-def normalise(pos, ref, alt):
-    """
-        Normalise given (position, ref and alt) from VCF into Database format
-            - Assuming that position in VCF are 1-based (0-based in Database)
-            - triming ref and alt to get minimal alt (and update position accordingly)
-    """
-    # input pos comming from VCF are 1-based.
-    # to be consistent with UCSC databases we convert it into 0-based
-    pos -= 1
-    
-    if ref is None:
-        ref = ''
-    if alt is None:
-        alt = ''
-    # ref/ref special case
-    if ref==alt:
-        return pos, ref, alt
-    # trim left
-    while len(ref) > 0 and len(alt) > 0 and ref[0]==alt[0] :
-        ref = ref[1:]
-        alt = alt[1:]
-        pos += 1
-    # trim right
-    if len(ref) == len(alt):
-        while ref[-1:]==alt[-1:]:
-            ref = ref[0:-1]
-            alt = alt[0:-1]
-    return pos, ref, alt
-
-
-
-
-
-
 
 
 def normalise_annotation_name(name):
@@ -419,16 +461,6 @@ def sqlc(data, default="NULL"):
 
 
 
-def is_transition(ref, alt):
-    """
-        Return true if the variant is a transversion; false otherwise
-    """
-    tr = ref+alt
-    if len(ref) == 1 and tr in ("AG", "GA", "CT", "TC"):
-        return True
-    return False
-
-
 
 def escape_value_for_sql(value):
     if type(value) is str:
@@ -440,246 +472,410 @@ def escape_value_for_sql(value):
 
 
 
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-# Tiers code from vtools.  Bin index calculation 
-# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
 
-#
-# Utility function to calculate bins.
-#
-# This function implements a hashing scheme that UCSC uses (developed by Jim Kent) to 
-# take in a genomic coordinate range and return a set of genomic "bins" that your range
-# intersects.  I found a Java implementation on-line (I need to find the URL) and I
-# simply manually converted the Java code into Python code.  
+
+
+
+
+
+
+
+# =======================================================================================================
+# Import manager
+# =======================================================================================================
+
+# Available writers to save parsed vcf data into the database
+VCF_IMPORT_WRITERS = {
+    "insert" : VcfInsertWriter,
+    "copy"   : VcfCopyWriter
+}
+
+
+
+# Symbolic alleles of gVCF reference blocks (GATK and bcftools)
+GVCF_NON_REF = ["<NON_REF>", "<*>"]
+
+
+def is_reference_block(row):
+    """
+        Return true if the record is a reference block of a gVCF (no alt but the symbolic non-ref allele)
+    """
+    return row.alts is not None and all([a in GVCF_NON_REF for a in row.alts])
+
+
+def encode_vcf_record(row, r, data, codes, writer, samples_ids, vcf_line):
+    """
+        Register the record (variants, samples associations and annotations) into the writer.
+        data and codes are the arrays decoded by the numpy kernel for the block of the record, r is the index of
+        the record in the block
+    """
+    chrm = normalize_chr(str(row.chrom))
+    if chrm is None:
+        # variants tables are partitioned by chromosome (chr cannot be NULL)
+        war("VCF import : record of line {} ignored (unknown chromosome {})".format(vcf_line, row.chrom))
+        return chrm
+    if VCF_IMPORT_GVCF_COVERAGE and is_reference_block(row):
+        # gVCF reference block : only saved as coverage range [start, END) of the samples called ref/ref
+        covered = reference_calls(data["gt"][r])
+        if covered.any():
+            writer.add_coverage(samples_ids[covered].tolist(), chrm, row.start, row.stop, data["dp"][r][covered], data["gq"][r][covered])
+        return chrm
+
+    filter_mask = data["filter"][r]
+    quality = row.qual if row.qual else None
+    gt = data["gt"][r]
+    called = called_samples(gt)
     
-# IMPORTANT: Because this is UCSC code the start coordinates are 0-based and the end 
-# coordinates are 1-based!!!!!!
-        
-# BINRANGE_MAXEND_512M = 512 * 1024 * 1024
-# binOffsetOldToExtended = 4681; #  (4096 + 512 + 64 + 8 + 1 + 0)
-
-_BINOFFSETS = (
-    512+64+8+1,   # = 585, min val for level 0 bins (128kb binsize)    
-    64+8+1,       # =  73, min val for level 1 bins (1Mb binsize) 
-    8+1,          # =   9, min val for level 2 bins (8Mb binsize)  
-    1,            # =   1, min val for level 3 bins (64Mb binsize)  
-    0)            # =   0, only val for level 4 bin (512Mb binsize)
+    for allele_idx, (pos, ref, alt, transition, bin) in enumerate(data["variants"][r]):
+        # get list of sample that have this variant (chr-pos-ref-alt)
+        carriers = allele_carriers(gt, allele_idx)
+        if not carriers.any(): continue
+        # save variant
+        writer.add_variant(chrm, pos, ref, alt, transition, bin, samples_ids[carriers].tolist())
+                
+        # Register variant/sample associations (samples that HAVE NOT this variant have NULL genotype)
+        gts = np.where(carriers, codes[r], np.nan)
+        depths_alt = np.where(carriers, depth_alt(data, r, allele_idx, codes[r]), np.nan)
+        writer.add_sample_variants(samples_ids, vcf_line, bin, chrm, pos, ref, alt, gts, data["dp"][r], depths_alt, quality, filter_mask, called)
+        writer.stats.add(samples_ids, ref, alt, transition, gts, data["dp"][r], filter_mask)
         
-#    1:   0000 0000 0000 0001    1<<0       
-#    8:   0000 0000 0000 1000    1<<3
-#   64:   0000 0000 0100 0000    1<<6
-#  512:   0000 0010 0000 0000    1<<9
-    
-_BINFIRSTSHIFT = 17;            # How much to shift to get to finest bin.
-_BINNEXTSHIFT = 3;              # How much to shift to get to next larger bin.
-_BINLEVELS = len(_BINOFFSETS)
-    
-#
-# IMPORTANT: the start coordinate is 0-based and the end coordinate is 1-based.
-#
-def getUcscBins(start, end):
-    bins = []
-    startBin = start >> _BINFIRSTSHIFT
-    endBin = (end-1) >> _BINFIRSTSHIFT
-    for i in range(_BINLEVELS):
-        offset = _BINOFFSETS[i];
-        if startBin == endBin:
-            bins.append(startBin + offset)
-        else:
-            for bin in range(startBin + offset, endBin + offset):
-                bins.append(bin);
-        startBin >>= _BINNEXTSHIFT
-        endBin >>= _BINNEXTSHIFT
-    return bins
-
-def getMaxUcscBin(start, end):
-    bin = 0
-    startBin = start >> _BINFIRSTSHIFT
-    endBin = (end-1) >> _BINFIRSTSHIFT
-    for i in range(_BINLEVELS):
-        offset = _BINOFFSETS[i];
-        if startBin == endBin:
-            if startBin + offset > bin:
-                bin = startBin + offset
+        # Register variant annotations (the ones of this allele)
+        for name, annotations in data["annotations"].items():
+            if alt in annotations[r]:
+                writer.add_annotations(name, bin, chrm, pos, ref, alt, annotations[r][alt])
+    return chrm
+
+
+def iter_vcf_blocks(vcf_records, samples, annotations={}, block_size=VCF_IMPORT_BLOCK_SIZE):
+    """
+        Read vcf records by blocks and decode them with the numpy kernel. Transcripts annotations of the provided
+        importers are parsed by block too, in data["annotations"] (see vcf_import_annotations), and the alleles of the
+        records are normalised in data["variants"] (see normalise_records).
+        FILTER fields are converted into the filter masks of the samples in data["filter"] (see Sample.filter_codes).
+        Yield tuples (records, data, codes, samples_ids, offsets). offsets is the list of the position in the file
+        after each record (to resume the import with seek), or None if the records are not read from a seekable VariantFile
+    """
+    samples_ids = None
+    filter_masks = {}
+    parsers = {name: importer.get_columns_parser() for name, importer in annotations.items() if importer}
+    seekable = hasattr(vcf_records, "tell") and not getattr(vcf_records, "is_stream", True)
+    reader = vcf_records
+    vcf_records = iter(vcf_records)
+    while True:
+        if seekable:
+            block = []
+            offsets = []
+            for record in itertools.islice(vcf_records, block_size):
+                block.append(record)
+                offsets.append(reader.tell())
         else:
-            for i in range(startBin + offset, endBin + offset):
-                if i > bin:
-                    bin = i 
-        startBin >>= _BINNEXTSHIFT
-        endBin >>= _BINNEXTSHIFT
-    return bin
+            block = list(itertools.islice(vcf_records, block_size))
+            offsets = None
+        if len(block) == 0: break
+        if samples_ids is None:
+            samples_ids = np.array([samples[sn]["id"] for sn in block[0].header.samples])
+            filter_codes = Model.Sample.filter_codes(block[0].header.filters.keys())
+            if len(filter_codes) < len(block[0].header.filters.keys()):
+                war("VCF import : only the {} first filters (sorted by name) of the vcf are imported".format(len(filter_codes)))
+        data = decode_records(block)
+        for f in set(data["filter"]) - set(filter_masks.keys()):
+            filter_masks[f] = Model.Sample.filter_mask(f.split(';'), filter_codes)
+        data["filter"] = [filter_masks[f] for f in data["filter"]]
+        data["annotations"] = {name: parsers[name].parse(data["info"]) for name in parsers}
+        data["variants"] = normalise_records(block)
+        yield block, data, genotype_codes(data["gt"]), samples_ids, offsets
+
+
+def import_vcf_records(vcf_records, writer, samples, vcf_line, progress_callback=None, records_current=0):
+    """
+        Parse the provided vcf records and save variants, samples associations and annotations with the writer.
+        vcf_line is the line number in the vcf file of the first record.
+        progress_callback(records_current, chrm, vcf_line, offset) is called each time a batch is committed, with the
+        vcf_line and the offset in the file (None if unknown) of the last committed record.
+        records_current is the number of records already imported (when resuming an import).
+        Samples data are decoded by blocks of records with the numpy kernel (see vcf_import_kernel).
+        Return the number of parsed records
+    """
+    chrm = None
+    offset = None
+    for block, data, codes, samples_ids, offsets in iter_vcf_blocks(vcf_records, samples, writer.annotations):
+        for r, row in enumerate(block):
+            records_current += 1 
+            vcf_line += 1
+            chrm = encode_vcf_record(row, r, data, codes, writer, samples_ids, vcf_line)
+            offset = offsets[r] if offsets else None
+
+            # split big request to avoid sql out of memory transaction or too long freeze of the server
+            if writer.count >= 1000:
+                writer.flush()
+                if progress_callback: progress_callback(records_current, chrm, vcf_line, offset)
+
+    # Loop done, execute last pending query 
+    writer.flush()
+    if progress_callback: progress_callback(records_current, chrm, vcf_line, offset)
+    return records_current
+
+
+
+
+# =======================================================================================================
+# Import checkpoints
+# =======================================================================================================
+#
+# After each committed batch, the progress of the import is saved in the import_checkpoint table :
+#  - shard '' : samples created for the import (json {sample name: sample id}) and, for the serial/pipelined import,
+#               the number of records, the vcf_line and the offset in the file of the last committed record
+#  - shard 'contig:start-end' : the same for each region of the sharded import
+# A retried import of the same file/reference reuses the samples and continues from the checkpoints.
+# Checkpoints are saved after the commit of the batch : a batch may be imported twice, which is safe as
+# all imports queries are upserts.
+
+def get_vcf_shard_key(shard):
+    contig, start, end = shard
+    return "{}:{}-{}".format(contig, start, end if end is not None else "")
+
 
+def get_import_checkpoints(file_id, reference_id):
+    """
+        Return the checkpoints of the import of the file, as a dict {shard key: checkpoint}
+    """
+    sql = "SELECT shard, samples, records, vcf_line, \"offset\", done FROM import_checkpoint WHERE file_id={} AND reference_id={}".format(file_id, reference_id)
+    return {row.shard: row for row in Model.execute(sql)}
 
 
+def save_import_checkpoint(file_id, reference_id, shard="", records=0, vcf_line=None, offset=None, done=False, samples=None):
+    """
+        Create or update the checkpoint of the import (see above).
+    """
+    samples = "'{}'".format(json.dumps(samples).replace("'", "''").replace(':', '\\:')) if samples is not None else "NULL"
+    sql = "INSERT INTO import_checkpoint (file_id, reference_id, shard, samples, records, vcf_line, \"offset\", done, update_date) VALUES ({}, {}, '{}', {}, {}, {}, {}, {}, CURRENT_TIMESTAMP) "
+    sql += "ON CONFLICT (file_id, reference_id, shard) DO UPDATE SET samples=COALESCE(EXCLUDED.samples, import_checkpoint.samples), records=EXCLUDED.records, vcf_line=EXCLUDED.vcf_line, \"offset\"=EXCLUDED.\"offset\", done=EXCLUDED.done, update_date=EXCLUDED.update_date"
+    vcf_line = vcf_line if vcf_line is not None else "NULL"
+    offset = offset if offset is not None else "NULL"
+    Model.execute(sql.format(file_id, reference_id, shard, samples, records, vcf_line, offset, done))
 
 
+def clear_import_checkpoints(file_id, reference_id):
+    Model.execute("DELETE FROM import_checkpoint WHERE file_id={} AND reference_id={}".format(file_id, reference_id))
 
 
 
 
 # =======================================================================================================
-# Import manager
+# Sharded import
 # =======================================================================================================
 
-# from queue import Queue
-# from threading import Thread
+def get_vcf_index(filepath):
+    """
+        Return the path of the tabix/csi index of the vcf if exists; None otherwise
+    """
+    for ext in [".tbi", ".csi"]:
+        if os.path.exists(filepath + ext):
+            return filepath + ext
+    return None
 
 
+def get_vcf_shards(filepath, shard_size=VCF_IMPORT_SHARD_SIZE):
+    """
+        Split a bgzipped and indexed vcf into regions (contig, start, end) that can be imported independently.
+        Regions are returned in the order of the file. Return None if the vcf cannot be sharded.
+    """
+    if not (filepath.endswith(".gz") or filepath.endswith(".bgz")) or not get_vcf_index(filepath):
+        return None
+    try:
+        vcf = VariantFile(filepath)
+        lengths = {c: vcf.header.contigs[c].length for c in vcf.header.contigs}
+        contigs = list(vcf.index.keys())
+        vcf.close()
+    except Exception as ex:
+        war("Unable to shard the vcf file {} : {}".format(filepath, ex))
+        return None
+
+    shards = []
+    for contig in contigs:
+        length = lengths.get(contig)
+        if length and shard_size:
+            for start in range(0, length, shard_size):
+                # last region is open to keep records beyond the declared length of the contig
+                shards.append((contig, start, start + shard_size if start + shard_size < length else None))
+        else:
+            shards.append((contig, 0, None))
+    return shards
 
 
+def fetch_vcf_shard(vcf, shard):
+    """
+        Return records of the shard. Records that overlap the start of the region belong to the previous region
+    """
+    contig, start, end = shard
+    for record in vcf.fetch(contig, start, end):
+        if record.start >= start:
+            yield record
 
-# # define bw worker
-# def vcf_import_worker(queue, file_id, samples):
-#     while True:
-#         query = queue.get()
-#         if query is None:
-#             break
-        
-#         Model.execute(query)
-#         queue.task_done()
-        
-        
+
+def count_vcf_shard(args):
+    """
+        Shard worker : count records of the shard (raw tabix lines to not parse them)
+    """
+    filepath, shard = args
+    contig, start, end = shard
+    count = 0
+    tbx = pysam.TabixFile(filepath)
+    for line in tbx.fetch(contig, start, end):
+        if int(line.split('\t', 2)[1]) - 1 >= start:
+            count += 1
+    tbx.close()
+    return count
+
+
+def import_vcf_shard(args):
+    """
+        Shard worker : import records of the shard with its own database connection.
+        The first "skip" records of the shard (already imported according to the checkpoint) are not imported again.
+        Progress is sent to the parent process through the queue as (shard index, records imported, chrm, vcf_line)
+    """
+    filepath, shard_idx, shard, vcf_line, skip, db_ref_suffix, annotations, samples, import_mode, progress_queue = args
+    vcf = VariantFile(filepath)
+    writer = VCF_IMPORT_WRITERS[import_mode](db_ref_suffix, annotations)
+    try:
+        records = itertools.islice(fetch_vcf_shard(vcf, shard), skip, None)
+        callback = lambda records, chrm, vcf_line, offset: progress_queue.put((shard_idx, records, chrm, vcf_line))
+        return import_vcf_records(records, writer, samples, vcf_line + skip, callback, skip)
+    finally:
+        writer.close()
+        vcf.close()
 
 
 
 
-            
-            
 class VcfManager(AbstractImportManager):
     metadata = {
         "name" : "VCF",
         "input" :  ["vcf", "vcf.gz"],
         "description" : "Import variants from vcf file"
     }
+    # pipeline of the running pipelined import (its stages counters can be read while the import runs)
+    pipeline = None
 
 
-    def import_delegate(self, file_id, vcf_reader, reference_id, db_ref_suffix, vcf_metadata, samples):
+    def notify_progress(self, file_id, reference_id, samples, records_current, records_count, chrm):
         """
-            This delegate will do the "real" import.
-            It will be called by the "import_data" method in a new thread in order to don't block the main thread
+            Update the loading progress of the samples and notify clients (through the server, see import_event)
         """
-        from core.core import core
-        # parsing vcf file
-        records_count = vcf_metadata['count']
-        records_current = 0
-        vcf_line = vcf_metadata['header_count']
-        table = "variant" + db_ref_suffix
-        
-        sql_pattern1 = "INSERT INTO {0} (chr, pos, ref, alt, is_transition, bin, sample_list) VALUES ({1}, {2}, '{3}', '{4}', {5}, {6}, array[{7}]) ON CONFLICT (chr, pos, ref, alt) DO UPDATE SET sample_list=array_intersect({0}.sample_list, array[{7}])  WHERE {0}.chr={1} AND {0}.pos={2} AND {0}.ref='{3}' AND {0}.alt='{4}';"
-        sql_pattern2 = "INSERT INTO sample_variant" + db_ref_suffix + " (sample_id, variant_id, vcf_line, bin, chr, pos, ref, alt, genotype, depth, depth_alt, quality, filter) SELECT {0}, id, {1}, {2}, '{3}', {4}, '{5}', '{6}', {7}, {8}, {9}, {10}, '{11}' FROM variant" + db_ref_suffix + " WHERE bin={2} AND chr={3} AND pos={4} AND ref='{5}' AND alt='{6}' ON CONFLICT (sample_id, variant_id) DO NOTHING;"
+        progress = records_current / records_count if records_count else 0
+        log("VCF import : line {} (chrm {})".format(records_current, chrm))
+        log("VCF import : Execute sync query {}/{} ({}%)".format(records_current, records_count, round(progress * 100, 2)))
         
-        sql_annot_trx = "INSERT INTO {0} (variant_id, bin,chr,pos,ref,alt, regovar_trx_id, {1}) SELECT id, {3},{4},{5},'{6}','{7}', '{8}', {2} FROM variant" + db_ref_suffix + " WHERE bin={3} AND chr={4} AND pos={5} AND ref='{6}' AND alt='{7}' ON CONFLICT (variant_id, regovar_trx_id) DO  NOTHING; " # TODO : do update on conflict
-        sql_annot_var = "INSERT INTO {0} (variant_id, bin,chr,pos,ref,alt, {1}) SELECT id, {3},{4},{5},'{6}','{7}', {2} FROM variant" + db_ref_suffix + " WHERE bin={3} AND chr={4} AND pos={5} AND ref='{6}' AND alt='{7}' ON CONFLICT (variant_id) DO  NOTHING;"
+        # update sample's progress indicator
+        # note : as we are updating lot of data in the database with several asynch thread
+        #        so to avoid conflict with session, we update data from "manual query"
+        sql = "UPDATE sample SET loading_progress={} WHERE id IN ({})".format(progress, ",".join([str(samples[sid]["id"]) for sid in samples]))
+        Model.execute(sql)
+        notify_import_event("import_vcf_processing", file_id, reference_id, status="loading", progress=progress)
+
 
-        sql_query1 = ""
-        sql_query2 = ""
-        sql_query3 = ""
-        count = 0
+    def import_sharded(self, file_id, shards, reference_id, db_ref_suffix, vcf_metadata, samples, import_mode, checkpoints={}):
+        """
+            Import the vcf by regions with a pool of VCF_IMPORT_SHARD_WORKERS processes.
+            vcf_line of the records are the same as with the serial import : the first pass count records of each shard
+            to compute the line offset of each one.
+            Each shard has its own checkpoint : done shards are skipped and others continue from their checkpoint.
+        """
+        filepath = vcf_metadata["path"]
+        records_count = vcf_metadata["count"]
+        manager = mp.Manager()
+        progress_queue = manager.Queue()
+        progress = {}
+        keys = [get_vcf_shard_key(shard) for shard in shards]
         
-        for row in vcf_reader: 
-            records_current += 1 
-            vcf_line += 1
-            #log("> {} : {}".format(records_current, count))
-            #if records_current == 14356:
-                #ipdb.set_trace()
-                    
-            # TODO : update sample's progress indicator
-            
-            
-            chrm = normalize_chr(str(row.chrom))
-            
-            for allele in row.alleles:
-                pos, ref, alt = normalise(row.pos, row.ref, allele)
-                bin = getMaxUcscBin(pos, pos + len(ref))
-                
-                # get list of sample that have this variant (chr-pos-ref-alt)
-                samples_array = []
-                for sn, sp in row.samples.items():
-                    if allele in sp.alleles:
-                        samples_array.append(samples[sp.name]["id"])
-                if len(samples_array) == 0: continue
-                # save variant
-                samples_array = ",".join([str(s) for s in samples_array])
-                sql_query1 += sql_pattern1.format(table, chrm, pos, ref, alt, is_transition(ref, alt), bin, samples_array)
-                        
-                # Register variant/sample associations
-                for sn, sp in row.samples.items():
-                    gt = normalize_gt(sp)
-                    filters = escape_value_for_sql(json.dumps(row.filter.keys()))
-                    count += 1
-                    if allele in sp.alleles:
-                        if "AD" in sp.keys():
-                            # Get allelic depth if exists (AD field)
-                            depth_alt = sp["AD"][sp.alleles.index(allele)] 
-                        elif "DP4" in sp.keys():
-                            if gt == 0:
-                                depth_alt = sum(sp["DP4"])
-                            else:
-                                depth_alt = sp["DP4"][2] + sp["DP4"][3] if alt != ref else sp["DP4"][0] + sp["DP4"][1]
-                        else :
-                            depth_alt = "NULL"
-                        
-                        sql_query2 += sql_pattern2.format(samples[sn]["id"], vcf_line, bin, chrm, pos, ref, alt, gt, get_info(sp, "DP"), sqlc(depth_alt), sqlc(row.qual), filters)
-                    else:
-                        # save that the sample HAVE NOT this variant
-                        sql_query2 += sql_pattern2.format(samples[sn]["id"], vcf_line, bin, chrm, pos, ref, alt, "NULL", get_info(sp, "DP"), "NULL", sqlc(row.qual), filters)
-                
-                # Register variant annotations
-                for ann_name, importer in vcf_metadata["annotations"].items():
-                    if importer:
-                        importer_query, importer_count = importer.import_annotations(sql_annot_trx, bin, chrm, pos, ref, alt, row.info)
-                        sql_query3 += importer_query
-                        count += importer_count
-                        
-                            
+        # fork is required as workers use the already loaded model/config
+        with mp.get_context("fork").Pool(VCF_IMPORT_SHARD_WORKERS, initializer=Model.init_forked_process) as pool:
+            counts = pool.map(count_vcf_shard, [(filepath, shard) for shard in shards])
+            # exact count is now known (prescan may only have estimated it)
+            records_count = sum(counts)
+            vcf_line = vcf_metadata["header_count"]
+            tasks = []
+            for idx, shard in enumerate(shards):
+                checkpoint = checkpoints.get(keys[idx])
+                skip = checkpoint.records if checkpoint else 0
+                progress[idx] = min(skip, counts[idx])
+                if counts[idx] > skip and not (checkpoint and checkpoint.done):
+                    tasks.append((filepath, idx, shard, vcf_line, skip, db_ref_suffix, vcf_metadata["annotations"], samples, import_mode, progress_queue))
+                vcf_line += counts[idx]
+            log("VCF import : {} records split into {} shards ({} workers, {} records already imported)".format(sum(counts), len(tasks), VCF_IMPORT_SHARD_WORKERS, sum(progress.values())))
+
+            result = pool.map_async(import_vcf_shard, tasks)
+            while not result.ready() or not progress_queue.empty():
+                try:
+                    idx, records, chrm, vcf_line = progress_queue.get(timeout=1)
+                except Empty:
+                    continue
+                progress[idx] = records
+                save_import_checkpoint(file_id, reference_id, keys[idx], records, vcf_line, done=records >= counts[idx])
+                self.notify_progress(file_id, reference_id, samples, sum(progress.values()), records_count, chrm)
+            # raise the exception of the worker if any
+            result.get()
+        manager.shutdown()
+
+
+    def resume_vcf_reader(self, vcf_reader, checkpoint):
+        """
+            Move the reader after the last record saved by the checkpoint of the serial/pipelined import.
+            Use the offset in the file when available, otherwise skip the already imported records.
+        """
+        if checkpoint["offset"] is not None and not vcf_reader.is_stream:
+            vcf_reader.seek(checkpoint["offset"])
+            return vcf_reader
+        return itertools.islice(vcf_reader, checkpoint["records"], None)
 
 
-            # split big request to avoid sql out of memory transaction or too long freeze of the server
-            if count >= 1000:
-                progress = records_current / records_count
-                count = 0
-                transaction = "BEGIN; " + sql_query1 + sql_query2 + sql_query3 + "COMMIT; "
-                log("VCF import : line {} (chrm {})".format(records_current, chrm))
-                log("VCF import : Execute sync query {}/{} ({}%)".format(records_current, records_count, round(progress * 100, 2)))
-                
-                    
-                # update sample's progress indicator
-                # note : as we are updating lot of data in the database with several asynch thread
-                #        so to avoid conflict with session, we update data from "manual query"
-                sps = []
-                sql = "UPDATE sample SET loading_progress={} WHERE id IN ({})".format(progress, ",".join([str(samples[sid]["id"]) for sid in samples]))
-                Model.execute(sql)
-                core.notify_all({"action": "import_vcf_processing", "data" : {"reference_id": reference_id, "file_id" : file_id, "status" : "loading", "progress": progress, "samples": [ {"id" : samples[sname]["id"], "name" : sname} for sname in samples]}})
-                
-                #log("VCF import : enqueue query")
-                #self.queue.put(transaction)
-                log("VCF import : execute query")
-                Model.execute(transaction)
-                # Reset query buffers
-                sql_query1 = ""
-                sql_query2 = ""
-                sql_query3 = ""
-
-        # # Loop done, execute last pending query 
-        # log("VCF import : Execute last async query")
-        # transaction = sql_query1 + sql_query2 + sql_query3
-        # if transaction:
-        #     self.queue.put(transaction)
-
-
-        # # Waiting that all query in the queue was executed
-        # log("VCF parsing done. Waiting for async execution of sql queries")
-        
-        # # block until all tasks are done
-        # self.queue.join()
-        # log("No more sql query to proceed")
-        
-        # # stop vcf_import_thread_workers
-        # for i in range(VCF_IMPORT_MAX_THREAD):
-        #     self.queue.put(None)
-        # for t in self.workers:
-        #     t.join()
+    def import_delegate(self, file_id, vcf_reader, reference_id, db_ref_suffix, vcf_metadata, samples, import_mode=VCF_IMPORT_MODE, checkpoints={}):
+        """
+            This delegate will do the "real" import.
+            It is called by the import workers (see import_queued), in order to don't load the server process
+            checkpoints are the ones of a previous interrupted import of the file (see get_import_checkpoints) to resume it.
+            Return the counters of the stages of the pipelined import ({stage: VcfImportStage.to_json()}, empty for other imports)
+        """
+        stages = {}
+        # parsing vcf file
+        records_count = vcf_metadata['count']
+        checkpoint = {"records": 0, "vcf_line": vcf_metadata['header_count'], "offset": None}
+        if "" in checkpoints and checkpoints[""].records > 0:
+            checkpoint = {"records": checkpoints[""].records, "vcf_line": checkpoints[""].vcf_line, "offset": checkpoints[""].offset}
+            log("VCF import : resume import after {} records (line {})".format(checkpoint["records"], checkpoint["vcf_line"]))
+
+        def save_progress(records, chrm, vcf_line, offset):
+            save_import_checkpoint(file_id, reference_id, "", records, vcf_line, offset)
+            self.notify_progress(file_id, reference_id, samples, records, records_count, chrm)
+
+        # variants already known by the reference take a lighter write path (see load_known_variants). The filter is kept
+        # by the worker for the next imports of the reference
+        if VCF_IMPORT_BLOOM_ERROR > 0:
+            start = datetime.datetime.now()
+            known = load_known_variants(db_ref_suffix, VCF_IMPORT_BLOOM_ERROR, records_count - checkpoint["records"], VCF_IMPORT_BLOOM_MIN_RATIO)
+            if known:
+                log("VCF import : filter of the known variants loaded in {} ({} MB)".format(datetime.datetime.now() - start, round(known.bits.nbytes / 1048576, 1)))
+
+        # a serial/pipelined import cannot be resumed by shards
+        shards = get_vcf_shards(vcf_metadata["path"]) if VCF_IMPORT_SHARD_WORKERS > 1 and checkpoint["records"] == 0 else None
+        if shards:
+            log("VCF import : sharded import ({})".format(import_mode))
+            self.import_sharded(file_id, shards, reference_id, db_ref_suffix, vcf_metadata, samples, import_mode, checkpoints)
+        elif VCF_IMPORT_MAX_THREAD > 1:
+            log("VCF import : pipelined import ({}, {} writers)".format(import_mode, VCF_IMPORT_MAX_THREAD))
+            vcf_records = self.resume_vcf_reader(vcf_reader, checkpoint) if checkpoint["records"] > 0 else vcf_reader
+            self.pipeline = VcfImportPipeline(VCF_IMPORT_WRITERS[import_mode], db_ref_suffix, vcf_metadata["annotations"])
+            self.pipeline.run(vcf_records, samples, checkpoint["vcf_line"], save_progress, checkpoint["records"])
+            stages = {name: stage.to_json() for name, stage in self.pipeline.stages.items()}
+        else:
+            log("VCF import : serial import ({})".format(import_mode))
+            vcf_records = self.resume_vcf_reader(vcf_reader, checkpoint) if checkpoint["records"] > 0 else vcf_reader
+            writer = VCF_IMPORT_WRITERS[import_mode](db_ref_suffix, vcf_metadata["annotations"])
+            try:
+                import_vcf_records(vcf_records, writer, samples, checkpoint["vcf_line"], save_progress, checkpoint["records"])
+            finally:
+                writer.close()
 
         # Compute composite variant by sample
         sql_pattern = "UPDATE sample_variant" + db_ref_suffix + " u SET is_composite=TRUE WHERE u.sample_id = {0} AND u.variant_id IN (SELECT DISTINCT UNNEST(sub.vids) as variant_id FROM (SELECT array_agg(v.variant_id) as vids, g.name2 FROM sample_variant" + db_ref_suffix + " v INNER JOIN refgene" + db_ref_suffix + " g ON g.chr=v.chr AND g.trxrange @> v.pos WHERE v.sample_id={0} AND v.genotype=2 or v.genotype=3 GROUP BY name2 HAVING count(*) > 1) AS sub)"
@@ -691,36 +887,97 @@ class VcfManager(AbstractImportManager):
         log("Sample import from VCF Done")
         end = datetime.datetime.now()
         
+        # quality metrics of the samples computed during the import (see vcf_import_stats)
+        save_import_stats([samples[sid]["id"] for sid in samples])
+
         # update sample's progress indicator
         Model.execute("UPDATE sample SET status='ready', loading_progress=1  WHERE id IN ({})".format(",".join([str(samples[sid]["id"]) for sid in samples])))
+        clear_import_checkpoints(file_id, reference_id)
         
-        core.notify_all({"action": "import_vcf_end", "data" : {"reference_id": reference_id, "file_id" : file_id, "msg" : "Import done without error.", "samples": [ {"id" : samples[s]["id"], "name" : samples[s]["name"]} for s in samples.keys()]}})
+        # analyses waiting for the samples are started by the server (see import_event)
+        notify_import_event("import_vcf_end", file_id, reference_id, msg="Import done without error.")
+        return stages
 
 
-        # When import is done, check if analysis are waiting for creation and then start wt creation if all sample are ready 
-        # TODO
-        sql = "SELECT DISTINCT(analysis_id) FROM analysis_sample WHERE sample_id IN ({})".format(",".join([str(samples[sid]["id"]) for sid in samples]))
-        for row in Model.execute(sql):
-            analysis = Model.Analysis.from_id(row.analysis_id,1)
-            if analysis.status == "waiting":
-                log("Auto initialisation of the analysis in witing state : {} ({})".format(analysis.name, analysis.id))
-                core.filters.request(analysis.id, analysis.filter, analysis.fields)
 
 
 
+    def import_queued(self, file_id, reference_id, import_mode=VCF_IMPORT_MODE):
+        """
+            Run the import of the file queued by import_data. Called by the import workers (see import_queue).
+            Samples are the ones created by import_data, saved in the checkpoint of the import.
+            Return the counters of the stages of the import (see import_delegate)
+        """
+        file = Model.File.from_id(file_id)
+        if file is None:
+            raise RegovarException("Unable to import the file {} : file not found.".format(file_id))
+        checkpoints = get_import_checkpoints(file_id, reference_id)
+        if "" not in checkpoints:
+            raise RegovarException("Unable to import the file {} : no sample to import (import checkpoint not found).".format(file_id))
+        samples = {}
+        for name, sid in checkpoints[""].samples.items():
+            sample = Model.Sample.from_id(sid)
+            if sample is None:
+                raise RegovarException("Unable to import the file {} : sample {} has been deleted.".format(file_id, sid))
+            samples.update({name : sample.to_json()})
+        
+        try:
+            vcf_metadata = prepare_vcf_parsing(reference_id, file.path)
+            if not vcf_metadata:
+                raise RegovarException("Unable to import the file {} : file not supported.".format(file_id))
+            db_ref_suffix= "_" + Model.execute("SELECT table_suffix FROM reference WHERE id={}".format(reference_id)).first().table_suffix
+            vcf_reader = open_vcf(vcf_metadata)
+            try:
+                return self.import_delegate(file_id, vcf_reader, reference_id, db_ref_suffix, vcf_metadata, samples, import_mode, checkpoints)
+            finally:
+                vcf_reader.close()
+        except Exception as ex:
+            Model.Session().rollback()
+            Model.execute("UPDATE sample SET status='error' WHERE id IN ({})".format(",".join([str(samples[sid]["id"]) for sid in samples])))
+            notify_import_event("import_vcf_error", file_id, reference_id, msg="Import error : {}".format(ex)[:1000])
+            raise
+
+
+    async def import_event(self, event):
+        """
+            Forward to the clients the event of an import run by the import workers (see import_queue.notify_import_event).
+            When the import is done, the analyses that were waiting for its samples are initialised.
+        """
+        from core.core import core
+        action = event.pop("action")
+        sql = "SELECT id, name FROM sample WHERE file_id={} AND reference_id={} ORDER BY id".format(event["file_id"], event["reference_id"])
+        samples = [{"id" : row.id, "name" : row.name} for row in Model.execute(sql)]
+        if action != "import_vcf_error":
+            event["samples"] = samples
+        await core.notify_all_co({"action": action, "data" : event})
+
+        # When import is done, check if analysis are waiting for creation and then start wt creation if all sample are ready 
+        # TODO
+        if action == "import_vcf_end" and samples:
+            sql = "SELECT DISTINCT(analysis_id) FROM analysis_sample WHERE sample_id IN ({})".format(",".join([str(s["id"]) for s in samples]))
+            for row in Model.execute(sql):
+                analysis = Model.Analysis.from_id(row.analysis_id,1)
+                if analysis.status == "waiting":
+                    log("Auto initialisation of the analysis in witing state : {} ({})".format(analysis.name, analysis.id))
+                    await core.filters.request(analysis.id, analysis.filter, analysis.fields)
+
 
 
     async def import_data(self, file_id, **kargs):
         """
             Import samples, variants and annotations from the provided file.
             This method check provided parameters and parse the header of the vcf to get samples and compute the number of line
-            that need to be parse to allow us to compute a progress indicator. The parsing is done in delegate called in another thread.
+            that need to be parse to allow us to compute a progress indicator. The parsing is queued and done by the import workers
+            (see import_queue and import_queued).
             Return the list of sample that have been added.
         """
         from core.core import core
         file = Model.File.from_id(file_id)
         filepath = file.path
         reference_id = kargs["reference_id"]
+        import_mode = kargs.get("import_mode") or VCF_IMPORT_MODE
+        if import_mode not in VCF_IMPORT_WRITERS:
+            raise RegovarException("Unknow vcf import mode : {}. Supported modes are : {}".format(import_mode, ", ".join(VCF_IMPORT_WRITERS.keys())))
         start_0 = datetime.datetime.now()
         job_in_progress = []
 
@@ -729,16 +986,30 @@ class VcfManager(AbstractImportManager):
         db_ref_suffix= "_" + Model.execute("SELECT table_suffix FROM reference WHERE id={}".format(reference_id)).first().table_suffix
 
         if vcf_metadata:
-            filepath += ".regovar_import" # a tmp file have been created by prepare_vcf_parsing() method to avoid pysam unsupported file format.
             start = datetime.datetime.now()
             
             # Create vcf parser
-            vcf_reader = VariantFile(filepath)
+            vcf_reader = open_vcf(vcf_metadata)
 
             # get samples in the VCF 
             # samples = {i : Model.get_or_create(Model.Session(), Model.Sample, name=i)[0] for i in list((vcf_reader.header.samples))}
             samples = {}
+            checkpoints = get_import_checkpoints(file_id, reference_id)
+            if "" in checkpoints:
+                # Resume an interrupted import : reuse its samples
+                for name, sid in checkpoints[""].samples.items():
+                    sample = Model.Sample.from_id(sid)
+                    if sample is None or name not in vcf_reader.header.samples:
+                        war("VCF import checkpoint of file {} is not valid anymore. The file will be imported again.".format(file_id))
+                        clear_import_checkpoints(file_id, reference_id)
+                        checkpoints = {}
+                        samples = {}
+                        break
+                    sample.status = "loading"
+                    sample.save()
+                    samples.update({name : sample.to_json()})
             for i in vcf_reader.header.samples:
+                if i in samples: continue
                 sample = Model.Sample.new()
                 sample.name = i
                 sample.file_id = file_id
@@ -759,25 +1030,20 @@ class VcfManager(AbstractImportManager):
                 war("VCF files without sample cannot be imported in the database.")
                 await core.notify_all_co({"action": "import_vcf_error", "data" : {"reference_id": reference_id, "file_id" : file_id, "msg" : "VCF files without sample cannot be imported in the database."}})
                 return;
-
-
-            # # tasks queue shared by all thread
-            # self.queue = Queue(maxsize=0)
-            # # list of worker created to execute multithread tasks
-            # self.workers = []
-            
-            # # init threading workers
-            # for i in range(VCF_IMPORT_MAX_THREAD):
-            #     t = Thread(target=vcf_import_worker, args=(self.queue, file_id, samples), daemon=True)
-            #     t.start()
-            #     self.workers.append(t)
+            # sample_variant/sample_coverage are partitioned by sample
+            for sid in samples:
+                Model.Sample.create_partitions(samples[sid]["id"], reference_id)
+            if "" not in checkpoints:
+                save_import_checkpoint(file_id, reference_id, "", 0, vcf_metadata["header_count"], samples={sid: samples[sid]["id"] for sid in samples})
 
 
             await core.notify_all_co({"action":"import_vcf_start", "data" : {"reference_id": reference_id, "file_id" : file_id, "samples" : [ {"id" : samples[sid]["id"], "name" : samples[sid]["name"]} for sid in samples.keys()]}})
             records_count = vcf_metadata["count"]
-            log ("Importing file {0}\n\r\trecords  : {1}\n\r\tsamples  :  ({2}) {3}\n\r\tstart    : {4}".format(filepath, records_count, len(samples.keys()), reprlib.repr([sid for sid in samples.keys()]), start))
+            log ("Importing file {0}\n\r\trecords  : {1}\n\r\tsamples  :  ({2}) {3}\n\r\tstart    : {4}\n\r\tmode     : {5}".format(filepath, records_count, len(samples.keys()), reprlib.repr([sid for sid in samples.keys()]), start, import_mode))
             
-            run_async(self.import_delegate, file_id, vcf_reader, reference_id, db_ref_suffix, vcf_metadata, samples)
+            # the import is run by the import workers (see import_queue)
+            vcf_reader.close()
+            queue_import(file_id, reference_id, import_mode, kargs.get("priority", 0))
         
             return {"success": True, "samples": samples, "records_count": records_count }
         return {"success": False, "error": "File not supported"}
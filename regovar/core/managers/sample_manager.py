@@ -80,7 +80,7 @@ class SampleManager:
  
  
  
-    async def import_from_file(self, file_id:int, reference_id:int, analysis_id:int=None):
+    async def import_from_file(self, file_id:int, reference_id:int, analysis_id:int=None, import_mode:str=None, priority:int=0):
         from core.managers.imports.vcf_manager import VcfManager
         # Check ref_id
         if analysis_id:
@@ -92,7 +92,7 @@ class SampleManager:
         importer = VcfManager() # Only import from VCF is supported for samples
         print ("Using import manager {}. {}".format(VcfManager.metadata["name"],VcfManager.metadata["description"]))
         try:
-            result = await importer.import_data(file_id, reference_id=reference_id)
+            result = await importer.import_data(file_id, reference_id=reference_id, import_mode=import_mode, priority=priority)
         except Exception as ex:
             msg = "Error occured when caling: core.samples.import_from_file > VcfManager.import_data(file_id={}, ref_id={}).".format(file_id, reference_id)
             raise RegovarException(msg, exception=ex)   
@@ -21,6 +21,7 @@ from sqlalchemy import or_, func
 from config import *
 from core.framework.common import *
 from core.model import *
+from core.managers.imports.vcf_import_normalise import normalise
 
 
 
@@ -156,14 +157,13 @@ class SearchManager:
         if res:
             # Search variant for all reference
             chrm = res[1]
-            pos  = int(res[2])-1
-            ref  = res[3].upper()
-            alt  = res[4].upper()
+            # variants are searched as saved by the import (0-based position, trimmed alleles)
+            pos, ref, alt = normalise(int(res[2]), res[3].upper(), res[4].upper())
             if chrm == "x": chrm = 23
             if chrm == "y": chrm = 24
             if chrm == "m": chrm = 25
             
-            query = "SELECT id, sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos={} AND ref='{}' AND alt='{}'"
+            query = "SELECT id, bitmap_to_array(sample_bitmap) AS sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos={} AND ref='{}' AND alt='{}'"
             for ref_id in core.annotations.ref_list.keys():
                 if ref_id > 0:
                     suffix = core.annotations.ref_list[ref_id].lower() # execute("SELECT table_suffix FROM reference WHERE id={}".format(ref_id)).first().table_suffix
@@ -192,7 +192,7 @@ class SearchManager:
             if chrm == "y": chrm = 24
             if chrm == "m": chrm = 25
             
-            query = "SELECT id, pos, ref, alt, sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos>={} AND pos<={}"
+            query = "SELECT id, pos, ref, alt, bitmap_to_array(sample_bitmap) AS sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos>={} AND pos<={}"
             for ref_id in core.annotations.ref_list.keys():
                 if ref_id > 0:
                     suffix = core.annotations.ref_list[ref_id].lower() # execute("SELECT table_suffix FROM reference WHERE id={}".format(ref_id)).first().table_suffix
@@ -221,7 +221,7 @@ class SearchManager:
             if chrm == "y": chrm = 24
             if chrm == "m": chrm = 25
             
-            query = "SELECT id, pos, ref, alt, sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos>={} AND pos<={}"
+            query = "SELECT id, pos, ref, alt, bitmap_to_array(sample_bitmap) AS sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos>={} AND pos<={}"
             for ref_id in core.annotations.ref_list.keys():
                 if ref_id > 0:
                     suffix = core.annotations.ref_list[ref_id].lower() # execute("SELECT table_suffix FROM reference WHERE id={}".format(ref_id)).first().table_suffix
@@ -249,7 +249,7 @@ class SearchManager:
             if chrm == "y": chrm = 24
             if chrm == "m": chrm = 25
             
-            query = "SELECT id, pos, ref, alt, sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos={}"
+            query = "SELECT id, pos, ref, alt, bitmap_to_array(sample_bitmap) AS sample_list, regovar_score, regovar_score_meta FROM variant_{} WHERE chr={} AND pos={}"
             for ref_id in core.annotations.ref_list.keys():
                 if ref_id > 0:
                     suffix = core.annotations.ref_list[ref_id].lower() # execute("SELECT table_suffix FROM reference WHERE id={}".format(ref_id)).first().table_suffix
@@ -393,7 +393,7 @@ class SearchManager:
         from core.core import core
         ref_name = core.annotations.ref_list[int(reference_id)]
         # query = "SELECT _var.bin as vbin, _var.chr as vchr, _var.pos as vpos, _var.ref as vref, _var.alt as valt, dbnfsp_variant.* FROM (SELECT bin, chr, pos, ref, alt FROM variant_{} WHERE id={}) AS _var LEFT JOIN dbnfsp_variant ON _var.bin=dbnfsp_variant.bin_hg19 AND _var.chr=dbnfsp_variant.chr_hg19 AND _var.pos=dbnfsp_variant.pos_hg19 AND _var.ref=dbnfsp_variant.ref AND _var.alt=dbnfsp_variant.alt"
-        query = "SELECT _var.bin as vbin, _var.chr as vchr, _var.pos as vpos, _var.ref as vref, _var.alt as valt, rg.name2 as genename, _var.sample_list, _var.regovar_score, _var.regovar_score_meta FROM (SELECT bin, chr, pos, ref, alt, sample_list, regovar_score, regovar_score_meta FROM variant_{0} WHERE id={1}) AS _var LEFT JOIN refgene_{0} rg ON rg.chr=_var.chr AND rg.trxrange @> _var.pos"
+        query = "SELECT _var.bin as vbin, _var.chr as vchr, _var.pos as vpos, _var.ref as vref, _var.alt as valt, rg.name2 as genename, _var.sample_list, _var.regovar_score, _var.regovar_score_meta FROM (SELECT bin, chr, pos, ref, alt, bitmap_to_array(sample_bitmap) AS sample_list, regovar_score, regovar_score_meta FROM variant_{0} WHERE id={1}) AS _var LEFT JOIN refgene_{0} rg ON rg.chr=_var.chr AND rg.trxrange @> _var.pos"
         variant = execute(query.format(db_suffix, variant_id)).first()
         if variant:
             chrm = CHR_DB_MAP[variant.vchr]
@@ -0,0 +1,203 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+import time
+import concurrent.futures
+
+from config import *
+from core.framework.common import *
+from core.model import *
+
+
+
+
+# =====================================================================================================================
+# WORKING TABLE BUILD SCHEDULER
+# =====================================================================================================================
+#
+# The creation of a working table (see FilterEngine.create_working_table) is split into tasks (sql queries or
+# functions), grouped by the steps of its progress log. A task is run as soon as the tasks it depends on (after) are
+# done, by WT_BUILD_CONNECTIONS threads (each thread has its own session, so its own connection of the pool) :
+#  - tasks that update the rows of the same table must not run at the same time (the second one would wait for the
+#    row locks of the first one, or deadlock) : they share a lock name, and only one task by lock name runs at once
+#  - local tasks are run by the thread of the scheduler : the ones that use the ORM objects of the analysis/samples
+#    (bound to the session of this thread). Other tasks must only use values computed when they are added
+#  - the progress log of a step is updated (by the thread of the scheduler) each time one of its tasks is done
+#  - the first error stops the scheduling of new tasks, and is raised by run() once the running tasks are over
+
+
+class WtTask():
+    """
+        Task of the creation of a working table : queries to execute and/or function to call
+    """
+    def __init__(self, name, step, queries=[], func=None, after=[], lock=None, local=False):
+        self.name = name
+        self.step = step
+        self.queries = queries if isinstance(queries, list) else [queries]
+        self.func = func
+        self.after = set(after)
+        self.lock = lock
+        self.local = local
+        self.result = None
+        self.duration = 0
+
+
+    def run(self):
+        """
+            Run the task. Its result is the rowcount of the last query, or the value returned by its function
+        """
+        start = time.time()
+        for query in self.queries:
+            self.result = execute(query).rowcount
+        if self.func:
+            self.result = self.func()
+        self.duration = time.time() - start
+        return self
+
+
+
+
+class WtScheduler():
+    """
+        Run the tasks of the creation of the working table of the analysis according to their dependencies (see above)
+    """
+    def __init__(self, engine, analysis, progress, connections=WT_BUILD_CONNECTIONS):
+        self.engine = engine
+        self.analysis = analysis
+        self.progress = progress
+        self.connections = max(1, connections)
+        self.tasks = []
+        self.names = {}
+        self.done = set()
+        self.locks = set()
+
+
+    def add(self, name, step, queries=[], func=None, after=[], lock=None, local=False):
+        """
+            Add a task. Return its name (to use in the after list of the next tasks)
+        """
+        if name in self.names:
+            raise RegovarException("The working table task {} already exists".format(name))
+        for dep in after:
+            if dep not in self.names:
+                raise RegovarException("Unknow task {} required by the working table task {}".format(dep, name))
+        task = WtTask(name, step, queries, func, after, lock, local)
+        self.tasks.append(task)
+        self.names[name] = task
+        return name
+
+
+    def step(self, step):
+        """
+            Return the names of the tasks of the step (of the last previous step with tasks if it has none), to add
+            tasks that must be run after it
+        """
+        while step > 0:
+            names = [t.name for t in self.tasks if t.step == step]
+            if names:
+                return names
+            step -= 1
+        return []
+
+
+    def result(self, name):
+        return self.names[name].result
+
+
+    def update_progress(self, step):
+        tasks = [t for t in self.tasks if t.step == step]
+        done = len([t for t in tasks if t.name in self.done])
+        if done == len(tasks):
+            self.engine.working_table_creation_update_status(self.analysis, self.progress, step, "done", 1)
+        else:
+            self.engine.working_table_creation_update_status(self.analysis, self.progress, step, "computing", max(0.01, done / len(tasks)))
+
+
+    def skip_steps(self, step):
+        """
+            Set as done the steps without task before the step
+        """
+        steps = set([t.step for t in self.tasks])
+        for idx in range(1, step):
+            if idx not in steps and self.progress["log"][idx]["status"] != "done":
+                self.progress["log"][idx]["status"] = "done"
+                self.progress["log"][idx]["progress"] = 1
+
+
+    def ready(self, task):
+        return task.after <= self.done and (task.lock is None or task.lock not in self.locks)
+
+
+    def run_worker_task(self, task):
+        """
+            Run the task in a worker thread (with the session of the thread)
+        """
+        try:
+            execute("SET work_mem='1GB'")
+            return task.run()
+        finally:
+            execute("RESET work_mem")
+            Session.remove()
+
+
+    def complete(self, task):
+        self.done.add(task.name)
+        self.locks.discard(task.lock)
+        log(" > {} ({:.1f}s)".format(task.name, task.duration))
+        self.update_progress(task.step)
+
+
+    def run(self):
+        """
+            Run all the tasks. Raise the first error of the tasks
+        """
+        pending = list(self.tasks)
+        running = {}
+        started = set()
+        error = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.connections) as executor:
+            while running or (pending and error is None):
+                local = []
+                if error is None:
+                    for task in list(pending):
+                        # a task may take the lock required by the next ones
+                        if not self.ready(task):
+                            continue
+                        pending.remove(task)
+                        if task.lock:
+                            self.locks.add(task.lock)
+                        if task.step not in started:
+                            started.add(task.step)
+                            self.skip_steps(task.step)
+                            self.update_progress(task.step)
+                        if task.local:
+                            local.append(task)
+                        else:
+                            running[executor.submit(self.run_worker_task, task)] = task
+                for task in local:
+                    try:
+                        self.complete(task.run())
+                    except Exception as ex:
+                        error = error or ex
+                        self.locks.discard(task.lock)
+                if not running:
+                    if pending and error is None and not local:
+                        raise RegovarException("Working table tasks cannot be run : {}".format(", ".join([t.name for t in pending])))
+                    continue
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        self.complete(future.result())
+                    except Exception as ex:
+                        err("Working table task {} failed".format(task.name), ex)
+                        error = error or ex
+                        self.locks.discard(task.lock)
+        if error:
+            raise error
+        self.skip_steps(len(self.progress["log"]))
@@ -0,0 +1,116 @@
+#!env/python3
+# coding: utf-8
+try:
+    import ipdb
+except ImportError:
+    pass
+
+
+from config import *
+from core.framework.common import *
+from core.model import *
+
+
+
+
+# =====================================================================================================================
+# WORKING TABLE STATISTICS
+# =====================================================================================================================
+#
+# Statistics of the analysis and of its samples (see FilterEngine.update_wt_samples_stats) are counters of the rows of
+# the working table : each counter is a COUNT(*) FILTER (WHERE <condition>) column of a single scan of the table.
+# VEP consequences are counted in a second scan, grouped by consequence (DISTINCT unnest of the consequences of each
+# transcript, so a transcript is counted once by consequence). The json returned is the one of the former queries
+# (one query by counter).
+
+# Condition of the variants classes
+VARIANT_CLASSES_SQL = [
+    ("ref", "ref=alt"),
+    ("snv", "ref<>alt AND char_length(ref)=1 AND char_length(alt)=1"),
+    ("mnv", "ref<>alt AND char_length(ref)>1 AND char_length(alt)=char_length(ref)"),
+    ("insertion", "char_length(ref)=0 AND char_length(alt)>0"),
+    ("deletion", "char_length(ref)>0 AND char_length(alt)=0"),
+    ("others", "char_length(ref)<>char_length(alt) AND char_length(ref)>0 AND char_length(alt)>0")]
+
+
+
+class WtStats():
+    """
+        Counters of the statistics of a working table, computed with one scan (two with the VEP consequences)
+    """
+    def __init__(self, wt, consequence_uid=None):
+        self.wt = wt
+        self.consequence_uid = consequence_uid
+        self.counters = []  # [(path of the counter : "analysis" or sample id then the keys in the stats json, sql condition)]
+        self.samples = []   # samples of the VEP consequences
+
+
+    def add(self, path, condition):
+        self.counters.append((path, condition))
+
+
+    def add_analysis(self):
+        """
+            Add the counters of the analysis
+        """
+        self.add(("analysis", "total_variant"), "is_variant")
+        self.add(("analysis", "total_transcript"), "NOT is_variant")
+        for name, condition in VARIANT_CLASSES_SQL:
+            self.add(("analysis", "variants_classes", name), "is_variant AND " + condition)
+
+
+    def add_sample(self, sample_id, filter_codes=None):
+        """
+            Add the counters of the sample. Only the transcripts counter is added when filter_codes is None (samples with
+            import stats, see vcf_import_stats)
+        """
+        s = "s{}".format(sample_id)
+        self.samples.append(sample_id)
+        self.add((sample_id, "total_transcript"), "{}_gt>=0 AND NOT is_variant".format(s))
+        if filter_codes is None:
+            return
+        self.add((sample_id, "sample_total_variant"), "{}_gt>=0 AND is_variant".format(s))
+        self.add((sample_id, "variants_classes", "not"), "{}_gt=-1 AND is_variant".format(s))
+        self.add((sample_id, "variants_classes", "ref"), "{}_gt=0 AND is_variant".format(s))
+        for name, condition in VARIANT_CLASSES_SQL[1:]:
+            self.add((sample_id, "variants_classes", name), "{}_gt>0 AND is_variant AND {}".format(s, condition))
+        self.add((sample_id, "filter"), None)
+        for i, fid in enumerate(filter_codes):
+            self.add((sample_id, "filter", fid), "{0}_gt>=0 AND is_variant AND {0}_filter & {1} <> 0".format(s, 1 << i))
+
+
+    def query(self):
+        """
+            Return the query of the counters
+        """
+        return "SELECT {} FROM {}".format(", ".join(["COUNT(*) FILTER (WHERE {})".format(c) for p, c in self.counters if c]), self.wt)
+
+
+    def consequences_query(self):
+        """
+            Return the query of the VEP consequences counters of the analysis and of the samples
+        """
+        counts = ["COUNT(*)"] + ["COUNT(*) FILTER (WHERE s{}_gt>0)".format(sid) for sid in self.samples]
+        return "SELECT _c.consequence, {2} FROM {0} w, LATERAL (SELECT DISTINCT unnest(w._{1}) AS consequence) _c WHERE NOT w.is_variant AND _c.consequence IS NOT NULL GROUP BY _c.consequence".format(
+            self.wt, self.consequence_uid, ", ".join(counts))
+
+
+    def run(self):
+        """
+            Compute the counters. Return the stats json of the analysis and the ones of the samples ({sample_id: stats})
+        """
+        result = {}
+        row = iter(execute(self.query()).first()) if self.counters else iter([])
+        for path, condition in self.counters:
+            node = result
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = next(row) if condition else {}
+
+        if self.consequence_uid:
+            rows = execute(self.consequences_query()).fetchall()
+            if "analysis" in result:
+                result["analysis"]["vep_consequences"] = {r[0]: r[1] for r in rows}
+            for idx, sid in enumerate(self.samples):
+                result.setdefault(sid, {})["vep_consequences"] = {r[0]: r[idx + 2] for r in rows}
+        return result.pop("analysis", {}), result
@@ -122,7 +122,6 @@ def analysis_load(self, data):
     """
     from core.model.project import Project
     settings = False
-    need_to_clean_db = False
     try:
         if "name" in data.keys(): self.name = check_string(data['name'])
         if "project_id" in data.keys(): self.project_id = check_int(data['project_id'])
@@ -152,11 +151,10 @@ def analysis_load(self, data):
                     AnalysisFile.new(self.id, sid)
             
         if "settings" in data.keys(): 
-            # When settings change, need to regenerate working table
+            # When settings change, need to update working table
             self.settings = data["settings"]
             self.status = "empty"
             self.computing_progress = None
-            need_to_clean_db = True
             
 
         if "samples_ids" in data.keys():
@@ -168,10 +166,9 @@ def analysis_load(self, data):
             for sid in data["samples_ids"]:
                 if sid not in self.samples_ids:
                     AnalysisSample.new(self.id, sid)
-            # When settings change, need to regenerate working table
+            # When samples change, need to update working table
             self.status = "empty"
             self.computing_progress = None
-            need_to_clean_db = True
 
             # If settings empty, init it with informations from samples
             if len(self.settings["annotations_db"]) == 0:
@@ -188,9 +185,9 @@ def analysis_load(self, data):
                 settings["annotations_db"] = dbuids
                 self.settings = settings
 
-        
-        if need_to_clean_db:
-            execute("DROP TABLE IF EXISTS wt_{0} CASCADE; DROP TABLE IF EXISTS wt_{0}_var CASCADE;".format(self.id))
+
+        # The working table is not dropped : only the changes are applied to it when it is computed again
+        # (see FilterEngine.update_working_table)
 
         # check to reload dynamics properties
         if self.loading_depth > 0:
@@ -138,11 +138,77 @@ def sample_load(self, data):
 
 
 
+def sample_reference_suffix(reference_id):
+    """
+        Return the suffix of the tables of the reference (None if the reference doesn't exist)
+    """
+    reference = execute("SELECT table_suffix FROM reference WHERE id={}".format(reference_id)).first()
+    return reference.table_suffix if reference else None
+
+
+def sample_partitions(sample_id, reference_id):
+    """
+        Return the list of (table, partition) of the tables partitioned by sample for the sample
+    """
+    suffix = sample_reference_suffix(reference_id)
+    if suffix is None:
+        return []
+    return [("{}_{}".format(t, suffix), "{}_{}_{}".format(t, suffix, sample_id)) for t in SAMPLE_PARTITIONED_TABLES]
+
+
+def sample_create_partitions(sample_id, reference_id):
+    """
+        Create the partitions of the sample in the tables partitioned by sample (to do before importing its data)
+    """
+    query = ""
+    for table, partition in sample_partitions(sample_id, reference_id):
+        query += "CREATE TABLE IF NOT EXISTS {1} PARTITION OF {0} FOR VALUES IN ({2}); ".format(table, partition, sample_id)
+    if query:
+        execute(query)
+
+
+def sample_filter_codes(filters):
+    """
+        Return the list of the filters (keys of filter_description) in the order of their bit in the filter masks of
+        sample_variant (bit i is set when filter i is applied). Only the first FILTER_MASK_SIZE filters can be stored
+    """
+    return sorted(filters)[0:FILTER_MASK_SIZE]
+
+
+def sample_filter_mask(filters, codes):
+    """
+        Return the filter mask of the list of filters (filters that are not in codes are ignored)
+    """
+    return sum([1 << codes.index(f) for f in set(filters) if f in codes])
+
+
+def sample_filter_names(mask, codes):
+    """
+        Return the list of the filters of the filter mask
+    """
+    if mask is None:
+        return None
+    return [f for i, f in enumerate(codes) if mask & (1 << i)]
+
+
 def sample_delete(sample_id):
     """
-        Delete the sample with the provided id in the database
+        Delete the sample with the provided id in the database.
+        Its variants are removed from the occurrences counters, then its data are deleted by dropping its partitions.
+        The sample was called on a record when it has one of its alleles (a genotype on a row of the vcf line)
     """
     # TODO : delete linked filters, Attribute, WorkingTable
+    sample = Session().query(Sample).filter_by(id=sample_id).first()
+    suffix = sample_reference_suffix(sample.reference_id) if sample else None
+    if suffix:
+        query = "UPDATE variant_count_{0} c SET het_count=c.het_count-s.het, hom_count=c.hom_count-s.hom, called_count=c.called_count-s.called FROM (\
+            SELECT variant_id, count(*) FILTER (WHERE genotype IN (2, 3)) AS het, count(*) FILTER (WHERE genotype=1) AS hom, count(*) FILTER (WHERE called) AS called \
+            FROM (SELECT variant_id, genotype, bool_or(genotype IS NOT NULL) OVER (PARTITION BY vcf_line) AS called FROM sample_variant_{0} WHERE sample_id={1}) AS sv \
+            GROUP BY variant_id) AS s WHERE c.variant_id=s.variant_id; ".format(suffix, sample_id)
+        for table, partition in sample_partitions(sample_id, sample.reference_id):
+            query += "DROP TABLE IF EXISTS {}; ".format(partition)
+        execute(query)
+    execute("DELETE FROM import_sample_stats WHERE sample_id={}".format(sample_id))
     Session().query(Sample).filter_by(id=sample_id).delete(synchronize_session=False)
 
 
@@ -164,6 +230,12 @@ def sample_count():
 
 
 
+# Filters of the sample stored in the filter mask of sample_variant (integer)
+FILTER_MASK_SIZE = 31
+
+# Tables partitioned by sample (one partition <table>_<ref>_<sample_id> by sample)
+SAMPLE_PARTITIONED_TABLES = ["sample_variant", "sample_coverage"]
+
 Sample = Base.classes.sample
 Sample.public_fields = ["id", "name", "comment", "subject_id", "file_id", "analyses_ids", "create_date", "update_date", "is_mosaic", "default_dbuid", "filter_description", "loading_progress", "reference_id", "status", "subject", "file", "analyses", "stats"]
 Sample.init = sample_init
@@ -172,6 +244,11 @@ Sample.to_json = sample_to_json
 Sample.load = sample_load
 Sample.save = generic_save
 Sample.delete = sample_delete
+Sample.partitions = sample_partitions
+Sample.create_partitions = sample_create_partitions
+Sample.filter_codes = sample_filter_codes
+Sample.filter_mask = sample_filter_mask
+Sample.filter_names = sample_filter_names
 Sample.new = sample_new
 Sample.count = sample_count
 
@@ -5,6 +5,7 @@ import os
 
 from core.framework.common import *
 from core.framework.postgresql import *
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, Text, Boolean, JSON, LargeBinary
 
 
 # =====================================================================================================================
@@ -21,5 +22,23 @@ def variant_from_id(reference_id, variant_id):
     return variant
 
 
-Variant = Base.classes.variant_hg19
+class Variant(Base):
+    """
+        variant_<ref> tables are partitioned by chromosome and automap doesn't reflect partitioned tables,
+        so the mapping is declared (columns of install_hg19.sql)
+    """
+    __tablename__ = "variant_hg19"
+    __table_args__ = {"extend_existing": True}
+    id = Column(BigInteger, primary_key=True)
+    bin = Column(Integer)
+    chr = Column(Integer)
+    pos = Column(BigInteger)
+    ref = Column(Text)
+    alt = Column(Text)
+    is_transition = Column(Boolean)
+    sample_bitmap = Column(LargeBinary)    # see core.framework.bitmap
+    regovar_score = Column(SmallInteger)
+    regovar_score_meta = Column(JSON)
+
+
 Variant.from_id = variant_from_id
\ No newline at end of file
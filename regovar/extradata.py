@@ -15,8 +15,10 @@ if action == "hpo":
     from extratools import hpo
 elif action == "panels":
     from extratools import panels
+elif action == "annotations":
+    from extratools import annotations
 else:
-    print("Wrong action, please use \"hpo\" or \"panels\"")
+    print("Wrong action, please use \"hpo\", \"panels\" or \"annotations\"")
 
 
 
@@ -0,0 +1,25 @@
+#!env/python3
+# coding: utf-8
+import sys
+import core.model as Model
+from core.managers.imports.vcf_import_annotation_db import import_annotation_vcf
+
+
+
+
+# Annotation-only import of an annotated vcf (dbNSFP, gnomAD, ...) into an annotation database (no sample created)
+# usage : extradata.py annotations <vcf file> <reference (hg19, hg38)> <name> <version> [<description>]
+if len(sys.argv) < 6:
+    print("Usage: extradata.py annotations <vcf file> <reference> <name> <version> [<description>]")
+    exit(1)
+vcfpath = sys.argv[2]
+reference = Model.execute("SELECT id FROM reference WHERE table_suffix='{}'".format(Model.sql_escape(sys.argv[3]))).first()
+if reference is None:
+    print("Unknow reference: {}".format(sys.argv[3]))
+    exit(1)
+name = sys.argv[4]
+version = sys.argv[5]
+description = sys.argv[6] if len(sys.argv) > 6 else ""
+
+count = import_annotation_vcf(vcfpath, reference.id, name, version, description)
+print("Done: {} annotations imported".format(count))
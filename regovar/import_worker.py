@@ -0,0 +1,61 @@
+#!python
+# coding: utf-8
+
+import os
+import time
+import argparse
+import multiprocessing as mp
+
+
+
+# Regovar package
+from config import *
+from core.framework.common import *
+import core.model as Model
+
+
+
+
+# Run the vcf imports queued by the server (see core/managers/imports/import_queue.py) with several worker processes.
+# Workers that stop unexpectedly are restarted; their job is resumed by another worker.
+
+def start_worker():
+    """
+        Entry point of the worker processes
+    """
+    from core.managers.imports.import_queue import run_import_worker
+    Model.init_forked_process()
+    run_import_worker()
+
+
+def new_worker(context):
+    worker = context.Process(target=start_worker)
+    worker.start()
+    return worker
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Regovar import workers : run the vcf imports queued by the server")
+    parser.add_argument("-w", "--workers", type=int, default=VCF_IMPORT_WORKERS, help="number of worker processes (default: {})".format(VCF_IMPORT_WORKERS))
+    args = parser.parse_args()
+
+    # fork is required as workers use the already loaded model/config
+    context = mp.get_context("fork")
+    workers = [new_worker(context) for i in range(max(1, args.workers))]
+    log("{} import workers started".format(len(workers)))
+    try:
+        while True:
+            time.sleep(VCF_IMPORT_POLL_DELAY)
+            for idx, worker in enumerate(workers):
+                if not worker.is_alive():
+                    war("Import worker {} stopped (exit code {}) : restart it".format(worker.pid, worker.exitcode))
+                    workers[idx] = new_worker(context)
+    except KeyboardInterrupt:
+        pass
+    except Exception as ex:
+        err("Uncatched exception", ex)
+    finally:
+        for worker in workers:
+            worker.terminate()
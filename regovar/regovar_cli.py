@@ -22,6 +22,7 @@ parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter, descripti
     "\n  file\t\t- Manage file"
     "\n  pipeline\t- Manage pipelines"
     "\n  job\t\t- Manage job"
+    "\n  import\t- Bulk import of vcf files"
     "\n  config\t- Manage the server configuration", 
     usage="rego [subcommand] [options]", add_help=False)
 parser.add_argument("subcommand",  type=str, nargs='*', default=[], help=argparse.SUPPRESS)
@@ -35,6 +36,8 @@ parser.add_argument("-a", "--async", help="try to execute the command asynchrono
 parser.add_argument("-f",  type=str, nargs='*', default=[], help=argparse.SUPPRESS)
 parser.add_argument("-i",  type=str, nargs='*', default=[], help=argparse.SUPPRESS)
 parser.add_argument("-c",  type=str, help=argparse.SUPPRESS)
+parser.add_argument("-w",  type=int, default=VCF_IMPORT_WORKERS, help=argparse.SUPPRESS)
+parser.add_argument("-m",  type=str, default=None, help=argparse.SUPPRESS)
 
 
 
@@ -301,6 +304,43 @@ def parse_job(args, inputs_ids=[], files=[], form=None, help=False, verbose=Fals
     else:
         print(parse_pipeline_help)
 
+# ===================================================================================================
+# IMPORT Commands
+# ===================================================================================================
+
+
+parse_import_help_bulk = """regovar import bulk <reference_id> <local_vcf_file> [...] [-w <workers>] [-m <import_mode>]
+      Bulk load mode, for the first import of many vcf files on a reference. The secondary indexes of the samples variants are
+      dropped, the files are imported by <workers> processes at once, then the indexes are rebuilt and the tables analyzed.
+      The import workers of the server must be stopped : no other import can run on the reference meanwhile."""
+parse_import_help_indexes = """regovar import indexes <reference_id> [-w <workers>]
+      Rebuild the indexes dropped by an interrupted bulk import."""
+parse_import_help = """Bulk import of vcf files (administration)
+
+""" + parse_import_help_bulk + "\n\n" + parse_import_help_indexes
+
+
+
+
+def parse_import(args, workers=VCF_IMPORT_WORKERS, import_mode=None, help=False, verbose=False, asynch=False):
+    print ("manage import command [{}] h:{} v:{} a:{}".format(",".join(args), help, verbose, asynch))
+    if len(args) == 0:
+        print(parse_import_help)
+    elif args[0] == "bulk":
+        if len(args) > 2 and args[1].isdigit():
+            from core.managers.imports.bulk_import import bulk_import
+            status = bulk_import(int(args[1]), args[2:], max(1, workers), import_mode)
+            print(json.dumps(status, sort_keys=True, indent=4))
+        else:
+            print(parse_import_help_bulk)
+    elif args[0] == "indexes":
+        if len(args) > 1 and args[1].isdigit():
+            from core.managers.imports.bulk_import import reference_tables, bulk_create_indexes
+            bulk_create_indexes("sample_variant" + reference_tables(int(args[1])), max(1, workers))
+        else:
+            print(parse_import_help_indexes)
+    else:
+        print(parse_import_help)
 
 
 
@@ -328,6 +368,8 @@ if len(args.subcommand) > 0:
         parse_pipeline(args.subcommand[1:], args.help, args.verbose, args.async)
     elif args.subcommand[0] == "job":
         parse_job(args.subcommand[1:], args.i, args.f, args.c, args.help, args.verbose, args.async)
+    elif args.subcommand[0] == "import":
+        parse_import(args.subcommand[1:], args.w, args.m, args.help, args.verbose, args.async)
     elif args.subcommand[0] == "file":
         parse_file(args.subcommand[1:], args.help, args.verbose, args.async)
     elif args.subcommand[0] == "version":
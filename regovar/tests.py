@@ -19,6 +19,13 @@ from tests.core.test_core_filemanager import *
 from tests.core.test_core_pipelinemanager import *
 from tests.core.test_core_jobmanager import *
 from tests.core.test_core_lxdmanager import *
+from tests.core.test_core_bitmap import *
+from tests.core.test_core_bloom import *
+from tests.core.test_core_wtstats import *
+from tests.core.test_core_vcfkernel import *
+from tests.core.test_core_annotations import *
+from tests.core.test_core_normalise import *
+from tests.core.test_core_vcfwriter import *
 
 
 from tests.pretty_print import ColourTextTestRunner
@@ -56,6 +63,27 @@ if __name__ == '__main__':
     for test in [m for m in TestModelPipeline.__dict__.keys() if str.startswith(m, "test_")]:
         suiteModel.addTest(TestModelPipeline(test))
 
+    for test in [m for m in TestCoreBitmap.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreBitmap(test))
+
+    for test in [m for m in TestCoreBloom.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreBloom(test))
+
+    for test in [m for m in TestCoreWtStats.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreWtStats(test))
+
+    for test in [m for m in TestCoreVcfKernel.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreVcfKernel(test))
+
+    for test in [m for m in TestCoreAnnotations.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreAnnotations(test))
+
+    for test in [m for m in TestCoreNormalise.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreNormalise(test))
+
+    for test in [m for m in TestCoreVcfWriter.__dict__.keys() if str.startswith(m, "test_")]:
+        suiteModel.addTest(TestCoreVcfWriter(test))
+
     print("Done\n-----\nRunning tests :")
     runner = ColourTextTestRunner(verbosity=2)
     runner.run(suiteModel)
@@ -0,0 +1,127 @@
+#!python
+# coding: utf-8
+
+"""
+    Micro-benchmark of the parsing of VEP annotations : per record parser (VepImporter.parse_annotations) versus
+    the columnar parser (vcf_import_annotations). Both produce the COPY rows of the annotations.
+    A synthetic VEP vcf is generated (the database is not modified). Run from the regovar directory :
+
+        python -m tests.benchmarks.bench_annotations_parser [records] [transcripts] [repeat]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from pysam import VariantFile
+
+from core.managers.imports.vcf_import_vep import VepImporter
+from core.managers.imports.vcf_import_writer import copy_row, copy_escape
+from core.managers.imports.vcf_import_kernel import decode_records
+from core.managers.imports.vcf_manager import normalise
+
+
+
+
+# Columns of the CSQ field (VEP --everything like) : one by VEP field, sift and polyphen are "prediction(score)"
+VEP_COLUMNS = [c for c in sorted(VepImporter.columns_definitions.keys(), key=lambda c: VepImporter.columns_definitions[c]["order"]) if not c.startswith("sift") and not c.startswith("polyphen")] + ["sift", "polyphen"]
+
+
+def random_value(col_name, allele):
+    if col_name == "allele":
+        return allele
+    if col_name == "feature":
+        return "ENST{:011d}".format(random.randint(0, 99999))
+    if col_name in ["sift", "polyphen"]:
+        return random.choice(["", "deleterious({:.3f})".format(random.random()), "benign({:.3f})".format(random.random())])
+    if col_name.endswith("maf"):
+        return random.choice(["", "{}:{:.4f}".format(allele, random.random())])
+    col_type = VepImporter.columns_definitions[col_name]["type"]
+    if col_type == "list":
+        return "&".join(random.sample(["missense_variant", "splice_region_variant", "intron_variant", "NMD_transcript_variant"], random.randint(1, 2)))
+    if col_type == "int":
+        return random.choice(["", str(random.randint(-10, 10))])
+    if col_type == "float":
+        return random.choice(["", "{:.4f}".format(random.random())])
+    if col_type == "bool":
+        return random.choice(["", "YES"])
+    return random.choice(["", "{}_{}".format(col_name, random.randint(0, 1000))])
+
+
+def generate_vep_vcf(path, records=5000, transcripts=20, samples=2):
+    """
+        Write a synthetic vcf annotated by VEP (CSQ field) with the provided number of transcripts by variant
+    """
+    with open(path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n##VEP=\"v90\"\n##contig=<ID=chr1,length=248956422>\n")
+        f.write("##INFO=<ID=CSQ,Number=.,Type=String,Description=\"Consequence annotations from Ensembl VEP. Format: {}\">\n".format("|".join(VEP_COLUMNS)))
+        f.write("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\n".format("\t".join(["S{}".format(i) for i in range(samples)])))
+        for i in range(records):
+            ref, alt = random.sample("ACGT", 2)
+            csq = ",".join(["|".join([random_value(c, alt) for c in VEP_COLUMNS]) for t in range(transcripts)])
+            f.write("chr1\t{}\t.\t{}\t{}\t50\tPASS\tCSQ={}\tGT\t{}\n".format(1000 + i * 10, ref, alt, csq, "\t".join(["0/1"] * samples)))
+
+
+def create_importer():
+    """
+        VepImporter initialised for the synthetic vcf without the database (all columns are mapped)
+    """
+    importer = VepImporter()
+    importer.name = "VEP"
+    importer.vcf_flag = "CSQ"
+    importer.columns = list(VEP_COLUMNS)
+    importer.columns_mapping = {c: {"name": c, "type": VepImporter.columns_definitions[c]["type"]} if c in VepImporter.columns_definitions else False for c in VEP_COLUMNS}
+    return importer
+
+
+def bench_per_record(importer, records):
+    count = 0
+    for record in records:
+        for allele in record.alts:
+            pos, ref, alt = normalise(record.pos, record.ref, allele)
+            for a, trx_pk, fields, values in importer.parse_annotations(alt, record.info):
+                copy_row([0, 1, pos, ref, a, trx_pk] + values)
+                count += 1
+    return count
+
+
+def bench_columnar(importer, records):
+    count = 0
+    parser = importer.get_columns_parser()
+    for i in range(0, len(records), 500):
+        block = records[i:i + 500]
+        annotations = parser.parse(decode_records(block)["info"])
+        for record, parsed in zip(block, annotations):
+            for allele in record.alts:
+                pos, ref, alt = normalise(record.pos, record.ref, allele)
+                variant = copy_row([0, 1, pos, ref, alt])[:-1]
+                for trx_pk, values, copy_values in parsed.get(alt, []):
+                    "{}\t{}\t{}\n".format(variant, copy_escape(trx_pk), copy_values)
+                    count += 1
+    return count
+
+
+
+
+if __name__ == '__main__':
+    records_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    transcripts = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    random.seed(0)
+    path = os.path.join(tempfile.mkdtemp(), "bench_vep.vcf")
+    generate_vep_vcf(path, records_count, transcripts)
+    records = list(VariantFile(path))
+    importer = create_importer()
+
+    print("VEP annotations parsing benchmark ({} records, {} transcripts by record, {} columns ; {} run(s))".format(records_count, transcripts, len(VEP_COLUMNS), repeat))
+    for name, bench in [("per record", bench_per_record), ("columnar", bench_columnar)]:
+        durations = []
+        for run in range(repeat):
+            start = time.time()
+            count = bench(importer, records)
+            durations.append(time.time() - start)
+        print(" - {:<10} : {} annotations  min {:.2f}s  ({:.0f} annotations/s)".format(name, count, min(durations), count / min(durations)))
+    os.remove(path)
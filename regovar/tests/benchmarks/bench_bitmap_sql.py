@@ -0,0 +1,92 @@
+#!python
+# coding: utf-8
+
+"""
+    Micro-benchmark of the samples membership of the variants in postgresql : integer arrays (sample_list before the
+    database 9.6) versus the compressed bitmaps functions of create_all.sql. Rows of random samples lists are generated in
+    a temporary table (a few samples for most variants, some frequent variants), then each operation is timed for all the
+    rows with both representations, and the results are checked to be the same :
+     - wt samples : what the working tables need by variant (tlist, tcount, samples of the analysis and their count)
+     - merge : union with the samples of an imported vcf (upsert of known variants)
+     - union : aggregate of the samples of duplicated variants (COPY import batches)
+    Need a Regovar database (see config.py; only temporary tables are used). Run from the regovar directory :
+
+        python -m tests.benchmarks.bench_bitmap_sql [rows] [samples] [repeat]
+"""
+
+import sys
+import time
+
+import core.model as Model
+
+
+
+
+# operation : (integer arrays query, bitmaps query). Queries return a checksum of the results of all the rows
+OPERATIONS = [
+    ("wt samples",
+     "SELECT sum(cardinality(l)), sum(array_length(l, 1)), sum(cardinality(array_intersect(l, {analysis}))), sum(COALESCE(array_length(array_intersect(l, {analysis}), 1), 0)) FROM bench_samples",
+     "SELECT sum(cardinality(bitmap_to_array(b))), sum(bitmap_count(b)), sum(cardinality(bitmap_filter(b, {analysis}))), sum(cardinality(bitmap_filter(b, {analysis}))) FROM bench_samples"),
+    ("merge",
+     "SELECT sum(cardinality(ARRAY(SELECT DISTINCT s FROM unnest(l || n) AS s ORDER BY s))) FROM bench_samples",
+     "SELECT sum(bitmap_count(bitmap_or(b, nb))) FROM bench_samples"),
+    ("union",
+     "SELECT sum(cardinality(u)) FROM (SELECT array_agg(DISTINCT s ORDER BY s) AS u FROM bench_samples, unnest(l) AS s GROUP BY grp) AS t",
+     "SELECT sum(bitmap_count(u)) FROM (SELECT bitmap_union(b) AS u FROM bench_samples GROUP BY grp) AS t"),
+]
+
+
+
+
+def create_rows(cursor, rows, samples):
+    """
+        Create the temporary table of the samples lists (l, b) : 90% of variants are in less than 10 samples, others in up
+        to 30% of the samples. n/nb are the samples of an imported vcf (the new samples ids of the database), grp groups the
+        rows by 4
+    """
+    cursor.execute("DROP TABLE IF EXISTS bench_samples")
+    cursor.execute("""CREATE TEMP TABLE bench_samples AS SELECT r / 4 AS grp, l, bitmap_from_array(l) AS b, n, bitmap_from_array(n) AS nb FROM (
+        SELECT r, ARRAY(SELECT DISTINCT (random() * {1})::integer + 1 + 0 * r FROM generate_series(1, CASE WHEN random() < 0.9 THEN 1 + (random() * 9)::integer ELSE (random() * {1} * 0.3)::integer + 1 END) ORDER BY 1) AS l,
+        ARRAY(SELECT {1} + s + 0 * r FROM generate_series(1, 1 + (random() * 2)::integer) AS s) AS n
+        FROM generate_series(1, {0}) AS r) AS t""".format(rows, samples))
+    cursor.execute("ANALYZE bench_samples")
+    cursor.execute("SELECT avg(pg_column_size(l)), avg(pg_column_size(b)) FROM bench_samples")
+    return cursor.fetchone()
+
+
+def bench(cursor, query, repeat):
+    durations = []
+    for run in range(repeat):
+        start = time.time()
+        cursor.execute(query)
+        result = cursor.fetchone()
+        durations.append(time.time() - start)
+    return min(durations), result
+
+
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    connection = Model.new_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT setseed(0)")
+    print("Samples membership benchmark ({} variants ; {} samples ; {} run(s))".format(rows, samples, repeat))
+    size_array, size_bitmap = create_rows(cursor, rows, samples)
+    print(" - size by variant : integer[] {:.0f} bytes  bitmap {:.0f} bytes".format(size_array, size_bitmap))
+    analysis = "ARRAY[1, 2, 3]"
+    errors = 0
+    for name, query_array, query_bitmap in OPERATIONS:
+        duration_array, result_array = bench(cursor, query_array.format(analysis=analysis), repeat)
+        duration_bitmap, result_bitmap = bench(cursor, query_bitmap.format(analysis=analysis), repeat)
+        print(" - {:<10} : integer[] {:.3f}s  bitmap {:.3f}s  (x{:.2f})".format(name, duration_array, duration_bitmap, duration_array / duration_bitmap))
+        if result_array != result_bitmap:
+            print("ERROR : results of the bitmaps are not the same as the integer arrays ones ({} / {})".format(result_array, result_bitmap))
+            errors += 1
+    connection.rollback()
+    connection.close()
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,235 @@
+#!python
+# coding: utf-8
+
+"""
+    Import throughput benchmark suite. Synthetic vcf are generated (see vcf_generator) for each combination of the
+    provided parameters, and imported with VcfManager.import_data (the queued job is run in this process, so import
+    workers must not run on the benchmark database). Need a Regovar database (see config.py). Run from the regovar directory :
+
+        python -m tests.benchmarks.bench_import_suite --reference 1 --records 10000 --samples 1 10 --vep 0 5 --output bench.json
+
+    For each import are reported, by stage (prepare : vcf prescan and samples creation ; import : parsing and writing) :
+    the duration, records/s and the peak RSS of the process and its children (shard workers), and the number of rows
+    written in each table. Pipelined imports also report the counters of the parse/encode/write stages of the pipeline,
+    with the peak RSS sampled while each stage was working (stages run concurrently in the same process). Results are saved in a json file; --compare prints the ratio with a previous results file.
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import datetime
+import tempfile
+import threading
+import itertools
+
+from config import *
+import core.model as Model
+from core.framework.common import *
+from core.core import REGOVAR_CORE_VERSION
+from core.managers.imports.vcf_manager import VcfManager, VCF_IMPORT_WRITERS, prepare_vcf_parsing
+from tests.benchmarks.vcf_generator import generate_vcf
+
+
+
+
+def process_rss(pid):
+    """
+        Return the RSS (bytes) of the process and its children (linux only : 0 when /proc is not available)
+    """
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        for task in os.listdir("/proc/{}/task".format(pid)):
+            with open("/proc/{}/task/{}/children".format(pid, task)) as f:
+                rss += sum([process_rss(int(child)) for child in f.read().split()])
+        return rss
+    except (IOError, ValueError):
+        return 0
+
+
+class RssMonitor():
+    """
+        Sample the RSS of the process in a thread, to get the peak RSS of a stage :
+
+            with RssMonitor() as monitor:
+                ...
+            monitor.peak
+
+        stages is a function that returns the pipeline stages of the running import ({name: VcfImportStage}, or None) :
+        a sample is also counted in the peak of each stage that has processed items since the previous sample (stages_peak)
+    """
+
+    def __init__(self, interval=0.05, stages=None):
+        self.interval = interval
+        self.stages = stages
+        self.peak = 0
+        self.stages_peak = {}
+        self.running = False
+
+
+    def sample(self, counters):
+        rss = process_rss(os.getpid())
+        self.peak = max(self.peak, rss)
+        stages = self.stages() if self.stages else None
+        for name, stage in (stages or {}).items():
+            current = (stage.items, stage.busy)
+            if counters.get(name, (0, 0)) != current:
+                self.stages_peak[name] = max(self.stages_peak.get(name, 0), rss)
+            counters[name] = current
+
+
+    def run(self):
+        counters = {}
+        while self.running:
+            self.sample(counters)
+            time.sleep(self.interval)
+        self.sample(counters)
+
+
+    def __enter__(self):
+        self.running = True
+        self.peak = process_rss(os.getpid())
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, process_rss(os.getpid()))
+
+
+
+
+def count_rows(db_ref_suffix, samples_ids, annotations_tables):
+    """
+        Return the number of rows of the tables written by the import (samples tables are counted for the samples only)
+    """
+    sids = ",".join([str(s) for s in samples_ids]) or "NULL"
+    result = {
+        "variant": Model.execute("SELECT count(*) FROM variant{}".format(db_ref_suffix)).first()[0],
+        "variant_count": Model.execute("SELECT count(*) FROM variant_count{}".format(db_ref_suffix)).first()[0],
+        "sample_variant": Model.execute("SELECT count(*) FROM sample_variant{} WHERE sample_id IN ({})".format(db_ref_suffix, sids)).first()[0],
+        "sample_coverage": Model.execute("SELECT count(*) FROM sample_coverage{} WHERE sample_id IN ({})".format(db_ref_suffix, sids)).first()[0]
+    }
+    for table in annotations_tables:
+        result[table] = Model.execute("SELECT count(*) FROM {}".format(table)).first()[0]
+    return result
+
+
+def run_stage(stage, func, *args, stages=None):
+    """
+        Run the stage, return its result and its stats (duration, peak RSS, peak RSS of the pipeline stages if stages, see RssMonitor)
+    """
+    start = time.time()
+    with RssMonitor(stages=stages) as monitor:
+        result = func(*args)
+    duration = time.time() - start
+    log("Benchmark : stage {} done in {:.2f}s (peak RSS {:.0f} MB)".format(stage, duration, monitor.peak / 1048576))
+    stats = {"duration": round(duration, 3), "peak_rss_mb": round(monitor.peak / 1048576, 1)}
+    if stages:
+        stats["pipeline_peak_rss_mb"] = {name: round(rss / 1048576, 1) for name, rss in monitor.stages_peak.items()}
+    return result, stats
+
+
+def bench_import(filepath, reference_id, db_ref_suffix, import_mode, records):
+    """
+        Import the vcf with import_data and return the stats of the import
+    """
+    file = Model.File.new()
+    file.name = "bench_import_suite"
+    file.path = filepath
+    file.save()
+    importer = VcfManager()
+    samples_ids = []
+    try:
+        loop = asyncio.get_event_loop()
+        result, prepare = run_stage("prepare", lambda: loop.run_until_complete(importer.import_data(file.id, reference_id=reference_id, import_mode=import_mode)))
+        samples_ids = [s["id"] for s in result["samples"].values()]
+        # the job is run by the benchmark, not by the import workers
+        Model.execute("DELETE FROM import_queue WHERE file_id={}".format(file.id))
+        annotations_tables = [a.table_name for a in prepare_vcf_parsing(reference_id, filepath)["annotations"].values() if a]
+
+        before = count_rows(db_ref_suffix, samples_ids, annotations_tables)
+        pipeline, stats = run_stage("import", importer.import_queued, file.id, reference_id, import_mode, stages=lambda: importer.pipeline.stages if importer.pipeline else None)
+        after = count_rows(db_ref_suffix, samples_ids, annotations_tables)
+    finally:
+        for sid in samples_ids:
+            Model.Sample.delete(sid)
+        Model.Session().commit()
+        Model.File.delete(file.id)
+
+    stats["records_per_s"] = round(records / stats["duration"], 1) if stats["duration"] > 0 else None
+    # counters of the pipeline stages (parse, encode, write) returned by the import, with their peak RSS
+    peaks = stats.pop("pipeline_peak_rss_mb")
+    for name in pipeline:
+        pipeline[name]["peak_rss_mb"] = peaks.get(name)
+    return {
+        "stages": {"prepare": prepare, "import": stats},
+        "pipeline": pipeline,
+        "rows": {table: after[table] - before[table] for table in after}
+    }
+
+
+def compare(results, previous):
+    """
+        Print the ratio of the import throughput of the results with the ones of the previous results
+    """
+    previous = {s["key"]: s for s in previous["scenarios"]}
+    print("Comparison with the previous results (import records/s, current / previous) :")
+    for scenario in results["scenarios"]:
+        old = previous.get(scenario["key"])
+        if old is None: continue
+        current = scenario["stages"]["import"]["records_per_s"]
+        old = old["stages"]["import"]["records_per_s"]
+        print(" - {:<60} : {:>10} / {:>10}  x{:.2f}".format(scenario["key"], current, old, current / old if old else 0))
+
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Vcf import benchmark suite")
+    parser.add_argument("--reference", type=int, required=True, help="id of the reference used for the imports")
+    parser.add_argument("--records", type=int, nargs='+', default=[10000], help="number of records of the vcf")
+    parser.add_argument("--samples", type=int, nargs='+', default=[1, 10], help="number of samples of the vcf")
+    parser.add_argument("--multiallelic", type=float, nargs='+', default=[0.1], help="rate of multiallelic records")
+    parser.add_argument("--vep", type=int, nargs='+', default=[0, 5], help="number of VEP transcripts by allele")
+    parser.add_argument("--snpeff", type=int, nargs='+', default=[0], help="number of SnpEff transcripts by allele")
+    parser.add_argument("--modes", type=str, nargs='+', default=list(VCF_IMPORT_WRITERS.keys()), help="import modes")
+    parser.add_argument("--output", type=str, default="bench_import_suite.json", help="json file of the results")
+    parser.add_argument("--compare", type=str, help="json file of previous results")
+    args = parser.parse_args()
+
+    db_ref_suffix = "_" + Model.execute("SELECT table_suffix FROM reference WHERE id={}".format(args.reference)).first().table_suffix
+    directory = tempfile.mkdtemp()
+    results = {
+        "version": REGOVAR_CORE_VERSION,
+        "date": datetime.datetime.now().isoformat(),
+        "config": {k: v for k, v in globals().items() if k.startswith("VCF_IMPORT_")},
+        "scenarios": []
+    }
+    for records, samples, multiallelic, vep, snpeff in itertools.product(args.records, args.samples, args.multiallelic, args.vep, args.snpeff):
+        params = {"records": records, "samples": samples, "multiallelic_rate": multiallelic, "vep_transcripts": vep, "snpeff_transcripts": snpeff}
+        filepath = os.path.join(directory, "bench_{}_{}_{}_{}_{}.vcf".format(records, samples, multiallelic, vep, snpeff))
+        generate_vcf(filepath, **params)
+        for mode in args.modes:
+            key = "{} records, {} samples, {} multi, {} vep, {} snpeff, {}".format(records, samples, multiallelic, vep, snpeff, mode)
+            log("Benchmark : {}".format(key))
+            scenario = {"key": key, "params": params, "mode": mode}
+            scenario.update(bench_import(filepath, args.reference, db_ref_suffix, mode, records))
+            results["scenarios"].append(scenario)
+            print(" - {:<60} : {:>10} records/s  {:>8} MB".format(key, scenario["stages"]["import"]["records_per_s"], scenario["stages"]["import"]["peak_rss_mb"]))
+            for name, stage in sorted(scenario["pipeline"].items()):
+                print("     {:<10} : {:>10} records/s  {:>8} MB  (busy {}s, waiting {}s)".format(name, stage["records_per_s"], stage["peak_rss_mb"], stage["busy"], stage["waiting"]))
+        os.remove(filepath)
+    os.rmdir(directory)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+    print("Results saved in {}".format(args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,71 @@
+#!python
+# coding: utf-8
+
+"""
+    Micro-benchmark of the normalisation of the variants : scalar functions (normalise, is_transition, getMaxUcscBin)
+    called for each allele versus the vectorized ones of vcf_import_normalise. Both results are checked to be the same.
+    Alleles are generated as the ones of vcf_generator (the database is not used). Run from the regovar directory :
+
+        python -m tests.benchmarks.bench_normalise [variants] [repeat]
+"""
+
+import sys
+import time
+import random
+
+from core.managers.imports.vcf_import_normalise import normalise, is_transition, getMaxUcscBin, normalise_variants, transitions, ucsc_bins, allele_lengths
+from tests.benchmarks.vcf_generator import random_alleles
+
+
+
+
+def generate_variants(count):
+    """
+        Return the lists of positions (1-based), refs and alts of count variants (10% of multiallelic records)
+    """
+    pos = []
+    ref = []
+    alt = []
+    while len(pos) < count:
+        r, alts = random_alleles(random.choice([2, 3]) if random.random() < 0.1 else 1)
+        p = random.randint(1, 249000000)
+        for a in alts:
+            pos.append(p)
+            ref.append(r)
+            alt.append(a)
+    return pos[0:count], ref[0:count], alt[0:count]
+
+
+def bench_scalar(pos, ref, alt):
+    result = []
+    for p, r, a in zip(pos, ref, alt):
+        p, r, a = normalise(p, r, a)
+        result.append((p, r, a, is_transition(r, a), getMaxUcscBin(p, p + len(r))))
+    return result
+
+
+def bench_vectorized(pos, ref, alt):
+    pos, ref, alt = normalise_variants(pos, ref, alt)
+    return list(zip(pos.tolist(), ref, alt, transitions(ref, alt).tolist(), ucsc_bins(pos, pos + allele_lengths(ref)).tolist()))
+
+
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    random.seed(0)
+    pos, ref, alt = generate_variants(count)
+    print("Variants normalisation benchmark ({} variants ; {} run(s))".format(count, repeat))
+    results = {}
+    for name, bench in [("scalar", bench_scalar), ("vectorized", bench_vectorized)]:
+        durations = []
+        for run in range(repeat):
+            start = time.time()
+            results[name] = bench(pos, ref, alt)
+            durations.append(time.time() - start)
+        print(" - {:<10} : min {:.3f}s  ({:.0f} variants/s)".format(name, min(durations), count / min(durations)))
+    if results["scalar"] != results["vectorized"]:
+        print("ERROR : results of the vectorized normalisation are not the same as the scalar ones")
+        sys.exit(1)
@@ -0,0 +1,88 @@
+#!python
+# coding: utf-8
+
+"""
+    Benchmark of the vcf import modes ("insert" and "copy").
+    Need a Regovar database (see config.py). Run from the regovar directory :
+
+        python -m tests.benchmarks.bench_vcf_import <vcf_path> <reference_id> [repeat]
+
+    For each mode, the vcf is imported with new samples, then samples and their variants associations are deleted.
+    As the variant table is shared, the first run also pays the creation of the variants; so the first run
+    is a warmup and is not counted when repeat > 1.
+"""
+
+import sys
+import datetime
+import reprlib
+
+from config import *
+import core.model as Model
+from core.framework.common import *
+from core.managers.imports.vcf_manager import VcfManager, VCF_IMPORT_WRITERS, prepare_vcf_parsing, open_vcf
+
+
+
+
+def import_vcf(file_id, filepath, reference_id, db_ref_suffix, import_mode):
+    """
+        Import the vcf file with the provided mode, return the duration and the list of created samples ids
+    """
+    vcf_metadata = prepare_vcf_parsing(reference_id, filepath)
+    vcf_reader = open_vcf(vcf_metadata)
+    samples = {}
+    for i in vcf_reader.header.samples:
+        sample = Model.Sample.new()
+        sample.name = "bench_{}_{}".format(import_mode, i)
+        sample.file_id = file_id
+        sample.reference_id = reference_id
+        sample.status = "loading"
+        sample.save()
+        Model.Sample.create_partitions(sample.id, reference_id)
+        samples.update({i : sample.to_json()})
+
+    start = datetime.datetime.now()
+    VcfManager().import_delegate(file_id, vcf_reader, reference_id, db_ref_suffix, vcf_metadata, samples, import_mode)
+    duration = datetime.datetime.now() - start
+    return duration.total_seconds(), [samples[s]["id"] for s in samples]
+
+
+def clean_samples(samples_ids):
+    # samples data are dropped with the partitions of the samples
+    for sid in samples_ids:
+        Model.Sample.delete(sid)
+    Model.Session().commit()
+
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    filepath = sys.argv[1]
+    reference_id = int(sys.argv[2])
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    db_ref_suffix= "_" + Model.execute("SELECT table_suffix FROM reference WHERE id={}".format(reference_id)).first().table_suffix
+
+    file = Model.File.new()
+    file.name = "bench_vcf_import"
+    file.path = filepath
+    file.save()
+
+    results = {mode: [] for mode in VCF_IMPORT_WRITERS.keys()}
+    try:
+        for run in range(repeat):
+            for mode in VCF_IMPORT_WRITERS.keys():
+                duration, samples_ids = import_vcf(file.id, filepath, reference_id, db_ref_suffix, mode)
+                clean_samples(samples_ids)
+                log("Run {} - {} : {}s".format(run, mode, duration))
+                if run > 0 or repeat == 1:
+                    results[mode].append(duration)
+    finally:
+        Model.File.delete(file.id)
+
+    print("Vcf import benchmark ({} ; {} run(s))".format(filepath, repeat))
+    for mode in results:
+        print(" - {:<7} : avg {:.2f}s  min {:.2f}s  ({})".format(mode, sum(results[mode]) / len(results[mode]), min(results[mode]), reprlib.repr(results[mode])))
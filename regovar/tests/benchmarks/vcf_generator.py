@@ -0,0 +1,120 @@
+#!python
+# coding: utf-8
+
+"""
+    Generator of synthetic vcf files for the import benchmarks. Can be used alone (the database is not used) :
+
+        python -m tests.benchmarks.vcf_generator <vcf_path> [records] [samples] [multiallelic_rate] [vep_transcripts] [snpeff_transcripts]
+"""
+
+import sys
+import random
+
+from tests.benchmarks.bench_annotations_parser import VEP_COLUMNS, random_value
+
+
+
+
+# Columns of the ANN field of SnpEff
+SNPEFF_COLUMNS = ["Allele", "Annotation", "Annotation_Impact", "Gene_Name", "Gene_ID", "Feature_Type", "Feature_ID", "Transcript_BioType", "Rank", "HGVS.c", "HGVS.p", "cDNA.pos / cDNA.length", "CDS.pos / CDS.length", "AA.pos / AA.length", "Distance", "ERRORS / WARNINGS / INFO"]
+CHROMOSOMES = ["chr{}".format(c) for c in list(range(1, 23)) + ["X", "Y"]]
+GENOTYPES = ["0/0", "0/1", "1/1", "./."]
+GENOTYPES_MULTI = ["0/1", "0/2", "1/2", "2/2", "1/1", "0/0"]
+
+
+
+def random_snpeff_value(col_name, allele):
+    if col_name == "Allele":
+        return allele
+    if col_name == "Feature_ID":
+        return "NM_{:06d}.1".format(random.randint(0, 99999))
+    if col_name == "Annotation_Impact":
+        return random.choice(["HIGH", "MODERATE", "LOW", "MODIFIER"])
+    if col_name == "Annotation":
+        return random.choice(["missense_variant", "synonymous_variant", "intron_variant", "splice_region_variant&intron_variant"])
+    if col_name == "Distance":
+        return random.choice(["", str(random.randint(0, 5000))])
+    return random.choice(["", "{}_{}".format(col_name.split(' ')[0], random.randint(0, 1000))])
+
+
+def random_alleles(count):
+    """
+        Return a random ref and count alt alleles : SNVs, insertions and deletions (10% of the refs are 2 to 6 bases long to allow deletions)
+    """
+    ref = "".join(random.choice("ACGT") for i in range(random.randint(2, 6) if random.random() < 0.1 else 1))
+    result = []
+    while len(result) < count:
+        kind = random.random()
+        if kind < 0.8:
+            alt = random.choice([b for b in "ACGT" if b != ref[0]]) + ref[1:]
+        elif kind < 0.9 or len(ref) == 1:
+            alt = ref + "".join(random.choice("ACGT") for i in range(random.randint(1, 5)))
+        else:
+            alt = ref[0:random.randint(1, len(ref) - 1)]
+        if alt not in result:
+            result.append(alt)
+    return ref, result
+
+
+def generate_vcf(path, records=10000, samples=10, multiallelic_rate=0.1, vep_transcripts=0, snpeff_transcripts=0, seed=0):
+    """
+        Write a synthetic vcf :
+         - records sorted on all chromosomes, with multiallelic_rate of records with 2 or 3 alt alleles
+         - samples genotypes (GT:DP:AD:GQ), random but consistent with the alleles of the record
+         - VEP (CSQ) and/or SnpEff (ANN) annotations with the provided number of transcripts by alt allele
+        Return the number of alt alleles (variants) written
+    """
+    random.seed(seed)
+    variants = 0
+    with open(path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        for c in CHROMOSOMES:
+            f.write("##contig=<ID={},length=250000000>\n".format(c))
+        f.write("##FILTER=<ID=PASS,Description=\"All filters passed\">\n##FILTER=<ID=LowQual,Description=\"Low quality\">\n")
+        f.write("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n")
+        f.write("##FORMAT=<ID=DP,Number=1,Type=Integer,Description=\"Read depth\">\n")
+        f.write("##FORMAT=<ID=AD,Number=R,Type=Integer,Description=\"Allelic depths\">\n")
+        f.write("##FORMAT=<ID=GQ,Number=1,Type=Integer,Description=\"Genotype quality\">\n")
+        if vep_transcripts > 0:
+            f.write("##VEP=\"v90\"\n")
+            f.write("##INFO=<ID=CSQ,Number=.,Type=String,Description=\"Consequence annotations from Ensembl VEP. Format: {}\">\n".format("|".join(VEP_COLUMNS)))
+        if snpeff_transcripts > 0:
+            f.write("##SnpEffVersion=\"4.3t (build 2017-11-24 10:18)\"\n")
+            f.write("##INFO=<ID=ANN,Number=.,Type=String,Description=\"Functional annotations: '{}'\">\n".format(" | ".join(SNPEFF_COLUMNS)))
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\n".format("\t".join(["S{}".format(i) for i in range(samples)])))
+
+        by_chrom = max(1, records // len(CHROMOSOMES))
+        for i in range(records):
+            chrom = CHROMOSOMES[min(i // by_chrom, len(CHROMOSOMES) - 1)]
+            pos = 10000 + (i % by_chrom) * 100
+            ref, alts = random_alleles(random.choice([2, 3]) if random.random() < multiallelic_rate else 1)
+            variants += len(alts)
+
+            infos = []
+            if vep_transcripts > 0:
+                infos.append("CSQ=" + ",".join(["|".join([random_value(c, alt) for c in VEP_COLUMNS]) for alt in alts for t in range(vep_transcripts)]))
+            if snpeff_transcripts > 0:
+                infos.append("ANN=" + ",".join(["|".join([random_snpeff_value(c, alt) for c in SNPEFF_COLUMNS]) for alt in alts for t in range(snpeff_transcripts)]))
+
+            genotypes = []
+            for s in range(samples):
+                gt = random.choice(GENOTYPES_MULTI if len(alts) > 1 else GENOTYPES)
+                dp = random.randint(5, 200)
+                ad = [random.randint(0, dp) for a in range(len(alts) + 1)]
+                genotypes.append("{}:{}:{}:{}".format(gt, dp, ",".join(map(str, ad)), random.randint(1, 99)))
+            f.write("{}\t{}\t.\t{}\t{}\t{:.1f}\t{}\t{}\tGT:DP:AD:GQ\t{}\n".format(
+                chrom, pos, ref, ",".join(alts), random.uniform(10, 1000), random.choice(["PASS", "PASS", "LowQual"]), ";".join(infos) or ".", "\t".join(genotypes)))
+    return variants
+
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    names = ["records", "samples", "multiallelic_rate", "vep_transcripts", "snpeff_transcripts"]
+    types = [int, int, float, int, int]
+    args = {name: cast(value) for name, cast, value in zip(names, types, sys.argv[2:])}
+    variants = generate_vcf(sys.argv[1], **args)
+    print("{} written ({} variants)".format(sys.argv[1], variants))
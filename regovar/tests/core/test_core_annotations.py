@@ -0,0 +1,105 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+
+from core.managers.imports.vcf_import_annotations import *
+from core.managers.imports.vcf_import_vep import VepImporter
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST PARAMETER / CONSTANTS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+COLUMNS = ["allele", "consequence", "feature", "sift", "gnomad_maf", "distance", "impact", "unknown"]
+MAPPING = {
+    "allele": {"type": "string"},
+    "consequence": {"type": "list"},
+    "feature": {"type": "string"},
+    "sift": False,
+    "gnomad_maf": {"type": "float"},
+    "distance": {"type": "int"},
+    "impact": {"type": "string"},
+    "unknown": False
+}
+
+# CSQ annotations of each record
+RECORDS = [
+    ["G|missense_variant&splice_region_variant|NM_001|deleterious(0.01)|G:0.25|12|MODERATE|x",
+     "G|intron_variant|NM_002||A:0.1||MODIFIER|"],
+    [],
+    ["-|frameshift_variant|NM_003|tolerated(0.3)||abc|HIGH|y",
+     "T|stop_gained|NM_004|-|T:0.02&T:0.3|-|HIGH"],
+]
+
+
+def vep_importer():
+    importer = VepImporter()
+    importer.name = "VEP"
+    importer.vcf_flag = "CSQ"
+    importer.columns = COLUMNS
+    importer.columns_mapping = MAPPING
+    return importer
+
+
+def scalar_text(value):
+    """ Postgresql text of the python values returned by the scalar parse_annotations """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return pg_array_text(value)
+    return str(value)
+
+
+
+
+class TestCoreAnnotations(unittest.TestCase):
+    """ CORE Unit Tests : columnar parsing of transcripts annotations """
+
+    def test_info_values(self):
+        """ info_values """
+        self.assertEqual(info_values("AC=1;CSQ=a|b,c|d;DP=3", "CSQ"), ["a|b", "c|d"])
+        self.assertEqual(info_values("XCSQ=x;CSQ=a", "CSQ"), ["a"])
+        self.assertEqual(info_values("CSQ=a", "CSQ"), ["a"])
+        self.assertEqual(info_values("XCSQ=x", "CSQ"), [])
+        self.assertEqual(info_values(".", "CSQ"), [])
+
+
+    def test_converters(self):
+        """ columns converters """
+        self.assertEqual(string_column(["a", "", " - "]), [["a", None, None]])
+        self.assertEqual(bool_column(["1", ""]), [["t", None]])
+        self.assertEqual(list_column(["a&b", "-", 'c"d']), [['{"a","b"}', None, '{"c\\"d"}']])
+        self.assertEqual(int_column(["1", "x", " 3 "]), [["1", None, "3"]])
+        self.assertEqual(float_column(["0.5", "1e-3", "-"]), [["0.5", "1e-3", None]])
+
+
+    def test_parse_vs_scalar(self):
+        """ AnnotationColumnsParser vs VepImporter.parse_annotations """
+        importer = vep_importer()
+        parser = importer.get_columns_parser()
+        self.assertEqual(parser.fields, ["allele", "consequence", "feature", "sift_pred", "sift_score", "gnomad_maf", "distance", "impact"])
+
+        infos = [("AC=1;CSQ=" + ",".join(csq) if len(csq) > 0 else "AC=1") for csq in RECORDS]
+        parsed = parser.parse(infos)
+        self.assertEqual(len(parsed), len(RECORDS))
+        for csq, record in zip(RECORDS, parsed):
+            self.assertEqual(sum([len(t) for t in record.values()]), len(csq))
+            for annotation in csq:
+                allele = annotation.split('|')[0].strip('-')
+                scalar = importer.parse_annotations(allele, {"CSQ": (annotation,)})
+                self.assertEqual(len(scalar), 1)
+                s_allele, s_trx_pk, s_fields, s_values = scalar[0]
+                expected = {f: scalar_text(v) for f, v in zip(s_fields, s_values)}
+
+                trx_pk, values, copy_values = [t for t in record[allele] if t[0] == s_trx_pk][0]
+                self.assertEqual(s_allele, allele)
+                for field, value in zip(parser.fields, values):
+                    if field in ["sift_score", "gnomad_maf"] and value is not None:
+                        self.assertEqual(float(value), s_values[s_fields.index(field)], field)
+                    else:
+                        self.assertEqual(value, expected.get(field), field)
+                self.assertEqual(copy_values, "\t".join([v if v is not None else "\\N" for v in values]))
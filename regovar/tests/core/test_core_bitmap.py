@@ -0,0 +1,43 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+
+from core.framework.bitmap import *
+
+
+
+
+class TestCoreBitmap(unittest.TestCase):
+    """ CORE Unit Tests : compressed bitmaps of samples ids """
+
+    def test_encode_decode(self):
+        """ encode/decode """
+        # array containers, several containers, bitmap container (more than 4096 values in the container)
+        for values in [[], [5], [3, 1, 2, 2], [1, 2, 70000, 70001], list(range(0, 20000, 3))]:
+            data = bitmap_encode(values)
+            self.assertEqual(bitmap_decode(data).tolist(), sorted(set(values)))
+            self.assertEqual(bitmap_count(data), len(set(values)))
+        self.assertEqual(bitmap_encode([]), b"\x00\x00")
+        self.assertEqual(bitmap_encode([1, 2]), b"\x00\x01\x00\x00\x00\x01\x00\x01\x00\x02")
+        self.assertEqual(len(bitmap_encode(range(0, 20000, 3))), 2 + 4 + BITMAP_CONTAINER_SIZE)
+
+
+    def test_contains(self):
+        """ contains """
+        for values in [[1, 2, 70000], list(range(0, 20000, 3))]:
+            data = bitmap_encode(values)
+            for v in values:
+                self.assertTrue(bitmap_contains(data, v))
+            self.assertFalse(bitmap_contains(data, 4))
+            self.assertFalse(bitmap_contains(data, 200000))
+
+
+    def test_and_or(self):
+        """ and/or """
+        a = bitmap_encode(range(0, 10000, 2))
+        b = bitmap_encode(range(0, 10000, 3))
+        self.assertEqual(bitmap_decode(bitmap_and(a, b)).tolist(), list(range(0, 10000, 6)))
+        self.assertEqual(bitmap_decode(bitmap_or(a, b)).tolist(), sorted(set(range(0, 10000, 2)) | set(range(0, 10000, 3))))
+        self.assertEqual(bitmap_sql([1, 2]), "'\\x00010000000100010002'::bytea")
@@ -0,0 +1,32 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+import hashlib
+import numpy as np
+
+from core.framework.bloom import *
+
+
+
+
+class TestCoreBloom(unittest.TestCase):
+    """ CORE Unit Tests : bloom filters of hashes """
+
+    def test_contains(self):
+        """ contains """
+        hashes = [key_hash("1-{}-A-G".format(pos)) for pos in range(10000)]
+        bloom = BloomFilter(len(hashes), 0.01)
+        # hashes returned by postgresql are signed bigint
+        bloom.add(np.array(hashes, dtype=np.uint64).view(np.int64))
+        for h in hashes:
+            self.assertTrue(h in bloom)
+        errors = sum([key_hash("2-{}-A-G".format(pos)) in bloom for pos in range(10000)])
+        self.assertLess(errors, 300)
+
+
+    def test_key_hash(self):
+        """ key hash """
+        # first 64 bits of the md5, as KEY_HASH_SQL
+        self.assertEqual(key_hash("1-100-A-G"), int(hashlib.md5(b"1-100-A-G").hexdigest()[0:16], 16))
@@ -0,0 +1,88 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+import numpy as np
+
+from core.managers.imports.vcf_import_normalise import *
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST PARAMETER / CONSTANTS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# pos (1-based), ref, alt
+VARIANTS = [
+    (100, "A", "G"),
+    (100, "A", "A"),
+    (100, "AC", "AC"),
+    (100, "ACGT", "A"),
+    (100, "A", "ACGT"),
+    (100, "ACGT", "AGGT"),
+    (100, "ACGT", "TCGA"),
+    (100, "CAGAG", "CAG"),
+    (100, "TTTT", "TTTA"),
+    (100, "ATTT", "GTTT"),
+    (100, "AC", "TG"),
+    (100, "", "T"),
+    (100, None, "T"),
+    (100, "A", None),
+    (100, "A", "*"),
+    (131072, "A" * 80, "A" * 79 + "G"),
+    (131072, "G" + "A" * 80, "G"),
+]
+
+
+class FakeRecord():
+    """ Minimal pysam record : only what normalise_records uses """
+    def __init__(self, pos, ref, alts):
+        self.pos = pos
+        self.ref = ref
+        self.alleles = (ref,) + tuple(alts)
+
+
+
+
+class TestCoreNormalise(unittest.TestCase):
+    """ CORE Unit Tests : vectorized normalisation and bins of variants """
+
+    def test_normalise_variants(self):
+        """ normalise_variants vs normalise """
+        pos, ref, alt = normalise_variants([v[0] for v in VARIANTS], [v[1] for v in VARIANTS], [v[2] for v in VARIANTS])
+        self.assertEqual(len(ref), len(VARIANTS))
+        for i, v in enumerate(VARIANTS):
+            self.assertEqual((pos[i], ref[i], alt[i]), normalise(*v), v)
+        pos, ref, alt = normalise_variants([], [], [])
+        self.assertEqual((len(pos), ref, alt), (0, [], []))
+
+
+    def test_transitions(self):
+        """ transitions vs is_transition """
+        ref = ["A", "G", "C", "T", "A", "AG", ""]
+        alt = ["G", "A", "T", "C", "T", "GA", "G"]
+        self.assertEqual(transitions(ref, alt).tolist(), [is_transition(r, a) for r, a in zip(ref, alt)])
+
+
+    def test_ucsc_bins(self):
+        """ ucsc_bins vs getMaxUcscBin """
+        ranges = [(0, 1), (100, 101), (131071, 131072), (131071, 131073), (131072, 131072), (100, 100),
+            (1000000, 1200000), (8388607, 8388700), (67108863, 67108866), (5, 70000000), (0, 536870912)]
+        bins = ucsc_bins([r[0] for r in ranges], [r[1] for r in ranges])
+        for i, r in enumerate(ranges):
+            self.assertEqual(bins[i], getMaxUcscBin(*r), r)
+
+
+    def test_normalise_records(self):
+        """ normalise_records """
+        records = [FakeRecord(100, "ACGT", ["A", "AGGT"]), FakeRecord(200000, "C", ["T"])]
+        result = normalise_records(records)
+        self.assertEqual(len(result), 2)
+        for record, alleles in zip(records, result):
+            self.assertEqual(len(alleles), len(record.alleles))
+            for allele, (pos, ref, alt, transition, bin) in zip(record.alleles, alleles):
+                self.assertEqual((pos, ref, alt), normalise(record.pos, record.ref, allele))
+                self.assertEqual(transition, is_transition(ref, alt))
+                self.assertEqual(bin, getMaxUcscBin(pos, pos + len(ref)))
@@ -0,0 +1,128 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+import numpy as np
+
+from core.managers.imports.vcf_manager import normalize_gt
+from core.managers.imports.vcf_import_kernel import *
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST PARAMETER / CONSTANTS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# vcf GT string, GT as decoded by pysam (scalar baseline)
+GENOTYPES = [
+    ("0/0", (0, 0)),
+    ("0/1", (0, 1)),
+    ("1|0", (1, 0)),
+    ("1/1", (1, 1)),
+    ("1/2", (1, 2)),
+    ("./.", (None, None)),
+    ("./1", (None, 1)),
+    ("0/.", (0, None)),
+    ("0", (0,)),
+    ("1", (1,)),
+    (".", (None,)),
+    ("0/12", (0, 12)),
+    ("12/12", (12, 12)),
+    ("10|11", (10, 11)),
+]
+
+
+class FakeRecord():
+    """ Minimal pysam record : only what decode_records uses """
+    def __init__(self, line, alleles):
+        self.line = line
+        self.alleles = alleles
+
+    def __str__(self):
+        return self.line + "\n"
+
+
+def vcf_line(fmt, samples, alleles=("A", "G")):
+    return FakeRecord("\t".join(["chr1", "100", ".", alleles[0], ",".join(alleles[1:]), "50", "PASS", ".", fmt] + samples), alleles)
+
+
+def scalar_depth_alt(sp, allele_idx, gt):
+    """ Depth of the allele as computed sample by sample before the numpy kernel """
+    if "AD" in sp:
+        return sp["AD"][allele_idx]
+    if "DP4" in sp:
+        if gt == 0:
+            return sum(sp["DP4"])
+        return sp["DP4"][2] + sp["DP4"][3] if allele_idx > 0 else sp["DP4"][0] + sp["DP4"][1]
+    return None
+
+
+
+
+class TestCoreVcfKernel(unittest.TestCase):
+    """ CORE Unit Tests : numpy decoding of vcf samples data """
+
+    def test_decode_gt(self):
+        """ decode_gt """
+        gt = decode_gt([g[0] for g in GENOTYPES])
+        for i, (value, alleles) in enumerate(GENOTYPES):
+            expected = [GT_MISSING if a is None else a for a in alleles]
+            if len(expected) == 1:
+                expected.append(GT_HAPLOID)
+            self.assertEqual(gt[i].tolist(), expected, value)
+        self.assertEqual(decode_gt([""]).tolist(), [[GT_NONE, GT_NONE]])
+
+
+    def test_genotype_codes(self):
+        """ genotype_codes vs normalize_gt """
+        codes = genotype_codes(decode_gt([g[0] for g in GENOTYPES]))
+        for i, (value, alleles) in enumerate(GENOTYPES):
+            self.assertEqual(codes[i], int(normalize_gt({"GT": alleles})), value)
+        # Sample without GT
+        self.assertEqual(genotype_codes(decode_gt([""])).tolist(), [normalize_gt({"GT": None})])
+        block = decode_records([vcf_line("DP", ["10", "12"])])
+        self.assertEqual(genotype_codes(block["gt"]).tolist(), [[normalize_gt({"GT": None}), normalize_gt({"GT": None})]])
+
+
+    def test_called_samples(self):
+        """ called_samples : no-calls and samples without GT are not called """
+        called = called_samples(decode_gt([g[0] for g in GENOTYPES] + [""]))
+        self.assertEqual(called.tolist(), [any([a is not None for a in g[1]]) for g in GENOTYPES] + [False])
+
+
+    def test_decode_numbers(self):
+        """ decode_numbers """
+        result = decode_numbers(["1,2", ".", "3,.", "4,5"], 2)
+        self.assertEqual(result.shape, (4, 2))
+        self.assertEqual(result[0].tolist(), [1, 2])
+        self.assertTrue(np.isnan(result[1]).all())
+        self.assertEqual(result[2, 0], 3)
+        self.assertTrue(np.isnan(result[2, 1]))
+        self.assertEqual(decode_numbers(["12", "."], 1)[0, 0], 12)
+        self.assertTrue(np.isnan(decode_numbers(["1,2,3"], 2)).all())
+
+
+    def test_depth_alt(self):
+        """ depth_alt vs scalar depth with AD and DP4 """
+        alleles = ("A", "G", "T")
+        # AD
+        samples = [("0/0", [20, 0, 0]), ("0/1", [10, 8, 0]), ("1/2", [0, 5, 7]), ("2", [0, 0, 9])]
+        block = decode_records([vcf_line("GT:AD", ["{}:{}".format(g, ",".join(map(str, ad))) for g, ad in samples], alleles)])
+        codes = genotype_codes(block["gt"])
+        for allele_idx in range(len(alleles)):
+            result = depth_alt(block, 0, allele_idx, codes[0])
+            for s, (g, ad) in enumerate(samples):
+                self.assertEqual(result[s], scalar_depth_alt({"AD": ad}, allele_idx, codes[0, s]), (g, allele_idx))
+        # DP4, ref allele included (ref pseudo-variants)
+        samples = [("0/0", [10, 12, 0, 1]), ("0/1", [4, 5, 6, 7]), ("1/1", [0, 1, 9, 8]), ("1", [0, 0, 3, 2])]
+        block = decode_records([vcf_line("GT:DP4", ["{}:{}".format(g, ",".join(map(str, dp4))) for g, dp4 in samples])])
+        codes = genotype_codes(block["gt"])
+        for allele_idx in range(2):
+            result = depth_alt(block, 0, allele_idx, codes[0])
+            for s, (g, dp4) in enumerate(samples):
+                self.assertEqual(result[s], scalar_depth_alt({"DP4": dp4}, allele_idx, codes[0, s]), (g, allele_idx))
+        # Neither AD nor DP4
+        block = decode_records([vcf_line("GT:DP", ["0/1:10"])])
+        self.assertTrue(np.isnan(depth_alt(block, 0, 1, genotype_codes(block["gt"])[0])).all())
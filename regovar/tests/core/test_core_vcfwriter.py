@@ -0,0 +1,87 @@
+#!python
+# coding: utf-8
+
+
+import re
+import unittest
+import numpy as np
+
+from core.managers.imports.vcf_import_writer import *
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST PARAMETER / CONSTANTS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+class FakeCursor():
+    """ Cursor that keeps the data of the COPY and the executed queries instead of sending them to the database """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def copy_expert(self, sql, buffer):
+        table = re.match(r"COPY (\S+) ", sql).group(1)
+        self.connection.copies[table] = buffer.read()
+
+    def execute(self, query):
+        self.connection.queries.append(query)
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+    """ Connection of the writer (set instead of the one opened by connect) """
+    def __init__(self):
+        self.copies = {}
+        self.queries = []
+        self.committed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+
+
+class TestCoreVcfWriter(unittest.TestCase):
+    """ CORE Unit Tests : write of the prepared batches by the COPY writer """
+
+    def test_copy_write(self):
+        """ write of a prepared batch """
+        writer = VcfCopyWriter("_hg19", {})
+        samples_ids = np.array([1, 2, 3])
+        # sample 3 is called but doesn't have the variant (NULL genotype)
+        gts = np.array([1, 2, np.nan])
+        writer.add_variant(1, 100, "A", "G", True, 585, [1, 2])
+        writer.add_sample_variants(samples_ids, 10, 585, 1, 100, "A", "G", gts, np.array([10., np.nan, 7.]), np.array([5., np.nan, np.nan]), 50.0, 0, np.array([True, True, True]))
+        batch = writer.prepare()
+        self.assertEqual(writer.counts, {})
+
+        writer.connection = FakeConnection()
+        writer.write(batch)
+        copies = writer.connection.copies
+        self.assertTrue(writer.connection.committed)
+        self.assertEqual(sorted(copies.keys()), ["import_sample_variant", "import_variant", "import_variant_count"])
+        self.assertEqual(copies["import_variant_count"], "1\t100\tA\tG\t1\t1\t3\n")
+        self.assertEqual(copies["import_sample_variant"].split("\n")[:-1], [
+            "1\t10\t585\t1\t100\tA\tG\t1\t10\t5\t50.0\t0",
+            "2\t10\t585\t1\t100\tA\tG\t2\t\\N\t\\N\t50.0\t0",
+            "3\t10\t585\t1\t100\tA\tG\t\\N\t7\t\\N\t50.0\t0"])
+        self.assertTrue("INSERT INTO variant_count_hg19" in writer.connection.queries[-1])
+
+
+    def test_copy_write_empty(self):
+        """ write of an empty batch """
+        writer = VcfCopyWriter("_hg19", {})
+        writer.write(writer.prepare())
+        self.assertIsNone(writer.connection)
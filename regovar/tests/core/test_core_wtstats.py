@@ -0,0 +1,114 @@
+#!python
+# coding: utf-8
+
+
+import unittest
+
+from core.model import execute
+from core.managers.wt_stats import *
+
+
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# TEST PARAMETER / CONSTANTS
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+WT = "wt_test_stats"
+SAMPLES = [1, 2]
+FILTERS = ["PASS", "LowQual", "q10"]
+
+# is_variant, ref, alt, s1_gt, s1_filter, s2_gt, s2_filter, consequences
+ROWS = [
+    (True, "A", "G", 1, 1, 2, 2, None),
+    (True, "A", "A", 0, 1, -1, 0, None),
+    (True, "AC", "GT", 2, 2, None, None, None),
+    (True, "", "T", 1, 5, 1, 1, None),
+    (True, "TA", "", -1, 0, 2, 6, None),
+    (True, "TA", "G", 3, 4, 0, 1, None),
+    (False, "A", "G", 1, 1, 2, 2, "{missense_variant,splice_region_variant}"),
+    (False, "A", "G", 1, 1, 2, 2, "{missense_variant,missense_variant}"),
+    (False, "", "T", 1, 5, 1, 1, "{frameshift_variant}"),
+    (False, "TA", "", -1, 0, 2, 6, "{intron_variant,NULL}"),
+    (False, "TA", "G", 0, 4, None, None, "{intron_variant}"),
+]
+
+
+
+
+class TestCoreWtStats(unittest.TestCase):
+    """ CORE Unit Tests : one scan statistics of the working tables """
+
+    @classmethod
+    def setUpClass(self):
+        execute("DROP TABLE IF EXISTS {0}; CREATE TABLE {0} (is_variant boolean, ref text, alt text, s1_gt integer, s1_filter integer, s2_gt integer, s2_filter integer, _1 text[])".format(WT))
+        values = ["({}, '{}', '{}', {}, {}, {}, {}, {})".format(*[("NULL" if v is None else ("'{}'".format(v) if isinstance(v, str) and v.startswith("{") else v)) for v in row]) for row in ROWS]
+        execute("INSERT INTO {} VALUES {}".format(WT, ", ".join(values)))
+
+    @classmethod
+    def tearDownClass(self):
+        execute("DROP TABLE IF EXISTS {}".format(WT))
+
+
+    def count(self, where):
+        return execute("SELECT COUNT(*) FROM {} WHERE {}".format(WT, where)).first()[0]
+
+
+    def expected_stats(self):
+        """
+            Stats computed with one query by counter (former update_wt_samples_stats)
+        """
+        astats = {
+            "total_variant": self.count("is_variant"),
+            "total_transcript": self.count("NOT is_variant"),
+            "variants_classes": {
+                "ref": self.count("is_variant AND ref=alt"),
+                "snv": self.count("is_variant AND ref<>alt AND char_length(ref)=1 AND char_length(alt)=1"),
+                "mnv": self.count("is_variant AND ref<>alt AND char_length(ref)>1 AND char_length(alt)=char_length(ref)"),
+                "insertion": self.count("is_variant AND char_length(ref)=0 AND char_length(alt)>0"),
+                "deletion": self.count("is_variant AND char_length(ref)>0 AND char_length(alt)=0"),
+                "others": self.count("is_variant AND char_length(ref)<>char_length(alt) AND char_length(ref)>0 AND char_length(alt)>0")
+                }
+            }
+        consequences = [f[0] for f in execute("SELECT DISTINCT(UNNEST(_1)) FROM {} WHERE NOT is_variant".format(WT)) if f[0] is not None]
+        astats["vep_consequences"] = {c: self.count("NOT is_variant AND '{}'=ANY(_1)".format(c)) for c in consequences}
+        sstats = {}
+        for sid in SAMPLES:
+            sstats[sid] = {
+                "total_transcript": self.count("s{}_gt>=0 AND NOT is_variant".format(sid)),
+                "sample_total_variant": self.count("s{}_gt>=0 AND is_variant".format(sid)),
+                "filter": {fid: self.count("s{}_gt>=0 AND is_variant AND s{}_filter & {} <> 0".format(sid, sid, 1 << i)) for i, fid in enumerate(FILTERS)},
+                "variants_classes": {
+                    "not": self.count("s{}_gt=-1 AND is_variant".format(sid)),
+                    "ref": self.count("s{}_gt=0 AND is_variant".format(sid)),
+                    "snv": self.count("s{}_gt>0 AND is_variant AND char_length(ref)=1 AND char_length(alt)=1".format(sid)),
+                    "mnv": self.count("s{}_gt>0 AND is_variant AND char_length(ref)>1 AND char_length(alt)=char_length(ref)".format(sid)),
+                    "insertion": self.count("s{}_gt>0 AND is_variant AND char_length(ref)=0 AND char_length(alt)>0".format(sid)),
+                    "deletion": self.count("s{}_gt>0 AND is_variant AND char_length(ref)>0 AND char_length(alt)=0".format(sid)),
+                    "others": self.count("s{}_gt>0 AND is_variant AND char_length(ref)<>char_length(alt) AND char_length(ref)>0 AND char_length(alt)>0".format(sid))
+                    },
+                "vep_consequences": {c: self.count("NOT is_variant AND s{}_gt>0 AND '{}'=ANY(_1)".format(sid, c)) for c in consequences}
+                }
+        return astats, sstats
+
+
+    def test_same_stats(self):
+        """ same stats as the queries by counter """
+        stats = WtStats(WT, "1")
+        stats.add_analysis()
+        for sid in SAMPLES:
+            stats.add_sample(sid, FILTERS)
+        astats, sstats = stats.run()
+        expected = self.expected_stats()
+        self.assertEqual(astats, expected[0])
+        self.assertEqual(sstats, expected[1])
+        self.assertEqual(astats["vep_consequences"]["missense_variant"], 2)
+
+
+    def test_samples_with_import_stats(self):
+        """ only the transcripts counter for the samples with import stats """
+        stats = WtStats(WT)
+        stats.add_sample(1)
+        astats, sstats = stats.run()
+        self.assertEqual(astats, {})
+        self.assertEqual(sstats, {1: {"total_transcript": self.count("s1_gt>=0 AND NOT is_variant")}})
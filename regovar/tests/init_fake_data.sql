@@ -17,7 +17,7 @@ CREATE TABLE variant_hg19
     ref text NOT NULL,
     alt text NOT NULL,
     is_transition boolean,
-    sample_list integer[],
+    sample_bitmap bytea,
     regovar_score smallint,
     regovar_score_meta JSON,
     CONSTRAINT variant_hg19_pkey PRIMARY KEY (id),
@@ -37,7 +37,7 @@ CREATE TABLE sample_variant_hg19
     depth integer,
     depth_alt integer,
     quality real,
-    filter JSON,
+    filter_mask integer,
     infos character varying(255)[][] COLLATE pg_catalog."C",
     mosaic real,
     is_composite boolean DEFAULT False,